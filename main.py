@@ -1,24 +1,35 @@
 import sys
+import bisect
+import gzip
+import hashlib
 import json
 import os
 import re
-import shutil
-from datetime import datetime
+import queue
+import sqlite3
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from datetime import datetime, timedelta
 from glob import glob
 
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QPushButton, QVBoxLayout, QScrollArea,
-    QLabel, QLineEdit, QListWidget, QListWidgetItem,
+    QLabel, QLineEdit, QListWidget, QListWidgetItem, QListView,
     QHBoxLayout, QCheckBox, QTextEdit, QSplitter,
     QStyle, QMenu, QDialog, QFileDialog, QDialogButtonBox,
     QRadioButton, QMessageBox, QSpinBox, QInputDialog, QComboBox,
     QFontComboBox, QButtonGroup, QColorDialog, QTabWidget, QStatusBar,
     QToolButton, QAbstractItemView, QFrame, QPlainTextEdit, QAbstractSpinBox,
-    QTreeWidget, QTreeWidgetItem, QSlider, QStackedWidget, QStyleOption, QGridLayout, QSizePolicy
+    QTreeWidget, QTreeWidgetItem, QSlider, QStackedWidget, QStyleOption, QGridLayout, QSizePolicy,
+    QStyledItemDelegate
 )
 from PyQt6.QtCore import (
     Qt, QPoint, QRectF, QUrl, QPropertyAnimation, QEasingCurve, pyqtSignal, QByteArray,
-    QSize, QTimer, QEvent, QParallelAnimationGroup, QObject
+    QSize, QTimer, QEvent, QParallelAnimationGroup, QObject, QElapsedTimer,
+    QAbstractListModel, QSortFilterProxyModel, QModelIndex
 )
 from PyQt6.QtGui import (
     QAction, QMouseEvent, QPainter, QPixmap, QColor, QFont, QIcon, QTextCursor,
@@ -30,7 +41,40 @@ from PyQt6.QtSvg import QSvgRenderer
 # --- Файлы и константы ---
 SETTINGS_FILE = "settings.json"
 DATA_FILE = "data.json"
+JOURNAL_FILE = "data.journal" # журнал изменений поверх снимка DATA_FILE
+SQLITE_FILE = "data.sqlite3" # хранилище для storage_backend = "sqlite"
 BACKUP_DIR = "backups" # <-- НОВЫЙ КАТАЛОГ ДЛЯ БЭКАПОВ
+BACKUP_OBJECTS_DIR = "objects" # подкаталог BACKUP_DIR с фрагментами по хешу содержимого
+BACKUP_INDEX_FILE = "index.json" # сводка по бэкапам (время, число заметок, размер) для диалога
+HISTORY_DIR = "history" # история версий заметок, по файлу на заметку
+
+JOURNAL_COMPACT_RECORDS = 500
+JOURNAL_COMPACT_BYTES = 4 * 1024 * 1024
+NOTE_BODY_CACHE_SIZE = 256 # сколько текстов заметок держать в памяти (SQLite)
+SAVE_DEBOUNCE_MS = 300 # серия сохранений в пределах этого окна пишется на диск один раз
+STYLESHEET_CACHE_SIZE = 32 # сколько собранных таблиц стилей держать в памяти
+CHECKSUM_FOOTER = "//sha256:" # последняя строка файлов, записанных write_json_atomic
+PREVIOUS_SUFFIX = ".prev" # предыдущее поколение файла, на него откатываемся при повреждении
+HISTORY_MIN_INTERVAL = timedelta(minutes=1) # сохранения чаще этого сливаются в одну версию
+HISTORY_KEEP_RECENT = 10 # столько последних версий не прореживаются
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.ogg', '.flac', '.m4a')
+AUDIO_SCAN_BATCH = 200 # сколько найденных треков сканер папки передает в плейлист за раз
+METADATA_FILE = "audio_metadata.json" # кэш тегов и длительностей треков, рядом с плейлистами
+METADATA_PROBE_WORKERS = 2 # потоки, читающие теги треков
+METADATA_FINGERPRINT_BYTES = 64 * 1024 # сколько байт с начала и конца файла идет в отпечаток
+CROSSFADE_STEP_MS = 50 # шаг изменения громкости при кроссфейде
+CROSSFADE_MAX_SHARE = 0.3 # кроссфейд занимает не больше этой доли длины трека
+PLAYLIST_SAVE_DEBOUNCE_MS = 1500 # правки плейлистов в пределах этого окна пишутся на диск один раз
+PLAYBACK_STATE_FILE = "audio_playback.json" # текущий трек и позиция, чтобы продолжить после перезапуска
+PLAYBACK_CHECKPOINT_MS = 15000 # во время воспроизведения позиция запоминается не чаще этого
+MODEL_REMOVE_RANGES_MAX = 4 # при удалении вразброс большего числа диапазонов модель плейлиста сбрасывается целиком
+# Хранение бэкапов: (возраст, шаг) — в пределах возраста остается по одной копии на шаг,
+# копии старше последнего уровня удаляются (самая свежая копия остается всегда)
+BACKUP_RETENTION = [
+    (timedelta(days=1), timedelta(hours=1)),
+    (timedelta(days=30), timedelta(days=1)),
+    (timedelta(days=365), timedelta(weeks=1)),
+]
 
 DEFAULT_SETTINGS = {
     "language": "ru_RU",
@@ -39,6 +83,8 @@ DEFAULT_SETTINGS = {
     "accent_color": "#00aa88",
     "notes_tree_enabled": True,
     "audio_folder": "",
+    "audio_crossfade_sec": 0, # плавный переход между треками плейлиста (0 — без наложения)
+    "storage_backend": "json", # json | sqlite (смена вступает в силу после перезапуска)
 
     "light_theme_bg": "#f8f9fa",
     "light_theme_text": "#212529",
@@ -74,6 +120,7 @@ DEFAULT_SETTINGS = {
     "editor_padding_right": 10,
 
     "autosave_interval_sec": 10,
+    "note_history_budget_kb": 256, # предел истории версий одной заметки (0 — без ограничения)
     "task_templates": ["Позвонить ...", "Купить ...", "Написать ...", "Сделать ..."],
 }
 
@@ -98,6 +145,1453 @@ def theme_colors(settings: dict):
         is_dark = False
     return is_dark, accent, bg, text, list_text
 
+_stylesheet_cache = OrderedDict()  # (имя, сигнатура) -> собранная таблица стилей, LRU
+
+def cached_stylesheet(name, signature, build):
+    """
+    Возвращает таблицу стилей name для сигнатуры (кортеж значений, от которых она зависит).
+    build() вызывается только для новой сигнатуры.
+    """
+    key = (name, signature)
+    css = _stylesheet_cache.get(key)
+    if css is None:
+        css = build()
+        _stylesheet_cache[key] = css
+        if len(_stylesheet_cache) > STYLESHEET_CACHE_SIZE:
+            _stylesheet_cache.popitem(last=False)
+    else:
+        _stylesheet_cache.move_to_end(key)
+    return css
+
+def apply_stylesheet(widget, css):
+    """Назначает таблицу стилей, только если она изменилась: setStyleSheet заново разбирает ее и перестилизует всех потомков."""
+    if widget.styleSheet() != css:
+        widget.setStyleSheet(css)
+
+def _fsync_dir(directory):
+    # Переименование надежно только после fsync каталога (на Windows каталог не открыть — пропускаем)
+    if os.name == "nt":
+        return
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+def write_json_atomic(path, data, indent=4, keep_previous=True):
+    """
+    Записывает JSON так, чтобы сбой не оставил обрезанный файл: временный файл рядом,
+    fsync, затем os.replace. Последняя строка — контрольная сумма содержимого.
+    Старый файл сохраняется как предыдущее поколение (path + PREVIOUS_SUFFIX).
+    """
+    body = json.dumps(data, ensure_ascii=False, indent=indent)
+    digest = hashlib.sha256(body.encode('utf-8')).hexdigest()
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(body)
+            f.write(f"\n{CHECKSUM_FOOTER}{digest}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        if keep_previous and os.path.exists(path):
+            os.replace(path, path + PREVIOUS_SUFFIX)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    _fsync_dir(directory)
+
+def read_json_file(path):
+    """
+    Читает JSON, проверяя контрольную сумму, если она есть (файлы без нее читаются как раньше).
+    Повреждение сообщается как json.JSONDecodeError — так же, как от json.load.
+    """
+    with open(path, 'rb') as f:
+        raw = f.read()
+    try:
+        text = raw.decode('utf-8')
+    except UnicodeDecodeError as e:
+        raise json.JSONDecodeError(f"Файл не в UTF-8: {e}", "", 0)
+    body, sep, footer = text.rstrip("\r\n").rpartition("\n")
+    if sep and footer.startswith(CHECKSUM_FOOTER):
+        body = body.replace("\r\n", "\n").removesuffix("\r")  # rpartition оставил \r от \r\n перед суммой
+        if hashlib.sha256(body.encode('utf-8')).hexdigest() != footer[len(CHECKSUM_FOOTER):].strip():
+            raise json.JSONDecodeError("Контрольная сумма не совпадает", text, len(body))
+        text = body
+    return json.loads(text)
+
+def _set_aside_corrupt(path):
+    # Поврежденный файл не удаляем и не перезаписываем: откладываем рядом для ручного разбора
+    aside = f"{path}.corrupt-{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    try:
+        os.replace(path, aside)
+        print(f"Файл {path} поврежден, сохранен как {aside}")
+        return aside
+    except OSError as e:
+        print(f"Не удалось отложить поврежденный файл {path}: {e}")
+        return None
+
+def read_json_recovering(path):
+    """
+    Читает path; если он поврежден или пропал, откатывается на предыдущее поколение.
+    Поврежденные файлы откладываются в сторону, поэтому последующая запись их не затрет.
+    """
+    previous = path + PREVIOUS_SUFFIX
+    try:
+        return read_json_file(path)
+    except FileNotFoundError:
+        if not os.path.exists(previous):
+            raise
+    except json.JSONDecodeError as e:
+        print(f"Ошибка чтения {path}: {e}")
+        _set_aside_corrupt(path)
+        if not os.path.exists(previous):
+            raise
+    try:
+        data = read_json_file(previous)
+    except json.JSONDecodeError:
+        _set_aside_corrupt(previous)
+        raise
+    print(f"Данные восстановлены из предыдущего поколения {previous}")
+    try:
+        write_json_atomic(path, data, keep_previous=False)
+    except OSError as e:
+        print(f"Не удалось восстановить {path}: {e}")
+    return data
+
+# --- Хранилище данных ---
+
+class DataStore(ABC):
+    """
+    Общая часть хранилищ: помнит состояние, которое уже записано на диск,
+    и вычисляет по нему мелкие изменения (заметка, удаление, задачи, дерево).
+    """
+    lazy_bodies = False # load() отдает заметки без текста (LazyNote)
+
+    def __init__(self):
+        # Состояние в памяти меняет GUI-поток (prepare), а читает еще и поток записи
+        self.lock = threading.RLock()
+        self.generation = 0  # растет при каждом изменении данных (по нему бэкап пропускается)
+        self._reset_state()
+
+    def _reset_state(self):
+        # Последнее состояние, которое уже лежит на диске
+        self._notes = {}
+        self._task_lists = None
+        self._active_task_list = None
+        self._tree = None
+        self._unwritten = []  # записи из prepare, которые не удалось записать (повторяются со следующими)
+
+    def _remember(self, data):
+        self._notes = {n["timestamp"]: dict(n) for n in data.get("notes", []) if n.get("timestamp")}
+        self._task_lists = json.loads(json.dumps(data.get("task_lists", {})))
+        self._active_task_list = data.get("active_task_list")
+        self._tree = json.loads(json.dumps(data.get("note_tree", [])))
+        self._unwritten = []
+        self.generation += 1
+
+    def _state_as_data(self):
+        # Записи в _notes/_tree не меняются на месте, а заменяются — копии списка достаточно
+        with self.lock:
+            return {
+                "task_lists": self._task_lists if self._task_lists is not None else {"Default": []},
+                "active_task_list": self._active_task_list or "Default",
+                "notes": list(self._notes.values()),
+                "note_tree": self._tree or [],
+            }
+
+    def _apply(self, rec):
+        op = rec.get("op")
+        if op == "note":
+            note = rec.get("note") or {}
+            if note.get("timestamp"):
+                self._notes[note["timestamp"]] = note
+        elif op == "note_del":
+            self._notes.pop(rec.get("ts"), None)
+        elif op == "tasks":
+            self._task_lists = rec.get("task_lists", {})
+            self._active_task_list = rec.get("active_task_list")
+        elif op == "tree":
+            self._tree = rec.get("note_tree", [])
+
+    def _diff(self, data):
+        records = []
+        new_notes = {}
+        for n in data.get("notes", []):
+            ts = n.get("timestamp")
+            if not ts:
+                continue
+            new_notes[ts] = n
+            if self._notes.get(ts) != n:
+                records.append({"op": "note", "note": dict(n)})
+        for ts in self._notes.keys() - new_notes.keys():
+            records.append({"op": "note_del", "ts": ts})
+        task_lists = data.get("task_lists", {})
+        active = data.get("active_task_list")
+        if task_lists != self._task_lists or active != self._active_task_list:
+            records.append({"op": "tasks", "task_lists": task_lists, "active_task_list": active})
+        tree = data.get("note_tree", [])
+        if tree != self._tree:
+            records.append({"op": "tree", "note_tree": tree})
+        # Копии через JSON, чтобы дальнейшие правки UI не меняли записанное состояние
+        return json.loads(json.dumps(records))
+
+    @abstractmethod
+    def load(self):
+        """Читает данные формата data.json с диска и запоминает их как записанное состояние."""
+
+    def prepare(self, data, previous_texts=None):
+        """
+        Вычисляет записи с отличиями data от сохраненного состояния и сразу применяет их
+        к состоянию в памяти. Вызывается в GUI-потоке, диск не трогает.
+        Записывать результат нужно через write_pending: при ошибке записи он сохранит записи для повтора.
+        previous_texts (dict) заполняется прежними текстами измененных заметок
+        (None, если заметки не было или ее текст не загружен в память).
+        """
+        with self.lock:
+            records = self._diff(data)
+            if previous_texts is not None:
+                for rec in records:
+                    if rec["op"] == "note":
+                        old = self._notes.get(rec["note"]["timestamp"])
+                        previous_texts[rec["note"]["timestamp"]] = old.get("text") if old else None
+            for rec in records:
+                self._apply(rec)
+            if records:
+                self.generation += 1
+        return records
+
+    @abstractmethod
+    def write_records(self, records):
+        """Записывает подготовленные prepare записи на диск (можно из потока записи)."""
+
+    def write_pending(self, records):
+        """
+        Записывает records вместе с записями, которые не удалось записать раньше.
+        Если запись падает, все они остаются в _unwritten и уйдут со следующей записью —
+        хранилище считается «грязным», пока диск не догонит состояние в памяти.
+        """
+        with self.lock:
+            batch = self._unwritten + records
+            self._unwritten = []
+        if not batch:
+            return
+        try:
+            self.write_records(batch)
+        except Exception:
+            with self.lock:
+                self._unwritten = batch + self._unwritten
+            raise
+
+    def has_unwritten(self):
+        with self.lock:
+            return bool(self._unwritten)
+
+    def commit(self, data):
+        """Синхронное сохранение: prepare + write_pending. Возвращает число записей."""
+        records = self.prepare(data)
+        self.write_pending(records)
+        return len(records)
+
+    def stage_snapshot(self, data):
+        """
+        Запоминает data как состояние целиком (GUI-поток, без диска) и возвращает записи
+        для write_pending: одна запись "snapshot" с копией данных, которую можно писать из потока записи.
+        """
+        with self.lock:
+            self._remember(data)
+            return [{"op": "snapshot", "data": self._state_as_data()}]
+
+    def write_snapshot(self, data):
+        """Синхронно перезаписывает хранилище данными data."""
+        self.write_pending(self.stage_snapshot(data))
+
+    def compact(self):
+        pass
+
+    def close(self):
+        """Освобождает файлы хранилища (выход из программы)."""
+
+    def changed_on_disk(self):
+        """True, если файлы хранилища менял кто-то другой после нашей последней загрузки или записи."""
+        return True
+
+    def search(self, text):
+        """Множество timestamp заметок, содержащих text, или None, если поиск не поддерживается."""
+        return None
+
+    def export_data(self):
+        """Полные данные в формате data.json (с текстами заметок)."""
+        return self._state_as_data()
+
+    def export_json(self, path):
+        """Выгружает текущее состояние в файл формата data.json."""
+        write_json_atomic(path, self.export_data(), keep_previous=False)
+
+
+class DataJournal(DataStore):
+    """
+    Снимок DATA_FILE + журнал мелких изменений (по строке JSON на запись).
+    Сохранение дописывает в журнал только изменившиеся заметки, задачи и дерево,
+    а при разрастании журнала он сворачивается в новый снимок.
+    """
+    def __init__(self, snapshot_path=DATA_FILE, journal_path=JOURNAL_FILE):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        super().__init__()
+
+    def _reset_state(self):
+        super()._reset_state()
+        self._records = 0
+        self._disk_stamp = None
+
+    def _stamp(self):
+        # mtime + размер снимка и журнала: дешево и без чтения содержимого
+        stamp = []
+        for path in (self.snapshot_path, self.journal_path):
+            try:
+                st = os.stat(path)
+                stamp.append((st.st_mtime_ns, st.st_size, st.st_ino))
+            except OSError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def changed_on_disk(self):
+        return self._disk_stamp is None or self._stamp() != self._disk_stamp
+
+    def load(self):
+        """Читает снимок и проигрывает поверх него журнал. Ошибки чтения снимка пробрасывает."""
+        self._reset_state()
+        data = read_json_recovering(self.snapshot_path)
+        self._remember(data)
+        replayed = self._replay()
+        if replayed:
+            data = self._state_as_data()
+        self._disk_stamp = self._stamp()
+        return data
+
+    def _replay(self):
+        if not os.path.exists(self.journal_path):
+            return 0
+        count = 0
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    # Оборванная последняя запись (сбой во время дозаписи) — дальше читать нечего
+                    print(f"Журнал {self.journal_path}: пропущена поврежденная запись")
+                    break
+                self._apply(rec)
+                count += 1
+        self._records = count
+        return count
+
+    def write_records(self, records):
+        """Дописывает записи в журнал; при разрастании сворачивает его в снимок."""
+        snapshots = [i for i, rec in enumerate(records) if rec.get("op") == "snapshot"]
+        if snapshots:
+            # Последний снимок заменяет все записи до него, журнал начинается заново
+            last = snapshots[-1]
+            self._write_snapshot_file(records[last]["data"])
+            records = records[last + 1:]
+        if not records:
+            return
+        payload = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())  # выполняется в потоке записи, GUI не ждет
+        self._records += len(records)
+        if self._needs_compaction():
+            self.compact()
+        self._disk_stamp = self._stamp()
+
+    def _needs_compaction(self):
+        if self._records >= JOURNAL_COMPACT_RECORDS:
+            return True
+        try:
+            return os.path.getsize(self.journal_path) >= JOURNAL_COMPACT_BYTES
+        except OSError:
+            return False
+
+    def _write_snapshot_file(self, data):
+        # Сбой между записью снимка и удалением журнала безопасен: записи журнала идемпотентны
+        write_json_atomic(self.snapshot_path, data)
+        self.discard_journal()
+        self._disk_stamp = self._stamp()
+
+    def compact(self):
+        """
+        Сворачивает журнал в снимок. Снимок может уже включать записи, которые еще стоят
+        в очереди на дозапись в журнал, — это безопасно, повторное применение записей ничего не меняет.
+        """
+        if self._records == 0 and os.path.exists(self.snapshot_path):
+            return
+        self._write_snapshot_file(self._state_as_data())
+
+    def discard_journal(self):
+        try:
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+        except OSError as e:
+            print(f"Не удалось очистить журнал: {e}")
+        self._records = 0
+
+
+class LazyNote(dict):
+    """
+    Заметка, загруженная без текста: в словаре только timestamp и pinned,
+    а text по обращению берется из хранилища (через его LRU-кеш).
+    Записанный text хранится в словаре как обычно и дальше уже не подгружается.
+    """
+    __slots__ = ("_store", "alias", "tags", "length", "mtime")
+
+    def __init__(self, store, timestamp, pinned=False, alias="", tags=(), length=0, mtime=0.0):
+        super().__init__(timestamp=timestamp, pinned=pinned)
+        self._store = store
+        self.alias = alias
+        self.tags = set(tags)
+        self.length = length
+        self.mtime = mtime
+
+    def has_text(self):
+        return dict.__contains__(self, "text")
+
+    def __getitem__(self, key):
+        if key == "text" and not self.has_text():
+            return self._store.get_body(dict.__getitem__(self, "timestamp"))
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        if key == "text" and not self.has_text():
+            return self._store.get_body(dict.__getitem__(self, "timestamp"))
+        return super().get(key, default)
+
+
+class SqliteDataStore(DataStore):
+    """
+    Хранилище в SQLite: построчные upsert'ы в одной транзакции и FTS5-индекс
+    (триграммы) по тексту заметок. При первом запуске переносит данные из data.json.
+    При загрузке читает только метаданные заметок, тексты подгружаются по требованию.
+    """
+    lazy_bodies = True
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS notes (
+            id INTEGER PRIMARY KEY, ts TEXT NOT NULL UNIQUE, text TEXT NOT NULL DEFAULT '',
+            pinned INTEGER NOT NULL DEFAULT 0, position INTEGER NOT NULL DEFAULT 0,
+            alias TEXT NOT NULL DEFAULT '', tags TEXT NOT NULL DEFAULT '',
+            length INTEGER NOT NULL DEFAULT 0, mtime REAL NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS task_lists (name TEXT PRIMARY KEY, position INTEGER NOT NULL DEFAULT 0);
+        CREATE TABLE IF NOT EXISTS tasks (
+            list_name TEXT NOT NULL, position INTEGER NOT NULL, text TEXT NOT NULL DEFAULT '',
+            completed INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (list_name, position)
+        );
+        CREATE TABLE IF NOT EXISTS tree_nodes (
+            id INTEGER PRIMARY KEY, parent_id INTEGER, position INTEGER NOT NULL,
+            type TEXT NOT NULL, name TEXT, ts TEXT
+        );
+    """
+
+    def __init__(self, db_path=SQLITE_FILE, json_path=DATA_FILE, journal_path=JOURNAL_FILE):
+        self.db_path = db_path
+        self.json_path = json_path
+        self.journal_path = journal_path
+        super().__init__()
+        self._bodies = OrderedDict()  # timestamp -> текст, LRU
+        # Два соединения: conn пишет (поток записи, _write_lock), _reader читает тексты и ищет
+        # (GUI-поток, _db_lock). В режиме WAL чтение не ждет транзакцию записи
+        self._write_lock = threading.RLock()
+        self._db_lock = threading.RLock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        try:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(self.SCHEMA)
+            self._ensure_note_metadata()
+            self.fts_enabled = self._ensure_fts()
+        except sqlite3.Error:
+            self.conn.close()  # иначе файл не отложить (Windows держит открытый файл)
+            raise
+        self._reader = sqlite3.connect(db_path, check_same_thread=False)
+        # Тот же lower(), что и в filter_notes (встроенный в SQLite понимает только ASCII)
+        self._reader.create_function("py_lower", 1, lambda v: v.lower() if isinstance(v, str) else v, deterministic=True)
+        self._data_version = None
+
+    @staticmethod
+    def _note_metadata(text):
+        alias = text.strip().split('\n', 1)[0].strip()[:100]
+        return alias, " ".join(sorted(TagIndex.find_tags(text))), len(text)
+
+    def _ensure_note_metadata(self):
+        # Базы, созданные до появления метаданных: добавляем колонки и заполняем их один раз
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(notes)")}
+        missing = [c for c in ("alias", "tags", "length", "mtime") if c not in columns]
+        if not missing:
+            return
+        with self.conn:
+            for column in missing:
+                kind = "TEXT NOT NULL DEFAULT ''" if column in ("alias", "tags") else "REAL NOT NULL DEFAULT 0" if column == "mtime" else "INTEGER NOT NULL DEFAULT 0"
+                self.conn.execute(f"ALTER TABLE notes ADD COLUMN {column} {kind}")
+            rows = self.conn.execute("SELECT id, text FROM notes").fetchall()
+            self.conn.executemany("UPDATE notes SET alias=?, tags=?, length=? WHERE id=?",
+                                  [(*self._note_metadata(text), note_id) for note_id, text in rows])
+
+    def _ensure_fts(self):
+        try:
+            self.conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(body, tokenize='trigram')")
+            return True
+        except sqlite3.OperationalError as e:
+            print(f"FTS5 недоступен, поиск будет без индекса: {e}")
+            return False
+
+    def _meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self.conn.execute("INSERT INTO meta(key, value) VALUES(?, ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value", (key, value))
+
+    def close(self):
+        with self._write_lock, self._db_lock:
+            self._reader.close()
+            self.conn.close()
+
+    @staticmethod
+    def set_aside_corrupt(db_path=SQLITE_FILE):
+        """
+        Откладывает поврежденную базу (вместе с -wal/-shm) как .corrupt-<время>, не удаляя ее.
+        Возвращает новое имя файла базы или None.
+        """
+        aside = None
+        for path in (db_path, f"{db_path}-wal", f"{db_path}-shm"):
+            if os.path.exists(path):
+                moved = _set_aside_corrupt(path)
+                if path == db_path:
+                    aside = moved
+        return aside
+
+    @staticmethod
+    def release_to_json(db_path=SQLITE_FILE, json_path=DATA_FILE, journal_path=JOURNAL_FILE):
+        """Если последним использовался SQLite, выгружает его в data.json (обратное переключение)."""
+        if not os.path.exists(db_path):
+            return
+        try:
+            store = SqliteDataStore(db_path, json_path, journal_path)
+            if store._meta("authoritative") == "1":
+                data = store._read_all()
+                DataJournal(json_path, journal_path).write_snapshot(data)
+                with store.conn:
+                    store._set_meta("authoritative", "0")
+            store.close()
+        except (sqlite3.Error, OSError) as e:
+            print(f"Не удалось выгрузить SQLite в JSON: {e}")
+
+    def load(self):
+        self._reset_state()
+        if self._meta("authoritative") != "1":
+            # База еще не ведущая: одноразовый перенос из data.json (+ журнала)
+            legacy = DataJournal(self.json_path, self.journal_path).load()
+            self.write_snapshot(legacy)
+            print(f"Данные перенесены из {self.json_path} в {self.db_path}")
+        with self._write_lock:
+            data = self._read_all(with_bodies=False)
+        self._forget_bodies()
+        with self.lock:
+            self._remember(data)
+        return data
+
+    def _current_data_version(self):
+        return self._reader.execute("PRAGMA data_version").fetchone()[0]
+
+    def _forget_bodies(self, timestamps=None):
+        """После коммита: сбрасывает тексты из LRU и запоминает data_version с учетом своей записи."""
+        with self._db_lock:
+            if timestamps is None:
+                self._bodies.clear()
+            else:
+                for ts in timestamps:
+                    self._bodies.pop(ts, None)
+            self._data_version = self._current_data_version()
+
+    def changed_on_disk(self):
+        # data_version читающего соединения меняется от любых чужих коммитов, включая наш conn;
+        # после своей записи _forget_bodies запоминает новое значение
+        with self._db_lock:
+            return self._data_version is None or self._current_data_version() != self._data_version
+
+    def get_body(self, timestamp):
+        """Текст заметки; последние прочитанные держим в LRU-кеше."""
+        with self._db_lock:
+            body = self._bodies.get(timestamp)
+            if body is not None:
+                self._bodies.move_to_end(timestamp)
+                return body
+            row = self._reader.execute("SELECT text FROM notes WHERE ts=?", (timestamp,)).fetchone()
+            body = row[0] if row else ""
+            self._bodies[timestamp] = body
+            if len(self._bodies) > NOTE_BODY_CACHE_SIZE:
+                self._bodies.popitem(last=False)
+            return body
+
+    def export_data(self):
+        with self._write_lock:
+            return self._read_all()
+
+    def _read_all(self, with_bodies=True):
+        if with_bodies:
+            notes = [{"timestamp": ts, "text": text, "pinned": bool(pinned)}
+                     for ts, text, pinned in self.conn.execute("SELECT ts, text, pinned FROM notes ORDER BY position, id")]
+        else:
+            notes = [LazyNote(self, ts, bool(pinned), alias, tags.split(), length, mtime)
+                     for ts, pinned, alias, tags, length, mtime
+                     in self.conn.execute("SELECT ts, pinned, alias, tags, length, mtime FROM notes ORDER BY position, id")]
+        task_lists = {name: [] for (name,) in self.conn.execute("SELECT name FROM task_lists ORDER BY position")}
+        for list_name, text, completed in self.conn.execute("SELECT list_name, text, completed FROM tasks ORDER BY list_name, position"):
+            task_lists.setdefault(list_name, []).append({"text": text, "completed": bool(completed)})
+        return {
+            "task_lists": task_lists or {"Default": []},
+            "active_task_list": self._meta("active_task_list", "Default"),
+            "notes": notes,
+            "note_tree": self._read_tree(),
+        }
+
+    def _read_tree(self):
+        children = {}
+        for node_id, parent_id, type_, name, ts in self.conn.execute("SELECT id, parent_id, type, name, ts FROM tree_nodes ORDER BY parent_id, position"):
+            children.setdefault(parent_id, []).append((node_id, type_, name, ts))
+        def build(parent_id):
+            out = []
+            for node_id, type_, name, ts in children.get(parent_id, []):
+                if type_ == "folder":
+                    out.append({"type": "folder", "name": name or "", "children": build(node_id)})
+                else:
+                    out.append({"type": "note", "timestamp": ts or ""})
+            return out
+        return build(None)
+
+    def _upsert_note(self, note):
+        ts = note["timestamp"]
+        pinned = int(bool(note.get("pinned", False)))
+        if not dict.__contains__(note, "text"):
+            # Текст не загружался и не менялся — обновляем только метаданные
+            self.conn.execute("UPDATE notes SET pinned=? WHERE ts=?", (pinned, ts))
+            return
+        text = note["text"]
+        self.conn.execute(
+            "INSERT INTO notes(ts, text, pinned, position, alias, tags, length, mtime) "
+            "VALUES(?, ?, ?, (SELECT COALESCE(MAX(position), 0) + 1 FROM notes), ?, ?, ?, ?) "
+            "ON CONFLICT(ts) DO UPDATE SET text=excluded.text, pinned=excluded.pinned, alias=excluded.alias, "
+            "tags=excluded.tags, length=excluded.length, mtime=excluded.mtime",
+            (ts, text, pinned, *self._note_metadata(text), datetime.now().timestamp()))
+        if self.fts_enabled:
+            (note_id,) = self.conn.execute("SELECT id FROM notes WHERE ts=?", (ts,)).fetchone()
+            self.conn.execute("DELETE FROM notes_fts WHERE rowid=?", (note_id,))
+            self.conn.execute("INSERT INTO notes_fts(rowid, body) VALUES(?, ?)", (note_id, f"{ts} {text}"))
+
+    def _delete_note(self, ts):
+        row = self.conn.execute("SELECT id FROM notes WHERE ts=?", (ts,)).fetchone()
+        if not row: return
+        if self.fts_enabled:
+            self.conn.execute("DELETE FROM notes_fts WHERE rowid=?", row)
+        self.conn.execute("DELETE FROM notes WHERE id=?", row)
+
+    def _write_tasks(self, task_lists, active):
+        self.conn.execute("DELETE FROM tasks")
+        self.conn.execute("DELETE FROM task_lists")
+        for pos, (name, tasks) in enumerate((task_lists or {}).items()):
+            self.conn.execute("INSERT INTO task_lists(name, position) VALUES(?, ?)", (name, pos))
+            self.conn.executemany(
+                "INSERT INTO tasks(list_name, position, text, completed) VALUES(?, ?, ?, ?)",
+                [(name, i, t.get("text", ""), int(bool(t.get("completed", False)))) for i, t in enumerate(tasks or [])])
+        self._set_meta("active_task_list", active or "Default")
+
+    def _write_tree(self, tree):
+        self.conn.execute("DELETE FROM tree_nodes")
+        def insert(nodes, parent_id):
+            for pos, node in enumerate(nodes or []):
+                if node.get("type") == "folder":
+                    cur = self.conn.execute("INSERT INTO tree_nodes(parent_id, position, type, name) VALUES(?, ?, 'folder', ?)",
+                                            (parent_id, pos, node.get("name", "")))
+                    insert(node.get("children", []), cur.lastrowid)
+                elif node.get("type") == "note":
+                    self.conn.execute("INSERT INTO tree_nodes(parent_id, position, type, ts) VALUES(?, ?, 'note', ?)",
+                                      (parent_id, pos, node.get("timestamp", "")))
+        insert(tree, None)
+
+    def _write_record(self, rec):
+        op = rec.get("op")
+        if op == "note":
+            self._upsert_note(rec["note"])
+        elif op == "note_del":
+            self._delete_note(rec["ts"])
+        elif op == "tasks":
+            self._write_tasks(rec.get("task_lists"), rec.get("active_task_list"))
+        elif op == "tree":
+            self._write_tree(rec.get("note_tree"))
+        elif op == "snapshot":
+            self._write_all(rec["data"])
+
+    def _write_all(self, data):
+        # Не очищаем таблицу целиком: у незагруженных LazyNote текст есть только в базе
+        keep = {n.get("timestamp") for n in data.get("notes", []) if n.get("timestamp")}
+        for (ts,) in self.conn.execute("SELECT ts FROM notes").fetchall():
+            if ts not in keep:
+                self._delete_note(ts)
+        for note in data.get("notes", []):
+            if note.get("timestamp"):
+                self._upsert_note(note)
+        self._write_tasks(data.get("task_lists"), data.get("active_task_list"))
+        self._write_tree(data.get("note_tree"))
+        self._set_meta("authoritative", "1")
+
+    def write_records(self, records):
+        if not records:
+            return
+        with self._write_lock:
+            with self.conn:
+                for rec in records:
+                    self._write_record(rec)
+        if any(rec["op"] == "snapshot" for rec in records):
+            self._forget_bodies()
+        else:
+            self._forget_bodies({rec["note"]["timestamp"] if rec["op"] == "note" else rec["ts"]
+                                 for rec in records if rec["op"] in ("note", "note_del")})
+
+    def search(self, text):
+        if len(text) < 3 or not self.fts_enabled:
+            # Триграммный индекс работает с запросами от трех символов, короткие ищем подстрокой в базе
+            with self._db_lock:
+                rows = self._reader.execute("SELECT ts FROM notes WHERE instr(py_lower(ts || ' ' || text), ?) > 0", (text,))
+                return {ts for (ts,) in rows}
+        phrase = '"' + text.replace('"', '""') + '"'
+        try:
+            with self._db_lock:
+                rows = self._reader.execute(
+                    "SELECT notes.ts FROM notes_fts JOIN notes ON notes.id = notes_fts.rowid WHERE notes_fts MATCH ?", (phrase,))
+                return {ts for (ts,) in rows}
+        except sqlite3.Error as e:
+            print(f"Ошибка поиска по FTS: {e}")
+            return None
+
+
+class StoreWriter:
+    """
+    Фоновый поток записи: выполняет задания по очереди, чтобы диск не тормозил GUI.
+    flush() ждет, пока очередь опустеет (выход из программы, бэкап, восстановление).
+    """
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="StoreWriter", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                job()
+            except Exception as e:
+                print(f"Ошибка фоновой записи данных: {e}")
+            finally:
+                self._queue.task_done()
+
+    def submit(self, job):
+        if not self._thread.is_alive():
+            job()  # поток уже остановлен — пишем сразу
+            return
+        self._queue.put(job)
+
+    def flush(self):
+        if self._thread.is_alive():
+            self._queue.join()
+
+    def busy(self):
+        """True, пока в очереди есть невыполненные задания."""
+        return self._thread.is_alive() and self._queue.unfinished_tasks > 0
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+
+class BackupStore:
+    """
+    Инкрементальные бэкапы с дедупликацией. Каждая заметка, задачи и дерево хранятся
+    сжатыми (gzip) фрагментами в objects/ под именем sha256 своего содержимого; снимок —
+    небольшой манифест snapshot_YYYYMMDD_HHMMSS.json со ссылками на фрагменты. Неизменившиеся
+    заметки новых фрагментов не создают, поэтому место растет с правками, а не со временем.
+    Список бэкапов ведется в BACKUP_INDEX_FILE, чтобы не читать каталог и манифесты.
+    Старые файлы data_*.bak (полные копии) по-прежнему читаются.
+    Бэкапы создает поток записи, а диалог читает и удаляет их из GUI-потока: операции с файлами
+    идут под lock, сводка в памяти — под _index_lock, поэтому список бэкапов не ждет записи снимка.
+    Если передан writer (StoreWriter), файл сводки и удаление снимков уходят в поток записи.
+    """
+    MANIFEST_PREFIX = "snapshot_"
+    LEGACY_PREFIX = "data_"
+    TIME_FORMAT = "%Y%m%d_%H%M%S"
+
+    def __init__(self, root=BACKUP_DIR, writer=None):
+        self.root = root
+        self.writer = writer
+        self.objects_dir = os.path.join(root, BACKUP_OBJECTS_DIR)
+        self.index_path = os.path.join(root, BACKUP_INDEX_FILE)
+        self._index = None  # имя файла -> {"time", "notes", "size", "digest"}
+        self.lock = threading.RLock()
+        self._index_lock = threading.RLock()
+
+    # --- Фрагменты ---
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest[2:])
+
+    def _put_object(self, obj):
+        """Сохраняет obj, если такого фрагмента еще нет. Возвращает (хеш, размер без сжатия)."""
+        payload = json.dumps(obj, ensure_ascii=False, sort_keys=True).encode('utf-8')
+        digest = hashlib.sha256(payload).hexdigest()
+        path = self._object_path(digest)
+        if os.path.exists(path):
+            return digest, len(payload)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                # mtime=0: одинаковое содержимое дает одинаковые байты
+                with gzip.GzipFile(fileobj=f, mode='wb', mtime=0) as gz:
+                    gz.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        return digest, len(payload)
+
+    def _get_object(self, digest):
+        # Распаковка потоком с одновременной проверкой хеша; фрагменты без сжатия тоже читаются
+        hasher = hashlib.sha256()
+        parts = []
+        with open(self._object_path(digest), 'rb') as raw:
+            compressed = raw.read(2) == b"\x1f\x8b"
+            raw.seek(0)
+            stream = gzip.GzipFile(fileobj=raw, mode='rb') if compressed else raw
+            while chunk := stream.read(65536):
+                hasher.update(chunk)
+                parts.append(chunk)
+        if hasher.hexdigest() != digest:
+            raise ValueError(f"Фрагмент бэкапа {digest} поврежден")
+        return json.loads(b"".join(parts).decode('utf-8'))
+
+    # --- Сводка ---
+    def _load_index(self):
+        with self._index_lock:
+            if self._index is None:
+                try:
+                    self._index = read_json_file(self.index_path)
+                except (OSError, json.JSONDecodeError):
+                    self._index = self._rebuild_index()
+            return self._index
+
+    def _rebuild_index(self):
+        """Однократный обход каталога, если сводки нет (первый запуск, повреждение)."""
+        index = {}
+        paths = glob(os.path.join(self.root, f"{self.MANIFEST_PREFIX}*.json"))
+        paths += glob(os.path.join(self.root, f"{self.LEGACY_PREFIX}*.bak"))
+        for path in paths:
+            created = self.backup_time(path)
+            if created is None:
+                continue
+            entry = {"time": created.strftime(self.TIME_FORMAT), "notes": None, "size": None}
+            if self._is_manifest(path):
+                manifest = self._read_manifest(path)
+                if manifest is not None:
+                    entry["notes"] = len(manifest.get("notes", []))
+                    entry["size"] = manifest.get("size")
+            else:
+                try:
+                    entry["size"] = os.path.getsize(path)
+                except OSError:
+                    pass
+            index[os.path.basename(path)] = entry
+        self._save_index(index)
+        return index
+
+    def _save_index(self, index=None):
+        # Вызывается под lock, поэтому записи сводки не обгоняют друг друга
+        with self._index_lock:
+            if index is not None:
+                self._index = index
+            snapshot = dict(self._index)
+        def job():
+            try:
+                os.makedirs(self.root, exist_ok=True)
+                write_json_atomic(self.index_path, snapshot, indent=None, keep_previous=False)
+            except OSError as e:
+                print(f"Не удалось сохранить сводку бэкапов: {e}")
+        self._submit(job)
+
+    def _submit(self, job):
+        if self.writer:
+            self.writer.submit(job)
+        else:
+            job()
+
+    def entries(self):
+        """[(путь, {"time": datetime, "notes": int | None, "size": int | None})] от новых к старым."""
+        result = []
+        with self._index_lock:
+            items = list(self._load_index().items())
+        for name, entry in items:
+            try:
+                created = datetime.strptime(entry["time"], self.TIME_FORMAT)
+            except (KeyError, TypeError, ValueError):
+                continue
+            result.append((os.path.join(self.root, name),
+                           {"time": created, "notes": entry.get("notes"), "size": entry.get("size")}))
+        result.sort(key=lambda item: item[1]["time"], reverse=True)
+        return result
+
+    # --- Снимки ---
+    def list_backups(self):
+        """Пути манифестов и старых .bak, от новых к старым."""
+        return [path for path, _ in self.entries()]
+
+    def backup_time(self, path):
+        name = os.path.splitext(os.path.basename(path))[0]
+        for prefix in (self.MANIFEST_PREFIX, self.LEGACY_PREFIX):
+            if name.startswith(prefix):
+                try:
+                    return datetime.strptime(name[len(prefix):], self.TIME_FORMAT)
+                except ValueError:
+                    return None
+        return None
+
+    def _is_manifest(self, path):
+        return os.path.basename(path).startswith(self.MANIFEST_PREFIX)
+
+    @staticmethod
+    def content_digest(data):
+        """Хеш содержимого data: по нему бэкап пропускается, если данные не менялись (и между запусками)."""
+        return hashlib.sha256(json.dumps(data, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def latest_digest(self):
+        """Хеш данных последнего снимка или None."""
+        with self._index_lock:
+            manifests = [(entry.get("time", ""), entry.get("digest")) for name, entry in self._load_index().items()
+                         if name.startswith(self.MANIFEST_PREFIX) and isinstance(entry, dict)]
+        return max(manifests)[1] if manifests else None
+
+    def _manifest_for(self, data):
+        size = 0
+        def put(obj):
+            nonlocal size
+            digest, length = self._put_object(obj)
+            size += length
+            return digest
+        manifest = {
+            "notes": [put(note) for note in data.get("notes", [])],
+            "task_lists": put(data.get("task_lists", {"Default": []})),
+            "active_task_list": data.get("active_task_list", "Default"),
+            "note_tree": put(data.get("note_tree", [])),
+        }
+        manifest["size"] = size
+        return manifest
+
+    def create(self, data, now=None, only_if_changed=False):
+        """
+        Сохраняет снимок data. Если данные не изменились с последнего снимка, новый манифест
+        не пишется и возвращается путь последнего. Затем применяет хранение и сборку мусора.
+        only_if_changed: при совпадении хеша с последним снимком сразу возвращает None,
+        не раскладывая данные на фрагменты.
+        """
+        now = now or datetime.now()
+        digest = self.content_digest(data)
+        with self.lock:
+            if only_if_changed and digest == self.latest_digest():
+                return None
+            os.makedirs(self.root, exist_ok=True)
+            manifest = self._manifest_for(data)
+            latest = next((p for p in self.list_backups() if self._is_manifest(p)), None)
+            path = latest
+            if latest is None or self._read_manifest(latest) != manifest:
+                name = f"{self.MANIFEST_PREFIX}{now.strftime(self.TIME_FORMAT)}.json"
+                path = os.path.join(self.root, name)
+                write_json_atomic(path, manifest, keep_previous=False)
+                entry = {"time": now.strftime(self.TIME_FORMAT), "notes": len(manifest["notes"]), "size": manifest["size"]}
+            else:
+                entry = dict(self._load_index().get(os.path.basename(latest), {}))
+            with self._index_lock:
+                self._load_index()[os.path.basename(path)] = {**entry, "digest": digest}
+            self._save_index()
+            self.prune(now)
+            return path
+
+    def _read_manifest(self, path):
+        try:
+            return read_json_file(path)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def load(self, path):
+        """Собирает данные формата data.json из манифеста или старого .bak."""
+        with self.lock:  # сборка мусора не удалит фрагменты, пока снимок читается
+            if not self._is_manifest(path):
+                return read_json_file(path)
+            manifest = read_json_file(path)
+            return {
+                "task_lists": self._get_object(manifest["task_lists"]),
+                "active_task_list": manifest.get("active_task_list", "Default"),
+                "notes": [self._get_object(digest) for digest in manifest["notes"]],
+                "note_tree": self._get_object(manifest["note_tree"]),
+            }
+
+    def _forget(self, path):
+        with self._index_lock:
+            self._load_index().pop(os.path.basename(path), None)
+
+    def delete(self, path):
+        """Сразу убирает снимок из сводки; файлы удаляются в потоке записи."""
+        self._forget(path)
+        self._submit(lambda: self._delete_files(path))
+
+    def _delete_files(self, path):
+        with self.lock:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Не удалось удалить бэкап {path}: {e}")
+            self._save_index()
+            if self._is_manifest(path):
+                self.collect_garbage()
+
+    # --- Хранение и сборка мусора ---
+    def prune(self, now=None):
+        """Удаляет снимки по BACKUP_RETENTION (старые .bak не трогает) и лишние фрагменты."""
+        with self.lock:
+            now = now or datetime.now()
+            manifests = [p for p in self.list_backups() if self._is_manifest(p)]
+            kept_buckets = set()
+            removed = 0
+            for i, path in enumerate(manifests):  # от новых к старым: в корзине остается самый свежий
+                created = self.backup_time(path)
+                if i == 0 or created is None:
+                    continue
+                age = now - created
+                tier = next((n for n, (max_age, _) in enumerate(BACKUP_RETENTION) if age <= max_age), None)
+                if tier is not None:
+                    step = BACKUP_RETENTION[tier][1]
+                    bucket = (tier, int(created.timestamp() // step.total_seconds()))
+                    if bucket not in kept_buckets:
+                        kept_buckets.add(bucket)
+                        continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"Не удалось удалить старый бэкап {path}: {e}")
+                    continue
+                self._forget(path)
+                removed += 1
+            if removed:
+                self._save_index()
+                self.collect_garbage()
+            return removed
+
+    def collect_garbage(self):
+        """Удаляет фрагменты, на которые не ссылается ни один манифест."""
+        with self.lock:
+            referenced = set()
+            for path in self.list_backups():
+                if not self._is_manifest(path):
+                    continue
+                manifest = self._read_manifest(path)
+                if manifest is None:
+                    # Нечитаемый манифест: не рискуем удалить нужные ему фрагменты
+                    print(f"Пропущена сборка мусора: не удалось прочитать {path}")
+                    return 0
+                referenced.update(manifest.get("notes", []))
+                referenced.add(manifest.get("task_lists"))
+                referenced.add(manifest.get("note_tree"))
+            removed = 0
+            for path in glob(os.path.join(self.objects_dir, "*", "*")):
+                digest = os.path.basename(os.path.dirname(path)) + os.path.basename(path)
+                if digest not in referenced:
+                    try:
+                        os.remove(path)
+                        removed += 1
+                    except OSError:
+                        pass
+            return removed
+
+class NoteHistory:
+    """
+    История версий заметок. Для каждой заметки хранится последний текст целиком и список
+    более старых версий в виде обратных разностей (по строкам): каждая версия восстанавливается
+    из следующей, более новой. Поэтому длинная история стоит примерно столько, сколько правки,
+    а не число версий × размер. Размер истории заметки ограничен бюджетом: сверх него старые
+    версии прореживаются (из самых плотных участков), последние HISTORY_KEEP_RECENT не трогаются.
+    Все методы записи вызываются из потока записи.
+    """
+    def __init__(self, root=HISTORY_DIR):
+        self.root = root
+
+    def _path(self, timestamp):
+        return os.path.join(self.root, hashlib.sha1(timestamp.encode('utf-8')).hexdigest() + ".json")
+
+    @staticmethod
+    def make_delta(base, target):
+        """Разность, превращающая base в target: [начало, конец] — строки из base, строка — вставка."""
+        a = base.splitlines(keepends=True)
+        b = target.splitlines(keepends=True)
+        delta = []
+        for tag, i1, i2, j1, j2 in SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+            if tag == "equal":
+                delta.append([i1, i2])
+            elif j2 > j1:
+                delta.append("".join(b[j1:j2]))
+        return delta
+
+    @staticmethod
+    def apply_delta(base, delta):
+        a = base.splitlines(keepends=True)
+        return "".join(op if isinstance(op, str) else "".join(a[op[0]:op[1]]) for op in delta)
+
+    def load(self, timestamp):
+        try:
+            return read_json_file(self._path(timestamp))
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def _save(self, timestamp, entry):
+        os.makedirs(self.root, exist_ok=True)
+        write_json_atomic(self._path(timestamp), entry, indent=None, keep_previous=False)
+
+    def revisions(self, timestamp):
+        """[(время, текст)] от новых к старым, включая текущую версию. Один проход по разностям."""
+        entry = self.load(timestamp)
+        return self._texts(entry) if entry else []
+
+    def _texts(self, entry):
+        text = entry["latest"]
+        result = [(entry["latest_time"], text)]
+        for rev in reversed(entry["revisions"]):
+            text = self.apply_delta(text, rev["delta"])
+            result.append((rev["time"], text))
+        return result
+
+    def record(self, timestamp, text, previous=None, budget=None, now=None):
+        """
+        Добавляет версию text. previous — текст до правки: им начинается история заметки,
+        если ее еще нет.
+        """
+        now = now or datetime.now()
+        now_str = now.strftime("%Y-%m-%d %H:%M:%S")
+        entry = self.load(timestamp)
+        if entry is None:
+            entry = {"timestamp": timestamp, "latest": text, "latest_time": now_str, "revisions": []}
+            if previous and previous != text:
+                entry["revisions"].append({"time": now_str, "delta": self.make_delta(text, previous)})
+            self._save(timestamp, entry)
+            return
+        if entry["latest"] == text:
+            return
+        try:
+            recent = now - datetime.strptime(entry["latest_time"], "%Y-%m-%d %H:%M:%S") < HISTORY_MIN_INTERVAL
+        except ValueError:
+            recent = False
+        revisions = entry["revisions"]
+        if recent and revisions:
+            # Частые сохранения (автосохранение при наборе) не плодят версии: заменяем последнюю
+            older = self.apply_delta(entry["latest"], revisions[-1]["delta"])
+            revisions[-1]["delta"] = self.make_delta(text, older)
+        elif not recent:
+            revisions.append({"time": entry["latest_time"], "delta": self.make_delta(text, entry["latest"])})
+            entry["latest_time"] = now_str  # при слиянии время не сдвигаем, иначе долгий набор — одна версия
+        entry["latest"] = text
+        if budget:
+            self._thin(entry, budget)
+        self._save(timestamp, entry)
+
+    def _thin(self, entry, budget):
+        revisions = entry["revisions"]
+        sizes = [len(json.dumps(rev["delta"], ensure_ascii=False)) for rev in revisions]
+        total = len(entry["latest"]) + sum(sizes)
+        if total <= budget:
+            return
+        texts = [text for _, text in self._texts(entry)][1:]
+        texts.reverse()  # texts[i] — текст revisions[i]
+        newer = lambda i: texts[i + 1] if i + 1 < len(texts) else entry["latest"]
+        while total > budget and revisions:
+            candidates = range(1, max(1, len(revisions) - HISTORY_KEEP_RECENT))
+            if candidates:
+                # Убираем версию, ближе всех по времени к более старой соседке
+                i = min(candidates, key=lambda k: self._gap(revisions[k - 1]["time"], revisions[k]["time"]))
+                revisions[i - 1]["delta"] = self.make_delta(newer(i), texts[i - 1])
+                total -= sizes[i] + sizes[i - 1]
+                sizes[i - 1] = len(json.dumps(revisions[i - 1]["delta"], ensure_ascii=False))
+                total += sizes[i - 1]
+            else:
+                i = 0
+                total -= sizes[0]
+            del revisions[i], texts[i], sizes[i]
+
+    @staticmethod
+    def _gap(older, newer):
+        try:
+            fmt = "%Y-%m-%d %H:%M:%S"
+            return (datetime.strptime(newer, fmt) - datetime.strptime(older, fmt)).total_seconds()
+        except ValueError:
+            return 0
+
+    def forget(self, timestamp):
+        try:
+            os.remove(self._path(timestamp))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Не удалось удалить историю заметки {timestamp}: {e}")
+
+    def apply_records(self, records, previous_texts, budget, load_previous=None):
+        """Обновляет историю по записям DataStore.prepare (поток записи, до записи самих данных)."""
+        for rec in records:
+            if rec["op"] == "note" and "text" in rec["note"]:
+                ts, text = rec["note"]["timestamp"], rec["note"]["text"]
+                previous = previous_texts.get(ts)
+                if previous is None and load_previous is not None and not os.path.exists(self._path(ts)):
+                    previous = load_previous(ts)  # нужен только для первой версии
+                if previous == text:
+                    continue  # текст не менялся (например, заметку только закрепили)
+                self.record(ts, text, previous, budget)
+            elif rec["op"] == "note_del":
+                self.forget(rec["ts"])
+
+# --- Поисковые индексы ---
+
+class NoteSearchIndex:
+    """
+    Индекс заметок для поиска "по подстроке": триграмма -> множество timestamp
+    (запросы от трех символов) и слово -> множество timestamp (короткие запросы).
+    Дает только кандидатов; окончательная проверка подстрокой остается за вызывающим.
+    Строится порциями (build_step) в простое UI; пока индекс не готов, search возвращает None.
+    Выключенный индекс (enabled = False) ничего не хранит: тексты заметок тогда не в памяти,
+    и кандидатов дает хранилище.
+    """
+    WORD_RE = re.compile(r'\w+')
+
+    def __init__(self):
+        self.enabled = True
+        self.clear()
+
+    def clear(self):
+        self._haystacks = {}  # timestamp -> строка, по которой ищем
+        self._pending = set()  # timestamp, еще не попавшие в индекс
+        self._postings = {}  # слово -> {timestamp}
+        self._grams = {}  # триграмма -> {timestamp}
+        self._vocab = []  # отсортированный словарь для поиска по префиксу
+        self._vocab_dirty = False
+
+    @staticmethod
+    def _haystack(timestamp, text):
+        # Та же строка, по которой filter_notes проверяет подстроку
+        return (timestamp + ' ' + text).lower()
+
+    @staticmethod
+    def _trigrams(s):
+        return {s[i:i + 3] for i in range(len(s) - 2)}
+
+    def rebuild(self, notes):
+        self.clear()
+        if not self.enabled: return
+        for note in notes:
+            if ts := note.get("timestamp", ""):
+                self._haystacks[ts] = self._haystack(ts, note.get("text", ""))
+        self._pending = set(self._haystacks)
+
+    def is_ready(self):
+        return not self._pending
+
+    def build_step(self, limit=50):
+        """Индексирует до limit заметок. Возвращает True, когда индекс готов."""
+        for _ in range(min(limit, len(self._pending))):
+            ts = self._pending.pop()
+            self._index(ts, self._haystacks[ts], add=True)
+        return not self._pending
+
+    def _index(self, timestamp, haystack, add):
+        for table, keys in ((self._grams, self._trigrams(haystack)), (self._postings, set(self.WORD_RE.findall(haystack)))):
+            for key in keys:
+                bucket = table.get(key)
+                if add:
+                    if bucket is None:
+                        table[key] = {timestamp}
+                        if table is self._postings: self._vocab_dirty = True
+                    else:
+                        bucket.add(timestamp)
+                elif bucket is not None:
+                    bucket.discard(timestamp)
+                    if not bucket:
+                        del table[key]
+                        if table is self._postings: self._vocab_dirty = True
+
+    def update(self, timestamp, text):
+        if not timestamp or not self.enabled: return
+        haystack = self._haystack(timestamp, text)
+        old = self._haystacks.get(timestamp)
+        if old == haystack: return
+        self._haystacks[timestamp] = haystack
+        if timestamp in self._pending: return
+        if old is not None:
+            self._index(timestamp, old, add=False)
+        self._index(timestamp, haystack, add=True)
+
+    def remove(self, timestamp):
+        old = self._haystacks.pop(timestamp, None)
+        if timestamp in self._pending:
+            self._pending.discard(timestamp)
+        elif old is not None:
+            self._index(timestamp, old, add=False)
+
+    def _sorted_vocab(self):
+        if self._vocab_dirty:
+            self._vocab = sorted(self._postings)
+            self._vocab_dirty = False
+        return self._vocab
+
+    def _matching_words(self, fragment, at_start, at_end):
+        # Слово целиком, префикс, суффикс или произвольная часть слова
+        if at_start and at_end:
+            return [fragment] if fragment in self._postings else []
+        if at_start:
+            vocab = self._sorted_vocab()
+            i = bisect.bisect_left(vocab, fragment)
+            out = []
+            while i < len(vocab) and vocab[i].startswith(fragment):
+                out.append(vocab[i])
+                i += 1
+            return out
+        if at_end:
+            return [w for w in self._postings if w.endswith(fragment)]
+        return [w for w in self._postings if fragment in w]
+
+    def search(self, query):
+        """
+        Множество timestamp заметок, которые могут содержать query (уже в нижнем регистре),
+        или None, если индекс выключен, еще строится или ничего не отсекает.
+        """
+        if self._pending or not self.enabled:
+            return None
+        if len(query) >= 3:
+            return self._search_trigrams(query)
+        spans = [(m.group(), m.start(), m.end()) for m in self.WORD_RE.finditer(query)]
+        if not spans:
+            return None
+        result = None
+        # Ищем сначала по самым длинным фрагментам — у них меньше всего совпадений
+        for fragment, start, end in sorted(spans, key=lambda s: -len(s[0])):
+            at_start = start > 0
+            at_end = end < len(query)
+            notes = set()
+            for word in self._matching_words(fragment, at_start, at_end):
+                notes |= self._postings[word]
+            result = notes if result is None else result & notes
+            if not result:
+                return set()
+        return result
+
+    def _search_trigrams(self, query):
+        # Пересекаем от самых редких триграмм к частым
+        buckets = sorted((self._grams.get(g, set()) for g in self._trigrams(query)), key=len)
+        result = set(buckets[0])
+        for bucket in buckets[1:]:
+            if not result: break
+            result &= bucket
+        return result
+
+class TagIndex:
+    """Индекс тегов: тег -> множество timestamp заметок. Обновляется по разнице старых и новых тегов заметки."""
+    TAG_RE = re.compile(r'#(\w+)')
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._notes_by_tag = {}  # тег -> {timestamp}
+        self._tags_by_note = {}  # timestamp -> {тег}
+
+    @classmethod
+    def find_tags(cls, text):
+        return set(cls.TAG_RE.findall(text))
+
+    def rebuild(self, notes):
+        self.clear()
+        for note in notes:
+            if isinstance(note, LazyNote) and not note.has_text():
+                # Теги незагруженной заметки берем из метаданных, не читая текст
+                self._set_tags(note.get("timestamp", ""), note.tags)
+            else:
+                self.update(note.get("timestamp", ""), note.get("text", ""))
+
+    def update(self, timestamp, text):
+        """Возвращает True, если набор тегов заметки изменился."""
+        return self._set_tags(timestamp, self.find_tags(text))
+
+    def _set_tags(self, timestamp, new_tags):
+        if not timestamp: return False
+        old_tags = self._tags_by_note.get(timestamp, set())
+        if new_tags == old_tags:
+            return False
+        for tag in old_tags - new_tags:
+            self._discard(tag, timestamp)
+        for tag in new_tags - old_tags:
+            self._notes_by_tag.setdefault(tag, set()).add(timestamp)
+        if new_tags:
+            self._tags_by_note[timestamp] = new_tags
+        else:
+            self._tags_by_note.pop(timestamp, None)
+        return True
+
+    def remove(self, timestamp):
+        """Возвращает True, если у удаленной заметки были теги."""
+        old_tags = self._tags_by_note.pop(timestamp, set())
+        for tag in old_tags:
+            self._discard(tag, timestamp)
+        return bool(old_tags)
+
+    def _discard(self, tag, timestamp):
+        bucket = self._notes_by_tag.get(tag)
+        if bucket is None: return
+        bucket.discard(timestamp)
+        if not bucket:
+            del self._notes_by_tag[tag]
+
+    def tags(self):
+        return set(self._notes_by_tag)
+
+    def notes_with(self, tag):
+        return self._notes_by_tag.get(tag, set())
+
+    def counts(self):
+        return {tag: len(notes) for tag, notes in self._notes_by_tag.items()}
+
 # --- Вспомогательные классы UI ---
 
 class ThemedLineEdit(QLineEdit):
@@ -164,16 +1658,68 @@ class ThemedInputDialog(QDialog):
     def get_text(self):
         return self.input_field.text()
         
+class WordCounter(QObject):
+    """
+    Счетчик слов документа. По contentsChange пересчитываются только затронутые блоки (абзацы),
+    счетчики остальных блоков хранятся списком по номеру блока. Итог совпадает с
+    len(document.toPlainText().split()): слова не переходят через границы блоков.
+    """
+    changed = pyqtSignal(int)
+
+    def __init__(self, document, parent=None):
+        super().__init__(parent)
+        self.document = document
+        self.total = 0
+        self._counts = []  # номер блока -> число слов
+        document.documentLayout()  # без раскладки QTextDocument не шлет contentsChange
+        document.contentsChange.connect(self._on_contents_change)
+        self.recount()
+
+    def recount(self):
+        counts = []
+        block = self.document.begin()
+        while block.isValid():
+            counts.append(len(block.text().split()))
+            block = block.next()
+        self._counts = counts
+        self._set_total(sum(counts))
+
+    def _set_total(self, total):
+        if total != self.total:
+            self.total = total
+            self.changed.emit(total)
+
+    def _on_contents_change(self, position, removed, added):
+        doc = self.document
+        # Qt иногда сообщает added на символ больше длины документа
+        first = doc.findBlock(position)
+        last = doc.findBlock(min(position + added, doc.characterCount() - 1))
+        start, end = first.blockNumber(), last.blockNumber()
+        # Блоки до start не менялись; было old_span блоков на месте нынешних start..end
+        old_span = (end - start + 1) - (doc.blockCount() - len(self._counts))
+        if start < 0 or old_span < 0 or start + old_span > len(self._counts):
+            self.recount()
+            return
+        new_counts = []
+        block = first
+        while block.isValid() and block.blockNumber() <= end:
+            new_counts.append(len(block.text().split()))
+            block = block.next()
+        total = self.total - sum(self._counts[start:start + old_span]) + sum(new_counts)
+        self._counts[start:start + old_span] = new_counts
+        self._set_total(total)
+
 # --- Локализация ---
 class LocalizationManager(QObject):
     language_changed = pyqtSignal()
 
-    def __init__(self, default_lang='ru_RU'):
+    def __init__(self, default_lang='ru_RU', base_path=None):
         super().__init__()
-        if getattr(sys, 'frozen', False):
-            base_path = os.path.dirname(sys.executable)
-        else:
-            base_path = os.path.dirname(os.path.abspath(__file__))
+        if base_path is None:
+            if getattr(sys, 'frozen', False):
+                base_path = os.path.dirname(sys.executable)
+            else:
+                base_path = os.path.dirname(os.path.abspath(__file__))
         self.locales_dir = os.path.join(base_path, "locales")
         self.translations = {}
         self._ensure_locales_exist()
@@ -194,6 +1740,7 @@ class LocalizationManager(QObject):
                 "notes_editor_label": "Редактор заметок:", "save_button": "Сохранить", "new_note_button": "Новая",
                 "zen_button": "Zen", "search_placeholder": "Поиск по тексту...", "all_tags_combo": "Все теги",
                 "new_note_placeholder": "Начните писать...", "unsaved_changes_status": "Несохраненные изменения...", "data_saved_status": "Данные сохранены",
+                "backup_created_status": "Резервная копия создана", "backup_failed_status": "Не удалось создать резервную копию",
                 "word_count_label": "Слов", "pomodoro_label": "Pomodoro:", "pomodoro_start_btn": "Старт",
                 "pomodoro_pause_btn": "Пауза", "pomodoro_reset_btn": "Сброс", "about_menu": "О программе...",
                 "export_menu": "Экспорт заметок в Markdown...", "restore_menu": "Восстановить из резервной копии...", "exit_menu": "Выход",
@@ -213,6 +1760,9 @@ class LocalizationManager(QObject):
                 "settings_align_justify": "По ширине", "settings_padding_horiz": "Гор. отступ (%):", "settings_padding_vert": "Верт. отступ (%):",
                 "settings_first_line_indent": "Отступ 1-й строки (px):", "task_menu_edit": "Редактировать...",
                 "task_menu_toggle_completed": "Отметить/Снять отметку", "note_pin_menu": "Закрепить", "note_unpin_menu": "Открепить",
+                "note_history_menu": "История версий...", "note_history_title": "История версий",
+                "note_history_restore_btn": "Вернуть эту версию", "note_history_current": "текущая",
+                "note_history_empty": "Для этой заметки еще нет сохраненных версий.",
                 "list_management_tooltip": "Клик правой кнопкой для управления списками", "open_window_menu": "Открыть оконный режим…",
                 "open_window_tooltip": "Открыть в оконном режиме", "left_column_toggle": "Список", "left_column_tooltip": "Показать/скрыть список заметок",
                 "right_column_toggle": "Задачи", "right_column_tooltip": "Показать/скрыть список задач", "to_panel_button": "⇦ Панель",
@@ -224,6 +1774,11 @@ class LocalizationManager(QObject):
                 "tree_confirm_delete_folder": "Удалить папку '{name}' со всем содержимым?", "settings_audio_folder_label": "Папка музыки:",
                 "audio_toggle_tooltip": "Музыка", "audio_prev": "Предыдущий", "audio_next": "Следующий", "audio_play": "Воспроизвести",
                 "audio_pause": "Пауза", "audio_stop": "Стоп", "audio_volume": "Громкость", "settings_zen_audio_folder_label": "Музыка Zen:",
+                "audio_scan_started": "Поиск музыки...", "audio_scan_progress": "Файлов: {seen}, добавлено: {added}",
+                "audio_scan_cancel": "Остановить добавление папки",
+                "settings_audio_crossfade_label": "Плавный переход треков:",
+                "settings_history_budget_label": "История версий заметки, не больше:",
+                "settings_history_budget_unlimited": "без ограничения",
                 "new_note_title": "Новая заметка", "folder_description": "Описание папки", "note_editing": "Редактирование заметки",
                 "settings_zen_light_theme_bg_label": "Фон Zen (светлая тема):",
                 "settings_zen_dark_theme_bg_label": "Фон Zen (тёмная тема):",
@@ -245,6 +1800,10 @@ class LocalizationManager(QObject):
                 "backup_no_copies": "Резервные копии не найдены.",
                 "backup_confirm_restore": "Вы уверены, что хотите восстановить данные из копии от {date}?",
                 "backup_confirm_delete": "Вы уверены, что хотите удалить эту резервную копию?",
+                "backup_item_details": "{date} — заметок: {notes}, {size}",
+                "db_recovered_title": "База данных повреждена",
+                "db_recovered_from_backup": "Файл {db} поврежден и отложен как {aside}.\nДанные восстановлены из резервной копии от {date}; более поздние изменения могли быть потеряны.",
+                "db_recovered_from_json": "Файл {db} поврежден и отложен как {aside}.\nДанные загружены из {json} (сохранен {date}) и могут быть устаревшими. Проверьте заметки; при необходимости восстановите данные из резервной копии.",
                 "settings_min_width_left": "Мин. ширина левой колонки:",
                 "settings_min_width_right": "Мин. ширина правой колонки:",
                 "settings_padding_top": "Отступ сверху (px):",
@@ -267,6 +1826,7 @@ class LocalizationManager(QObject):
                 "delete_note_tooltip": "Delete note", "delete_task_tooltip": "Delete task", "notes_editor_label": "Notes Editor:", "save_button": "Save",
                 "new_note_button": "New", "zen_button": "Zen", "search_placeholder": "Search...", "all_tags_combo": "All tags",
                 "new_note_placeholder": "Start writing...", "unsaved_changes_status": "Unsaved changes...", "data_saved_status": "Data saved",
+                "backup_created_status": "Backup created", "backup_failed_status": "Backup failed",
                 "word_count_label": "Words", "pomodoro_label": "Pomodoro:", "pomodoro_start_btn": "Start", "pomodoro_pause_btn": "Pause",
                 "pomodoro_reset_btn": "Reset", "about_menu": "About...", "export_menu": "Export Notes to Markdown...", "restore_menu": "Restore from Backup...",
                 "exit_menu": "Exit", "add_list_menu": "Add List...", "rename_list_menu": "Rename List...", "delete_list_menu": "Delete List...",
@@ -281,6 +1841,9 @@ class LocalizationManager(QObject):
                 "settings_font_color_label": "Font Color:", "settings_alignment_label": "Alignment:", "settings_align_left": "Left", "settings_align_justify": "Justify",
                 "settings_padding_horiz": "Horiz. Padding (%):", "settings_padding_vert": "Vert. Padding (%):", "settings_first_line_indent": "1st line indent (px):",
                 "task_menu_edit": "Edit...", "task_menu_toggle_completed": "Toggle completed", "note_pin_menu": "Pin", "note_unpin_menu": "Unpin",
+                "note_history_menu": "Version history...", "note_history_title": "Version history",
+                "note_history_restore_btn": "Restore this version", "note_history_current": "current",
+                "note_history_empty": "No saved versions of this note yet.",
                 "list_management_tooltip": "Right-click to manage lists", "open_window_menu": "Open window mode…", "open_window_tooltip": "Open in window mode",
                 "left_column_toggle": "List", "left_column_tooltip": "Show/hide notes list", "right_column_toggle": "Tasks", "right_column_tooltip": "Show/hide tasks",
                 "to_panel_button": "⇦ Panel", "to_panel_tooltip": "Open side panel", "tags_label": "Tags:", "to_task_btn": "➕ to tasks",
@@ -291,6 +1854,11 @@ class LocalizationManager(QObject):
                 "tree_confirm_delete_folder": "Delete folder '{name}' with all contents?",
                 "settings_audio_folder_label": "Music folder:", "audio_toggle_tooltip": "Music", "audio_prev": "Previous", "audio_next": "Next",
                 "audio_play": "Play", "audio_pause": "Pause", "audio_stop": "Stop", "audio_volume": "Volume", "settings_zen_audio_folder_label": "Music Zen:",
+                "audio_scan_started": "Searching for music...", "audio_scan_progress": "Files: {seen}, added: {added}",
+                "audio_scan_cancel": "Stop adding folder",
+                "settings_audio_crossfade_label": "Track crossfade:",
+                "settings_history_budget_label": "Note version history, up to:",
+                "settings_history_budget_unlimited": "unlimited",
                 "new_note_title": "New Note", "folder_description": "Folder description", "note_editing": "Editing note",
                 "settings_zen_light_theme_bg_label": "Zen BG (light theme):",
                 "settings_zen_dark_theme_bg_label": "Zen BG (dark theme):",
@@ -312,6 +1880,10 @@ class LocalizationManager(QObject):
                 "backup_no_copies": "No backups found.",
                 "backup_confirm_restore": "Are you sure you want to restore data from the copy dated {date}?",
                 "backup_confirm_delete": "Are you sure you want to delete this backup?",
+                "backup_item_details": "{date} — notes: {notes}, {size}",
+                "db_recovered_title": "Database is damaged",
+                "db_recovered_from_backup": "The file {db} is damaged and was set aside as {aside}.\nData was restored from the backup dated {date}; later changes may have been lost.",
+                "db_recovered_from_json": "The file {db} is damaged and was set aside as {aside}.\nData was loaded from {json} (saved {date}) and may be out of date. Check your notes and restore from a backup if needed.",
                 "settings_min_width_left": "Min. left column width:",
                 "settings_min_width_right": "Min. right column width:",
                 "settings_padding_top": "Padding Top (px):",
@@ -793,6 +2365,105 @@ class TasksPanel(QWidget):
             except (ValueError, IndexError) as e:
                 print(f"Error deleting list: {e}")
 
+# --- Модель списка заметок ---
+
+class NotesListModel(QAbstractListModel):
+    """Список заметок (словари) для QListView; строки ищутся по timestamp."""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._notes = []
+        self._rows = {}  # timestamp -> номер строки
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._notes)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        note = self._notes[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return f"{note.get('timestamp', '')}{' 📌' if note.get('pinned', False) else ''}"
+        if role == Qt.ItemDataRole.UserRole:
+            return note
+        if role == Qt.ItemDataRole.SizeHintRole:
+            return QSize(0, 32)
+        return None
+
+    def set_notes(self, notes):
+        self.beginResetModel()
+        self._notes = list(notes)
+        self._rows = {n.get("timestamp"): i for i, n in enumerate(self._notes)}
+        self.endResetModel()
+
+    def notes(self):
+        return self._notes
+
+    def note(self, timestamp):
+        row = self._rows.get(timestamp)
+        return self._notes[row] if row is not None else None
+
+    def index_of(self, timestamp):
+        row = self._rows.get(timestamp)
+        return self.index(row, 0) if row is not None else QModelIndex()
+
+    def add_note(self, note):
+        row = len(self._notes)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._notes.append(note)
+        self._rows[note.get("timestamp")] = row
+        self.endInsertRows()
+
+    def remove_note(self, timestamp):
+        row = self._rows.get(timestamp)
+        if row is None:
+            return False
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._notes[row]
+        del self._rows[timestamp]
+        for i in range(row, len(self._notes)):
+            self._rows[self._notes[i].get("timestamp")] = i
+        self.endRemoveRows()
+        return True
+
+    def note_changed(self, timestamp):
+        index = self.index_of(timestamp)
+        if index.isValid():
+            self.dataChanged.emit(index, index)
+
+
+class NotesFilterProxyModel(QSortFilterProxyModel):
+    """Порядок: закрепленные сверху, затем по убыванию timestamp. Фильтр — готовое множество timestamp."""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._visible = None  # None — показывать все
+        self.setDynamicSortFilter(True)
+
+    def set_visible_timestamps(self, timestamps):
+        self._visible = timestamps
+        self.invalidateFilter()
+
+    def reveal(self, timestamp):
+        # Новая заметка остается видимой до следующей фильтрации
+        if self._visible is not None:
+            self._visible.add(timestamp)
+
+    def visible_timestamps(self):
+        return self._visible
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if self._visible is None:
+            return True
+        note = self.sourceModel().notes()[source_row]
+        return note.get("timestamp") in self._visible
+
+    def lessThan(self, left, right):
+        notes = self.sourceModel().notes()
+        a, b = notes[left.row()], notes[right.row()]
+        a_pinned, b_pinned = a.get("pinned", False), b.get("pinned", False)
+        if a_pinned != b_pinned:
+            return a_pinned
+        return a.get("timestamp", "") > b.get("timestamp", "")
+
 class NotesPanel(QWidget):
     tags_updated = pyqtSignal(set)
     zen_mode_requested = pyqtSignal(str, str)
@@ -805,10 +2476,18 @@ class NotesPanel(QWidget):
         self.data_manager = data_manager
         self.loc = data_manager.loc_manager
         self.main_parent = parent
-        self.current_note_item = None
+        self.current_note_ts = None
+        self.ignore_selection_changes = False
         self.saved_text = ""
+        self._saved_digest = hashlib.sha1(b"").digest()  # хеш saved_text.strip()
         self.is_dirty = False
         self.all_tags = set()
+        self.search_index = NoteSearchIndex()
+        self.tag_index = TagIndex()
+        # Индекс поиска достраивается порциями, пока UI простаивает
+        self.search_index_timer = QTimer(self)
+        self.search_index_timer.setInterval(0)
+        self.search_index_timer.timeout.connect(self._build_search_index_step)
         
         layout = QVBoxLayout(self)
         layout.setContentsMargins(0, 5, 0, 0)
@@ -850,16 +2529,24 @@ class NotesPanel(QWidget):
         filter_layout.addWidget(self.search_input, 1)
         filter_layout.addWidget(self.tag_filter_combo)
 
-        self.note_list_widget = QListWidget()
-        self.note_list_widget.currentItemChanged.connect(self.display_selected_note)
-        self.note_list_widget.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
-        self.note_list_widget.customContextMenuRequested.connect(self.show_note_context_menu)
+        self.notes_model = NotesListModel(self)
+        self.notes_proxy = NotesFilterProxyModel(self)
+        self.notes_proxy.setSourceModel(self.notes_model)
+        self.notes_proxy.sort(0)
+        self.note_list_view = QListView()
+        self.note_list_view.setObjectName("NotesList")
+        self.note_list_view.setUniformItemSizes(True)
+        self.note_list_view.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.note_list_view.setModel(self.notes_proxy)
+        self.note_list_view.selectionModel().currentChanged.connect(self.display_selected_note)
+        self.note_list_view.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        self.note_list_view.customContextMenuRequested.connect(self.show_note_context_menu)
 
         layout.addWidget(self.notes_editor_label)
         layout.addWidget(self.notes_editor, 1)
         layout.addLayout(button_layout)
         layout.addLayout(filter_layout)
-        layout.addWidget(self.note_list_widget, 1)
+        layout.addWidget(self.note_list_view, 1)
 
         self.autosave_timer = QTimer(self)
         interval_ms = max(2, self.data_manager.get_settings().get("autosave_interval_sec", 10)) * 1000
@@ -899,161 +2586,219 @@ class NotesPanel(QWidget):
         return QMenu(self)
 
     def show_note_context_menu(self, pos):
-        item = self.note_list_widget.itemAt(pos)
-        if not item: return
+        note_data = self._note_at(self.note_list_view.indexAt(pos))
+        if not note_data: return
+        ts = note_data.get("timestamp")
         menu = self._create_themed_menu()
-        pin = item.data(Qt.ItemDataRole.UserRole).get("pinned", False)
+        pin = note_data.get("pinned", False)
         pin_text = self.loc.get("note_unpin_menu") if pin else self.loc.get("note_pin_menu")
-        menu.addAction(pin_text, lambda: self.toggle_pin(item))
+        menu.addAction(pin_text, lambda: self.toggle_pin(ts))
+        menu.addAction(self.loc.get("note_history_menu", "История версий..."), lambda: self.show_note_history(ts))
         menu.addSeparator()
         delete_action = QAction(self.loc.get("delete_note_tooltip"), self)
-        delete_action.triggered.connect(lambda: self.perform_delete_note(item))
+        delete_action.triggered.connect(lambda: self.perform_delete_note(ts))
         menu.addAction(delete_action)
-        menu.exec(self.note_list_widget.mapToGlobal(pos))
+        menu.exec(self.note_list_view.mapToGlobal(pos))
     
     def find_tags(self, text):
-        return set(re.findall(r'#(\w+)', text))
-
-    def update_list_item_title_text(self, list_item):
-        note_data = list_item.data(Qt.ItemDataRole.UserRole) or {}
-        ts = note_data.get("timestamp", "")
-        pinned = note_data.get("pinned", False)
-        list_item.setText(f"{ts}{' 📌' if pinned else ''}")
-
-    def sort_note_items(self):
-        lw = self.note_list_widget
-        items_data = []
-        for i in range(lw.count()):
-            it = lw.item(i)
-            nd = it.data(Qt.ItemDataRole.UserRole) or {}
-            items_data.append(nd)
-        
-        lw.clear()
-        items_data.sort(key=lambda d: d.get("timestamp", ""), reverse=True)
-        items_data.sort(key=lambda d: not d.get("pinned", False))
-        
-        for note_data in items_data:
-            self.add_note_item(note_data)
+        return TagIndex.find_tags(text)
 
-    def toggle_pin(self, item):
-        if not item: return
-        nd = item.data(Qt.ItemDataRole.UserRole) or {}
+    def _on_tags_changed(self):
+        tags = self.tag_index.tags()
+        if tags != self.all_tags:
+            self.all_tags = tags
+            self.update_tag_filter()
+        self.tags_updated.emit(self.all_tags)
+
+    def _note_at(self, proxy_index):
+        # Заметку берем прямо из модели: через QVariant обычный dict приходит копией
+        if not proxy_index.isValid(): return None
+        return self.notes_model.notes()[self.notes_proxy.mapToSource(proxy_index).row()]
+
+    def _proxy_index(self, timestamp):
+        return self.notes_proxy.mapFromSource(self.notes_model.index_of(timestamp)) if timestamp else QModelIndex()
+
+    def _set_current_silently(self, timestamp):
+        # Выделение в списке без загрузки заметки в редактор
+        was_ignoring = self.ignore_selection_changes
+        self.ignore_selection_changes = True
+        try:
+            index = self._proxy_index(timestamp)
+            if index.isValid():
+                self.note_list_view.setCurrentIndex(index)
+            else:
+                self.note_list_view.selectionModel().clear()
+        finally:
+            self.ignore_selection_changes = was_ignoring
+
+    def toggle_pin(self, timestamp):
+        nd = self.notes_model.note(timestamp)
+        if nd is None: return
         nd["pinned"] = not nd.get("pinned", False)
-        item.setData(Qt.ItemDataRole.UserRole, nd)
-        self.update_list_item_title_text(item)
-        self.sort_note_items()
+        # Прокси сам переставит строку (dynamicSortFilter)
+        self.notes_model.note_changed(timestamp)
         self.data_manager.save_app_data()
     
     def update_tag_filter(self):
         self.retranslate_ui()
 
+    def _build_search_index_step(self):
+        if self.search_index.build_step():
+            self.search_index_timer.stop()
+
     def filter_notes(self):
         search_text = self.search_input.text().lower()
         selected_tag_item_text = self.tag_filter_combo.currentText()
         is_all_tags_selected = selected_tag_item_text == self.loc.get("all_tags_combo")
-        
-        for i in range(self.note_list_widget.count()):
-            item = self.note_list_widget.item(i)
-            note_data = item.data(Qt.ItemDataRole.UserRole)
-            note_text = note_data.get('text', '')
-            note_timestamp = note_data.get('timestamp', '')
-            haystack = (note_timestamp + ' ' + note_text).lower()
-            
-            text_match = search_text in haystack
-            tag_match = is_all_tags_selected or (f"#{selected_tag_item_text}" in note_text)
-            
-            item.setHidden(not (text_match and tag_match))
+        tag_notes = None if is_all_tags_selected else self.tag_index.notes_with(selected_tag_item_text)
+        # Индексы отсекают заведомо неподходящие заметки, подстрока проверяется только у кандидатов
+        candidates = None
+        if search_text:
+            candidates = self.search_index.search(search_text)
+            if candidates is None and hasattr(self.data_manager, 'search_notes'):
+                candidates = self.data_manager.search_notes(search_text)
+        
+        visible = None
+        if search_text or tag_notes is not None:
+            if candidates is not None and tag_notes is not None:
+                pool = candidates & tag_notes
+            elif candidates is not None:
+                pool = candidates
+            elif tag_notes is not None:
+                pool = tag_notes
+            else:
+                pool = [n.get('timestamp', '') for n in self.notes_model.notes()]
+            visible = set()
+            for note_timestamp in pool:
+                note_data = self.notes_model.note(note_timestamp)
+                if note_data is None:
+                    continue
+                haystack = (note_timestamp + ' ' + note_data.get('text', '')).lower()
+                if search_text in haystack:
+                    visible.add(note_timestamp)
+        
+        was_ignoring = self.ignore_selection_changes
+        self.ignore_selection_changes = True
+        try:
+            self.notes_proxy.set_visible_timestamps(visible)
+        finally:
+            self.ignore_selection_changes = was_ignoring
+        # Фильтр не меняет открытую заметку, только ее выделение в списке
+        self._set_current_silently(self.current_note_ts)
+
+    def visible_timestamps(self):
+        visible = self.notes_proxy.visible_timestamps()
+        if visible is None:
+            return {n.get('timestamp') for n in self.notes_model.notes()}
+        return set(visible)
     
-    def display_selected_note(self, current_item, previous_item):
-        if previous_item and self.is_dirty:
+    def display_selected_note(self, current, previous=QModelIndex()):
+        if self.ignore_selection_changes:
+            return
+        if previous.isValid() and self.is_dirty:
             self.save_current_note()
-        if not current_item:
-            if self.current_note_item is not None:
+        note_data = self._note_at(current)
+        if not note_data:
+            if self.current_note_ts is not None:
                 self.clear_for_new_note(force=True)
             return
-        self.current_note_item = current_item
-        note_data = self.current_note_item.data(Qt.ItemDataRole.UserRole)
+        self.current_note_ts = note_data.get("timestamp")
         source_text = note_data.get("text", "")
         self.notes_editor.setPlainText(source_text)
-        self.saved_text = source_text
+        self._mark_saved(source_text)
         self.on_editor_text_changed()
     
     def save_current_note(self):
         text = self.notes_editor.toPlainText().strip()
-        if not self.current_note_item and not text:
+        note_data = self.notes_model.note(self.current_note_ts) if self.current_note_ts else None
+        if not note_data and not text:
             return
         
-        new_tags = self.find_tags(text)
-        if new_tags != self.all_tags:
-            self.all_tags.update(new_tags)
-            self.update_tag_filter()
-            self.tags_updated.emit(self.all_tags)
+        if note_data:
+            timestamp = note_data.get("timestamp", "")
+        else:
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
+        if self.tag_index.update(timestamp, text):
+            self._on_tags_changed()
 
         ts_emit = ""
-        if self.current_note_item:
-            note_data = self.current_note_item.data(Qt.ItemDataRole.UserRole)
+        if note_data:
             note_data["text"] = text
-            self.current_note_item.setData(Qt.ItemDataRole.UserRole, note_data)
-            ts_emit = note_data.get("timestamp", "")
+            self.notes_model.note_changed(timestamp)
+            ts_emit = timestamp
+            self.search_index.update(ts_emit, text)
         else:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
             note_data = {"timestamp": timestamp, "text": text, "pinned": False}
-            new_item = self.add_note_item(note_data)
-            self.current_note_item = new_item
-            self.note_list_widget.blockSignals(True)
-            self.note_list_widget.setCurrentItem(new_item)
-            self.note_list_widget.blockSignals(False)
+            self.search_index.update(timestamp, text)
+            self.add_note_item(note_data)
+            self.current_note_ts = timestamp
+            self._set_current_silently(timestamp)
             self.note_created.emit(timestamp)
             ts_emit = timestamp
 
-        self.saved_text = text
+        self._mark_saved(text)
         self.on_editor_text_changed()
         self.data_manager.save_app_data()
         if ts_emit:
             self.note_saved.emit(ts_emit)
     
     def load_notes(self, notes_data):
-        self.note_list_widget.clear()
-        self.all_tags.clear()
         if not isinstance(notes_data, list):
             notes_data = []
             
         for note in notes_data:
             note.setdefault("pinned", False)
-            self.add_note_item(note)
-            self.all_tags.update(self.find_tags(note.get("text", "")))
+        self.notes_model.set_notes(notes_data)
+        # Тексты в базе и читаются по требованию — в памяти индекс не строим, ищет хранилище
+        self.search_index.enabled = not (hasattr(self.data_manager, 'has_lazy_note_bodies') and self.data_manager.has_lazy_note_bodies())
+        self.tag_index.rebuild(notes_data)
+        self.all_tags = self.tag_index.tags()
+        self.search_index.rebuild(notes_data)
+        self.search_index_timer.start()
         
-        self.sort_note_items()
         self.update_tag_filter()
         self.tags_updated.emit(self.all_tags)
     
     def open_zen_mode(self):
         self.save_if_dirty()
         text = self.notes_editor.toPlainText()
-        timestamp = ""
-        if self.current_note_item:
-            timestamp = self.current_note_item.data(Qt.ItemDataRole.UserRole).get('timestamp', '')
+        timestamp = self.current_note_ts or ""
         self.zen_mode_requested.emit(text, timestamp)
     
+    def show_note_history(self, timestamp):
+        """Открывает историю версий; выбранная версия попадает в редактор как несохраненная правка."""
+        if self.is_dirty:
+            self.save_current_note()
+        self.data_manager.flush_saves()  # чтобы последняя правка уже была в истории
+        revisions = self.data_manager.note_history.revisions(timestamp)
+        if not revisions:
+            QMessageBox.information(self, self.loc.get("note_history_title", "История версий"),
+                                    self.loc.get("note_history_empty", "Для этой заметки еще нет сохраненных версий."))
+            return
+        dialog = NoteHistoryDialog(self, self.loc, revisions, self.data_manager.get_settings())
+        if not dialog.exec() or dialog.selected_text is None:
+            return
+        if self.current_note_ts != timestamp:
+            self.find_and_select_note_by_timestamp(timestamp)
+        if self.current_note_ts == timestamp:
+            self.notes_editor.setPlainText(dialog.selected_text)
+            self.notes_editor.document().setModified(True)  # setPlainText сбрасывает признак правки
+            self.on_editor_text_changed()
+
     def find_and_select_note_by_timestamp(self, timestamp):
-        if not timestamp: return
-        for i in range(self.note_list_widget.count()):
-            item = self.note_list_widget.item(i)
-            if item and item.data(Qt.ItemDataRole.UserRole) and item.data(Qt.ItemDataRole.UserRole).get('timestamp') == timestamp:
-                self.note_list_widget.setCurrentItem(item)
-                self.note_list_widget.scrollToItem(item, QAbstractItemView.ScrollHint.PositionAtCenter)
-                break
+        index = self._proxy_index(timestamp)
+        if index.isValid():
+            self.note_list_view.setCurrentIndex(index)
+            self.note_list_view.scrollTo(index, QAbstractItemView.ScrollHint.PositionAtCenter)
     
     def clear_for_new_note(self, force=False):
         if not force and self.is_dirty:
             self.save_current_note()
-        self.current_note_item = None
-        if self.note_list_widget.currentItem() is not None:
-            self.note_list_widget.blockSignals(True)
-            self.note_list_widget.setCurrentItem(None)
-            self.note_list_widget.blockSignals(False)
+        self.current_note_ts = None
+        if self.note_list_view.currentIndex().isValid():
+            self._set_current_silently(None)
         self.notes_editor.clear()
-        self.saved_text = ""
+        self._mark_saved("")
         self.on_editor_text_changed()
         self.notes_editor.setPlaceholderText(self.loc.get("new_note_placeholder"))
     
@@ -1061,46 +2806,57 @@ class NotesPanel(QWidget):
         self.save_current_note()
         self.clear_for_new_note(force=True)
     
+    def _mark_saved(self, text):
+        """Запоминает сохраненный текст; дальше признак правки ведет сам документ (isModified)."""
+        self.saved_text = text
+        self._saved_digest = hashlib.sha1(text.strip().encode('utf-8')).digest()
+        self.notes_editor.document().setModified(False)
+
     def on_editor_text_changed(self):
-        self.is_dirty = (self.notes_editor.toPlainText().strip() != self.saved_text.strip())
+        # O(1) на нажатие: без копирования текста. Отмена правок до сохраненного состояния
+        # сбрасывает isModified сама; набор и стирание того же текста проверяется хешем в save_if_dirty
+        self.is_dirty = self.notes_editor.document().isModified()
         self.data_manager.main_popup_on_data_changed()
     
     def save_if_dirty(self):
-        if self.is_dirty:
-            self.save_current_note()
+        if not self.is_dirty:
+            return
+        text = self.notes_editor.toPlainText().strip()
+        if hashlib.sha1(text.encode('utf-8')).digest() == self._saved_digest:
+            # Текст вернулся к сохраненному — писать нечего
+            self.notes_editor.document().setModified(False)
+            self.on_editor_text_changed()
+            return
+        self.save_current_note()
     
     def add_note_item(self, note_data):
-        list_item = QListWidgetItem()
-        list_item.setData(Qt.ItemDataRole.UserRole, note_data)
-        list_item.setSizeHint(QSize(0, 32))
-        self.update_list_item_title_text(list_item)
-        self.note_list_widget.addItem(list_item)
-        return list_item
+        self.notes_model.add_note(note_data)
+        self.notes_proxy.reveal(note_data.get("timestamp"))
     
-    def perform_delete_note(self, item_to_delete):
-        if not item_to_delete: return
-        ts = (item_to_delete.data(Qt.ItemDataRole.UserRole) or {}).get("timestamp")
-        if not ts: return
+    def _remove_note(self, timestamp):
+        if not self.notes_model.remove_note(timestamp):
+            return False
+        self.search_index.remove(timestamp)
+        if self.tag_index.remove(timestamp):
+            self._on_tags_changed()
+        return True
+
+    def perform_delete_note(self, timestamp):
+        if not timestamp or self.notes_model.note(timestamp) is None: return
 
-        if self.note_list_widget.currentItem() == item_to_delete:
+        if self.current_note_ts == timestamp:
             self.clear_for_new_note(force=True)
         
-        row = self.note_list_widget.row(item_to_delete)
-        if row >= 0:
-            self.note_list_widget.takeItem(row)
-            self.note_deleted.emit(ts)
-            self.data_manager.delete_note_by_timestamp_from_all_data(ts)
+        if self._remove_note(timestamp):
+            self.note_deleted.emit(timestamp)
+            self.data_manager.delete_note_by_timestamp_from_all_data(timestamp)
 
     def delete_note_by_timestamp(self, timestamp):
         if not timestamp: return
-        for i in range(self.note_list_widget.count()):
-            item = self.note_list_widget.item(i)
-            if item and item.data(Qt.ItemDataRole.UserRole) and item.data(Qt.ItemDataRole.UserRole).get("timestamp") == timestamp:
-                self.note_list_widget.takeItem(i)
-                return
+        self._remove_note(timestamp)
 
     def get_notes_data(self):
-        return [self.note_list_widget.item(i).data(Qt.ItemDataRole.UserRole) for i in range(self.note_list_widget.count())]
+        return self.notes_model.notes()
 
     def apply_editor_style(self, settings):
         font_family = settings.get("zen_font_family", "Georgia")
@@ -1305,6 +3061,27 @@ class SettingsPanel(QWidget):
         audio_row.addWidget(self.audio_browse_btn)
         audio_row.addWidget(self.audio_clear_btn)
         layout.addLayout(audio_row)
+
+        crossfade_row = QHBoxLayout()
+        self.crossfade_label = QLabel()
+        self.crossfade_spin = QSpinBox()
+        self.crossfade_spin.setRange(0, 12)
+        self.crossfade_spin.setSuffix(" s")
+        crossfade_row.addWidget(self.crossfade_label)
+        crossfade_row.addWidget(self.crossfade_spin)
+        crossfade_row.addStretch()
+        layout.addLayout(crossfade_row)
+
+        history_row = QHBoxLayout()
+        self.history_budget_label = QLabel()
+        self.history_budget_spin = QSpinBox()
+        self.history_budget_spin.setRange(0, 16384)
+        self.history_budget_spin.setSingleStep(64)
+        self.history_budget_spin.setSuffix(" KB")
+        history_row.addWidget(self.history_budget_label)
+        history_row.addWidget(self.history_budget_spin)
+        history_row.addStretch()
+        layout.addLayout(history_row)
         
         layout.addStretch()
         self.create_backup_btn = QPushButton()
@@ -1496,6 +3273,8 @@ class SettingsPanel(QWidget):
         self.min_width_right_spin.setValue(self.settings.get("window_min_width_right", 380))
         
         self.audio_path_edit.setText(self.settings.get("audio_folder", ""))
+        self.crossfade_spin.setValue(self.settings.get("audio_crossfade_sec", 0))
+        self.history_budget_spin.setValue(self.settings.get("note_history_budget_kb", 256))
         
         self.update_color_swatches()
         
@@ -1536,6 +3315,8 @@ class SettingsPanel(QWidget):
         self.audio_path_edit.editingFinished.connect(self.apply_changes)
         self.audio_browse_btn.clicked.connect(self._browse_audio_folder)
         self.audio_clear_btn.clicked.connect(self._clear_audio_folder)
+        self.crossfade_spin.valueChanged.connect(self.apply_changes)
+        self.history_budget_spin.valueChanged.connect(self.apply_changes)
         
         self.min_width_left_spin.valueChanged.connect(self.apply_changes)
         self.min_width_right_spin.valueChanged.connect(self.apply_changes)
@@ -1590,6 +3371,9 @@ class SettingsPanel(QWidget):
         self.audio_label.setText(self.loc.get("settings_audio_folder_label"))
         self.audio_browse_btn.setText(self.loc.get("settings_browse_btn"))
         self.audio_clear_btn.setText(self.loc.get("settings_clear_btn"))
+        self.crossfade_label.setText(self.loc.get("settings_audio_crossfade_label", "Плавный переход треков:"))
+        self.history_budget_label.setText(self.loc.get("settings_history_budget_label", "История версий заметки, не больше:"))
+        self.history_budget_spin.setSpecialValueText(self.loc.get("settings_history_budget_unlimited", "без ограничения"))
 
         self.create_backup_btn.setText(self.loc.get("settings_create_backup_now", "Создать бэкап сейчас"))
 
@@ -1752,6 +3536,8 @@ class SettingsPanel(QWidget):
         self.settings["editor_padding_right"] = self.padding_right_spin.value()
         
         self.settings["audio_folder"] = self.audio_path_edit.text().strip()
+        self.settings["audio_crossfade_sec"] = self.crossfade_spin.value()
+        self.settings["note_history_budget_kb"] = self.history_budget_spin.value()
         self.settings["window_min_width_left"] = self.min_width_left_spin.value()
         self.settings["window_min_width_right"] = self.min_width_right_spin.value()
         
@@ -1792,6 +3578,7 @@ class ZenModeWindow(QWidget):
         self.settings = settings
         self.loc = loc_manager
         self.data_manager = data_manager
+        self._background_css = ""  # фон окна; _update_styles дописывает к нему стили виджетов
         
         self.pomodoro_timer = QTimer(self)
         self.pomodoro_timer.timeout.connect(self.update_pomodoro)
@@ -1822,7 +3609,8 @@ class ZenModeWindow(QWidget):
         self.main_layout.addWidget(self.bottom_panel)
         
         self.editor.setPlainText(initial_text)
-        self.editor.textChanged.connect(self.update_word_count)
+        self.word_counter = WordCounter(self.editor.document(), self)
+        self.word_counter.changed.connect(self.update_word_count)
         
         self.exit_button = QPushButton(self)
         self.exit_button.setFixedSize(32, 32)
@@ -2063,9 +3851,7 @@ class ZenModeWindow(QWidget):
         self.pomodoro_label.setText(f"{mins:02d}:{secs:02d}")
 
     def update_word_count(self):
-        text = self.editor.toPlainText()
-        cnt = len(text.split()) if text else 0
-        self.word_count_label.setText(f"{self.loc.get('word_count_label')}: {cnt}")
+        self.word_count_label.setText(f"{self.loc.get('word_count_label')}: {self.word_counter.total}")
 
     def attach_global_audio_widget(self, controller, loc=None):
         self._global_audio_controller = controller
@@ -2163,10 +3949,13 @@ class ZenModeWindow(QWidget):
         
 
 
-        stylesheet = f"""
+        font_family = self.settings.get('zen_font_family')
+        font_size = self.settings.get('zen_font_size')
+        signature = (is_dark, editor_bg_rgba, font_family, font_size, editor_color, floating_fg)
+        stylesheet = cached_stylesheet("ZenModeWindow", signature, lambda: f"""
             QTextEdit {{
-                background-color: {editor_bg_rgba}; border: none; font-family: '{self.settings.get('zen_font_family')}';
-                font-size: {self.settings.get('zen_font_size')}pt; color: {editor_color};
+                background-color: {editor_bg_rgba}; border: none; font-family: '{font_family}';
+                font-size: {font_size}pt; color: {editor_color};
             }}
             QWidget#bottomPanel {{
                 background-color: transparent; border-top: 1px solid {border_color};
@@ -2186,8 +3975,9 @@ class ZenModeWindow(QWidget):
                 background-color: {"rgba(30,30,30,0.8)" if is_dark else "rgba(248,249,250,0.85)"};
                 border: 1px solid {border_color}; border-radius: 8px;
             }}
-        """
-        self.setStyleSheet(self.styleSheet() + stylesheet)
+        """)
+        # Фон + стили виджетов целиком; раньше стили дописывались к текущей таблице и она росла
+        apply_stylesheet(self, self._background_css + stylesheet)
         
         if self.global_audio_widget:
             self.global_audio_widget.apply_zen_style(
@@ -2221,11 +4011,11 @@ class ZenModeWindow(QWidget):
         bg_path = self.settings.get("zen_bg_path")
         if bg_path and os.path.exists(bg_path):
             safe_path = bg_path.replace('\\', '/')
-            self.setStyleSheet(f"QWidget#ZenModeWindow {{ background-image: url({safe_path}); background-position: center; background-repeat: no-repeat; background-attachment: fixed; }}")
+            self._background_css = f"QWidget#ZenModeWindow {{ background-image: url({safe_path}); background-position: center; background-repeat: no-repeat; background-attachment: fixed; }}"
         else:
             bg_key = "zen_dark_theme_bg" if is_dark else "zen_light_theme_bg"
             bg_color = self.settings.get(bg_key, "#1c1c1c" if is_dark else "#e9ecef")
-            self.setStyleSheet(f"QWidget#ZenModeWindow {{ background-color: {bg_color}; }}")
+            self._background_css = f"QWidget#ZenModeWindow {{ background-color: {bg_color}; }}"
 
         self._update_styles()
         self.update()
@@ -2466,14 +4256,14 @@ class MainPopup(QWidget):
         self.on_data_changed()
         self.set_status_saved()
 
-    def apply_theme(self, settings):
-        is_dark, accent, bg, text, list_text = theme_colors(settings)
+    @staticmethod
+    def _build_stylesheet(is_dark, accent, bg, text, list_text):
         comp_bg = QColor(bg).lighter(115).name() if is_dark else QColor(bg).darker(105).name()
         panel_bg = QColor(comp_bg).lighter(108).name() if is_dark else QColor(comp_bg).lighter(103).name()
         border = "#555" if is_dark else "#ced4da"
         qtool_hover = "rgba(255,255,255,0.1)" if is_dark else "rgba(0,0,0,0.06)"
         
-        stylesheet = f"""
+        return f"""
             QWidget#MainPopup {{ background-color:{bg}; }}
             QWidget#settingsOverlay {{ background: rgba(0,0,0,0.5); }}
             QWidget, QLabel {{ color:{text}; background-color:transparent; }}
@@ -2489,12 +4279,12 @@ class MainPopup(QWidget):
                 selection-background-color:{accent}; selection-color:white; outline:0px;
             }}
             
-            QListWidget{{ background-color:{comp_bg}; border:1px solid {border}; border-radius:6px; }} 
-            QListWidget:focus{{ outline:none; }}
-            QListWidget::item{{ color:{list_text}; padding:6px; border-radius:4px; }}
-            QListWidget::item:hover{{ background-color:rgba(128,128,128,0.15); }}
+            QListWidget, QListView#NotesList, QListView#Playlist{{ background-color:{comp_bg}; border:1px solid {border}; border-radius:6px; }} 
+            QListWidget:focus, QListView#NotesList:focus, QListView#Playlist:focus{{ outline:none; }}
+            QListWidget::item, QListView#NotesList::item, QListView#Playlist::item{{ color:{list_text}; padding:6px; border-radius:4px; }}
+            QListWidget::item:hover, QListView#NotesList::item:hover, QListView#Playlist::item:hover{{ background-color:rgba(128,128,128,0.15); }}
             QListWidget#TaskList::item:selected{{ background-color:transparent; color:{list_text}; }}
-            QListWidget::item:selected{{ background-color:{accent}; color:white; }}
+            QListWidget::item:selected, QListView#NotesList::item:selected, QListView#Playlist::item:selected{{ background-color:{accent}; color:white; }}
             
             QCheckBox{{ spacing:8px; color:{text}; }}
             QCheckBox::indicator{{
@@ -2527,7 +4317,10 @@ class MainPopup(QWidget):
             QSlider::handle:horizontal{{ background:{accent}; width:12px; margin:-2px; border-radius:3px; }}
             QSlider::sub-page:horizontal{{ background:{accent}; }}
         """
-        self.setStyleSheet(stylesheet)
+
+    def apply_theme(self, settings):
+        colors = theme_colors(settings)
+        apply_stylesheet(self, cached_stylesheet("MainPopup", colors, lambda: self._build_stylesheet(*colors)))
         
         self.audio_toggle_btn.setIcon(ThemedIconProvider.icon("note", settings, QSize(18, 18)))
         self.settings_toggle_btn.setIcon(ThemedIconProvider.icon("gear", settings, QSize(18, 18)))
@@ -2550,6 +4343,10 @@ class MainPopup(QWidget):
         self.status_label.setText(self.loc.get("data_saved_status"))
         self.status_label.setStyleSheet("color:#28a745;font-size:10px;margin-right:5px;")
 
+    def show_status_message(self, text):
+        self.status_label.setText(text)
+        self.status_label.setStyleSheet("color:#6c757d;font-size:10px;margin-right:5px;")
+
     def show_animated(self, position, from_left=False):
         if self.isVisible(): return
         screen_geo = QApplication.primaryScreen().availableGeometry()
@@ -2639,6 +4436,7 @@ class NotesTreeSidebar(QWidget):
         self.notes_panel = notes_panel
         self.pending_target_folder = None
         self._building = False
+        self._note_items = {}  # timestamp -> QTreeWidgetItem
         
         layout = QVBoxLayout(self)
         layout.setContentsMargins(0, 0, 0, 0)
@@ -2661,6 +4459,7 @@ class NotesTreeSidebar(QWidget):
         try:
             self.tree.model().blockSignals(True)
             self.tree.clear()
+            self._note_items = {}
             root = self.tree.invisibleRootItem()
             if tree_list:
                 for node in tree_list:
@@ -2685,14 +4484,13 @@ class NotesTreeSidebar(QWidget):
         return build(self.tree.invisibleRootItem())
 
     def _get_note_alias_from_cache(self, timestamp):
-        """Находит текст заметки в кеше и возвращает первую строку."""
-        all_notes = self.notes_panel.data_manager.get_all_notes_from_cache()
-        for note in all_notes:
-            if note.get("timestamp") == timestamp:
-                text = note.get("text", "").strip()
-                alias = text.split('\n', 1)[0].strip() if text else timestamp
-                return alias[:30] if len(alias) > 30 else alias
-        return timestamp # Если заметка не найдена
+        """Находит заметку в кеше и возвращает (первая строка, закреплена ли)."""
+        note = self.notes_panel.data_manager.get_note_from_cache(timestamp)
+        if note is None:
+            return timestamp, False # Если заметка не найдена
+        text = note.alias if isinstance(note, LazyNote) and not note.has_text() else note.get("text", "").strip()
+        alias = text.split('\n', 1)[0].strip() if text else ""
+        return (alias or timestamp)[:30], note.get("pinned", False)
 
     def _append_node(self, parent_item, node_data):
         node_type = node_data.get("type")
@@ -2708,29 +4506,19 @@ class NotesTreeSidebar(QWidget):
         elif node_type == "note":
             ts = node_data.get("timestamp", "")
             # ИЗМЕНЕНИЕ: Сразу устанавливаем правильное имя
-            alias = self._get_note_alias_from_cache(ts)
+            alias, _ = self._get_note_alias_from_cache(ts)
             item = QTreeWidgetItem(parent_item, [alias])
             item.setIcon(0, ThemedIconProvider.icon("file", settings))
             item.setData(0, Qt.ItemDataRole.UserRole, {"type": "note", "timestamp": ts})
             item.setFlags(item.flags() & ~Qt.ItemFlag.ItemIsDropEnabled | Qt.ItemFlag.ItemIsDragEnabled)
+            if ts: self._note_items[ts] = item
 
     def refresh_aliases(self):
         # Этот метод теперь обновляет иконки (закреплена/не закреплена)
-        ts_map = {}
-        all_notes = self.notes_panel.data_manager.get_all_notes_from_cache()
-        for note in all_notes:
-            ts = note.get("timestamp", "")
-            if ts:
-                text = note.get("text", "")
-                pinned = note.get("pinned", False)
-                alias = (text.strip().splitlines()[0] if text else "").strip()
-                if not alias:
-                    alias = ts
-                ts_map[ts] = (alias[:30], pinned) 
-        
         settings = self.notes_panel.data_manager.get_settings()
         pin_icon = ThemedIconProvider.icon("pin", settings)
         file_icon = ThemedIconProvider.icon("file", settings)
+        folder_icon = ThemedIconProvider.icon("folder", settings)
         
         def apply(parent_item):
                 for i in range(parent_item.childCount()):
@@ -2738,15 +4526,24 @@ class NotesTreeSidebar(QWidget):
                     md = ch.data(0, Qt.ItemDataRole.UserRole) or {}
                     if md.get("type") == "note":
                         ts = md.get("timestamp", "")
-                        if ts and ts in ts_map:
-                            alias, pinned = ts_map[ts]
+                        if ts and self.notes_panel.data_manager.get_note_from_cache(ts) is not None:
+                            alias, pinned = self._get_note_alias_from_cache(ts)
                             ch.setText(0, alias)
                             ch.setIcon(0, pin_icon if pinned else file_icon)
                     else:
-                        ch.setIcon(0, ThemedIconProvider.icon("folder", settings))
+                        ch.setIcon(0, folder_icon)
                         apply(ch)
         apply(self.tree.invisibleRootItem())
 
+    def refresh_alias(self, timestamp):
+        """Обновляет подпись и иконку одной заметки."""
+        item = self._find_note_item(timestamp)
+        if item is None or self.notes_panel.data_manager.get_note_from_cache(timestamp) is None: return
+        settings = self.notes_panel.data_manager.get_settings()
+        alias, pinned = self._get_note_alias_from_cache(timestamp)
+        item.setText(0, alias)
+        item.setIcon(0, ThemedIconProvider.icon("pin" if pinned else "file", settings))
+
     def _create_themed_menu(self):
         if self.main_window and hasattr(self.main_window, '_create_themed_menu'):
             return self.main_window._create_themed_menu()
@@ -2764,6 +4561,8 @@ class NotesTreeSidebar(QWidget):
                 menu.addAction(self.loc.get("tree_rename_folder"), lambda: self._rename_folder(item))
                 menu.addAction(self.loc.get("tree_delete_folder"), lambda: self._delete_folder(item))
             else:
+                ts = nd.get("timestamp")
+                menu.addAction(self.loc.get("note_history_menu", "История версий..."), lambda: self._show_note_history(item, ts))
                 menu.addAction(self.loc.get("tree_delete_note"), lambda: self._delete_note(item))
                 menu.addSeparator()
                 menu.addAction("Поднять на уровень выше", lambda: self._move_item_up(item))
@@ -2775,6 +4574,11 @@ class NotesTreeSidebar(QWidget):
             menu.addAction(self.loc.get("tree_new_folder"), lambda: self._create_folder(root))
         menu.exec(self.tree.viewport().mapToGlobal(pos))
         
+    def _show_note_history(self, item, timestamp):
+        # Сначала открываем заметку в редакторе, чтобы выбранная версия попала в нее
+        self.tree.setCurrentItem(item)
+        self.notes_panel.show_note_history(timestamp)
+
     def _move_item_up(self, item):
         if not item or not item.parent(): return
         current_parent = item.parent()
@@ -2839,18 +4643,20 @@ class NotesTreeSidebar(QWidget):
         if not ts: return
         parent = item.parent() or self.tree.invisibleRootItem()
         parent.removeChild(item)
+        self._note_items.pop(ts, None)
         self.note_deleted_from_tree.emit(ts)
         self.notes_panel.data_manager.delete_note_by_timestamp_from_all_data(ts)
 
-    def _find_note_item(self, timestamp: str, parent_item=None):
+    def _find_note_item(self, timestamp: str):
         if not timestamp: return None
-        if parent_item is None: parent_item = self.tree.invisibleRootItem()
-        for i in range(parent_item.childCount()):
-            it = parent_item.child(i)
-            nd = it.data(0, Qt.ItemDataRole.UserRole) or {}
-            if nd.get("type") == "note" and nd.get("timestamp") == timestamp: return it
-            if nd.get("type") == "folder":
-                if f := self._find_note_item(timestamp, it): return f
+        item = self._note_items.get(timestamp)
+        if item is None: return None
+        try:
+            # Элемент мог быть удален вместе с папкой
+            if item.treeWidget() is self.tree: return item
+        except RuntimeError:
+            pass
+        del self._note_items[timestamp]
         return None
 
     def _on_selection_changed(self):
@@ -2884,19 +4690,20 @@ class NotesTreeSidebar(QWidget):
         parent_item = self.pending_target_folder or self.tree.invisibleRootItem()
         self.clear_pending_folder()
         if self._find_note_item(timestamp):
-            self.refresh_aliases()
+            self.refresh_alias(timestamp)
             return
         self._append_node(parent_item, {"type": "note", "timestamp": timestamp})
         self.tree.expandItem(parent_item)
-        if new_item := self._find_note_item(timestamp, parent_item):
+        if new_item := self._find_note_item(timestamp):
             self.tree.setCurrentItem(new_item)
-        self.refresh_aliases()
+        self.refresh_alias(timestamp)
 
     def on_note_deleted(self, timestamp: str):
         if self._building or not timestamp: return
         if item_to_delete := self._find_note_item(timestamp):
             parent = item_to_delete.parent() or self.tree.invisibleRootItem()
             parent.removeChild(item_to_delete)
+            self._note_items.pop(timestamp, None)
 
     def _save(self):
         if self._building: return
@@ -2989,7 +4796,7 @@ class WindowMain(QWidget):
         left_layout.addLayout(lf)
         self.tree_sidebar = NotesTreeSidebar(self.notes_panel, self.loc, self, self)
         left_layout.addWidget(self.tree_sidebar, 1)
-        self.notes_panel.note_list_widget.hide()
+        self.notes_panel.note_list_view.hide()
         self.center_container = QWidget()
         self.center_container.setObjectName("cardContainer")
         self.center_container.setMinimumWidth(260)
@@ -3065,7 +4872,8 @@ class WindowMain(QWidget):
         self.settings_panel_main.hide()
         self.settings_panel_main.installEventFilter(self)
         self._setup_shortcuts()
-        self.notes_panel.notes_editor.textChanged.connect(self._update_word_count)
+        self.word_counter = WordCounter(self.notes_panel.notes_editor.document(), self)
+        self.word_counter.changed.connect(self._update_word_count)
         self.notes_panel.tags_updated.connect(self._rebuild_tag_chips)
         self.left_toggle.toggled.connect(self._on_left_toggle)
         self.right_toggle.toggled.connect(self._on_right_toggle)
@@ -3082,7 +4890,7 @@ class WindowMain(QWidget):
         self.notes_panel.note_created.connect(self.tree_sidebar.on_note_created)
         self.notes_panel.note_deleted.connect(self.tree_sidebar.on_note_deleted)
         self.tree_sidebar.note_deleted_from_tree.connect(self.notes_panel.delete_note_by_timestamp)
-        self.notes_panel.note_saved.connect(lambda ts: self.tree_sidebar.refresh_aliases())
+        self.notes_panel.note_saved.connect(self.tree_sidebar.refresh_alias)
         self._update_to_task_btn_state()
         self.notes_panel.notes_editor_label.hide()
         self.retranslate_ui()
@@ -3328,11 +5136,7 @@ class WindowMain(QWidget):
         if text: self.tasks_panel.add_task(text); self.data_manager.save_app_data()
         
     def _collect_tag_freq(self):
-        freq = {}
-        for note in self.data_manager.get_all_notes_from_cache():
-            for tag in self.notes_panel.find_tags(note.get("text", "")):
-                freq[tag] = freq.get(tag, 0) + 1
-        return freq
+        return self.notes_panel.tag_index.counts()
         
     def _rebuild_tag_chips(self, tags=None):
         while self.chips_layout.count():
@@ -3358,9 +5162,7 @@ class WindowMain(QWidget):
         ed.setFocus()
         
     def _update_word_count(self):
-        text = self.notes_panel.notes_editor.toPlainText().strip()
-        words = len(text.split()) if text else 0
-        self.word_count_label.setText(f"{self.loc.get('word_count_label')}: {words}")
+        self.word_count_label.setText(f"{self.loc.get('word_count_label')}: {self.word_counter.total}")
         
     def _update_to_task_btn_state(self):
         cursor = self.notes_panel.notes_editor.textCursor()
@@ -3371,13 +5173,7 @@ class WindowMain(QWidget):
         self.to_task_btn.setEnabled(bool(text))
         
     def _sync_tree_filter(self):
-        visible_ts = set()
-        for i in range(self.notes_panel.note_list_widget.count()):
-            it = self.notes_panel.note_list_widget.item(i)
-            if not it.isHidden():
-                if ts := (it.data(Qt.ItemDataRole.UserRole) or {}).get("timestamp"):
-                    visible_ts.add(ts)
-        self.tree_sidebar.apply_visibility(visible_ts)
+        self.tree_sidebar.apply_visibility(self.notes_panel.visible_timestamps())
         
     def retranslate_ui(self):
         self.tasks_panel.retranslate_ui()
@@ -3395,15 +5191,15 @@ class WindowMain(QWidget):
         self.settings_toggle_btn.setToolTip(self.loc.get("settings_title"))
         self.set_status_saved()
         
-    def apply_theme(self, settings):
-        is_dark, accent, bg, text, list_text = theme_colors(settings)
+    @staticmethod
+    def _build_stylesheet(is_dark, accent, bg, text, list_text):
         comp_bg = QColor(bg).lighter(115).name() if is_dark else QColor(bg).darker(105).name()
         panel_bg = QColor(comp_bg).lighter(108).name() if is_dark else QColor(comp_bg).lighter(103).name()
         border = "#555" if is_dark else "#ced4da"
         qtool_hover = "rgba(255,255,255,0.1)" if is_dark else "rgba(0,0,0,0.06)"
         zebra1 = "rgba(0,0,0,0.02)" if not is_dark else "rgba(255,255,255,0.02)"
         
-        stylesheet = f"""
+        return f"""
             QWidget#MainWindow {{ background-color:{bg}; }}
             QWidget#settingsOverlay, QFrame#resizeOverlay {{ background: rgba(0,0,0,0.5); }}
             QFrame#resizeOverlay QLabel {{ color: white; font-size: 16pt; font-weight: bold; background: transparent; }}
@@ -3414,7 +5210,7 @@ class WindowMain(QWidget):
             QWidget#cardContainer, QFrame#audioWidgetContainer {{
                 background-color:{panel_bg}; border:1px solid {border}; border-radius:8px;
             }}
-            QLineEdit, QTextEdit, QComboBox, QListWidget, QTreeWidget#NotesTree {{
+            QLineEdit, QTextEdit, QComboBox, QListWidget, QListView#Playlist, QTreeWidget#NotesTree {{
                 background-color:{comp_bg}; border:1px solid {border};
                 border-radius:6px; padding:6px;
             }}
@@ -3422,14 +5218,14 @@ class WindowMain(QWidget):
                 background-color:{comp_bg};color:{text};border:1px solid {border};
                 selection-background-color:{accent};selection-color:white;outline:0px;
             }}
-            QListWidget::item, QTreeWidget#NotesTree::item {{
+            QListWidget::item, QListView#Playlist::item, QTreeWidget#NotesTree::item {{
                 color:{list_text}; padding:6px; border-radius:4px;
             }}
             QTreeWidget#NotesTree::item:alternate {{ background-color: {zebra1}; }}
-            QListWidget::item:hover, QTreeWidget#NotesTree::item:hover {{
+            QListWidget::item:hover, QListView#Playlist::item:hover, QTreeWidget#NotesTree::item:hover {{
                 background-color:rgba(128,128,128,0.15);
             }}
-            QListWidget::item:selected, QTreeWidget#NotesTree::item:selected {{
+            QListWidget::item:selected, QListView#Playlist::item:selected, QTreeWidget#NotesTree::item:selected {{
                 background-color:{accent}; color:white;
             }}
             QListWidget#TaskList::indicator {{
@@ -3464,7 +5260,10 @@ class WindowMain(QWidget):
             }}
             QWidget#chipsHost {{ background: transparent; }}
         """
-        self.setStyleSheet(stylesheet)
+
+    def apply_theme(self, settings):
+        colors = theme_colors(settings)
+        apply_stylesheet(self, cached_stylesheet("WindowMain", colors, lambda: self._build_stylesheet(*colors)))
         self.audio_toggle_btn.setIcon(ThemedIconProvider.icon("note", settings))
         self.settings_toggle_btn.setIcon(ThemedIconProvider.icon("gear", settings))
         self.close_button.setIcon(ThemedIconProvider.icon("close", settings))
@@ -3488,9 +5287,7 @@ class WindowMain(QWidget):
             self.settings_panel_main.apply_styles()
         
     def on_data_changed(self):
-        is_folder_edit = self.current_edit_target and self.current_edit_target[0] == "folder"
         is_dirty = self.notes_panel.is_dirty
-        if is_folder_edit: is_dirty = self.notes_panel.notes_editor.toPlainText() != self.notes_panel.saved_text
         if is_dirty:
             self.status_text.setText(self.loc.get("unsaved_changes_status"))
             self.status_text.setStyleSheet("color: #dc3545;")
@@ -3499,6 +5296,9 @@ class WindowMain(QWidget):
     def set_status_saved(self):
         self.status_text.setText(self.loc.get("data_saved_status"))
         self.status_text.setStyleSheet("color: #28a745;")
+
+    def show_status_message(self, text):
+        self.status_bar.showMessage(text, 5000)
         
     def _save_splitter_sizes(self):
         sizes = self.splitter.sizes()
@@ -3536,81 +5336,737 @@ class WindowMain(QWidget):
         self.window_editor_font_size = 0
         self.notes_panel.apply_editor_style(self.data_manager.get_settings())
 
+# --- Метаданные треков ---
+def _mp3_syncsafe(b):
+    return (b[0] << 21) | (b[1] << 14) | (b[2] << 7) | b[3]
+
+def _decode_tag_text(data, encoding):
+    """Текстовое поле ID3v2: первый байт — кодировка (0 latin-1, 1 utf-16, 2 utf-16-be, 3 utf-8)."""
+    codec = {0: "latin-1", 1: "utf-16", 2: "utf-16-be", 3: "utf-8"}.get(encoding, "latin-1")
+    return data.decode(codec, "replace").split("\x00")[0].strip()
+
+def _parse_id3v2(tag, major, info):
+    frames = {"TIT2": "title", "TT2": "title", "TPE1": "artist", "TP1": "artist", "TLEN": "tlen", "TLE": "tlen"}
+    pos, id_len, head_len = 0, (3 if major == 2 else 4), (6 if major == 2 else 10)
+    while pos + head_len <= len(tag):
+        frame_id = tag[pos:pos + id_len].decode("latin-1", "replace")
+        if not frame_id.strip("\x00"):
+            break  # началось заполнение нулями
+        raw = tag[pos + id_len:pos + id_len + (3 if major == 2 else 4)]
+        if major == 2:
+            size = int.from_bytes(raw, "big")
+        elif major == 4:
+            size = _mp3_syncsafe(raw)
+        else:
+            size = int.from_bytes(raw, "big")
+        body = tag[pos + head_len:pos + head_len + size]
+        key = frames.get(frame_id)
+        if key and body and key not in info:
+            info[key] = _decode_tag_text(body[1:], body[0])
+        pos += head_len + size
+
+_MP3_BITRATES = {
+    (3, 3): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (3, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (3, 1): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 3): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 1): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+def _probe_mp3(f, size):
+    info = {}
+    head = f.read(10)
+    offset = 0
+    if head[:3] == b"ID3" and len(head) == 10:
+        offset = 10 + _mp3_syncsafe(head[6:10]) + (10 if head[5] & 0x10 else 0)
+        _parse_id3v2(f.read(offset - 10), head[3], info)
+    f.seek(offset)
+    buf = f.read(64 * 1024)
+    for i in range(len(buf) - 4):
+        if buf[i] != 0xFF or (buf[i + 1] & 0xE0) != 0xE0:
+            continue
+        version, layer = (buf[i + 1] >> 3) & 3, (buf[i + 1] >> 1) & 3
+        bitrate_idx, rate_idx = buf[i + 2] >> 4, (buf[i + 2] >> 2) & 3
+        if version == 1 or layer == 0 or bitrate_idx in (0, 15) or rate_idx == 3:
+            continue
+        bitrate = _MP3_BITRATES[(3 if version == 3 else 2, layer)][bitrate_idx] * 1000
+        rate = _MP3_SAMPLE_RATES[version][rate_idx]
+        samples = 384 if layer == 3 else (1152 if version == 3 or layer == 2 else 576)
+        mono = (buf[i + 3] >> 6) == 3
+        side = (17 if mono else 32) if version == 3 else (9 if mono else 17)
+        xing = buf[i + 4 + side:i + 4 + side + 12]
+        vbri = buf[i + 36:i + 36 + 18]
+        frames = 0
+        if xing[:4] in (b"Xing", b"Info") and int.from_bytes(xing[4:8], "big") & 1:
+            frames = int.from_bytes(xing[8:12], "big")
+        elif vbri[:4] == b"VBRI":
+            frames = int.from_bytes(vbri[14:18], "big")
+        if frames:
+            info["duration_ms"] = frames * samples * 1000 // rate
+        else:
+            audio_bytes = size - offset - i
+            f.seek(max(0, size - 128))
+            if f.read(3) == b"TAG":
+                audio_bytes -= 128
+            info["duration_ms"] = audio_bytes * 8 * 1000 // bitrate
+        break
+    if "title" not in info and size >= 128:
+        f.seek(size - 128)
+        tail = f.read(128)
+        if tail[:3] == b"TAG":
+            info["title"] = tail[3:33].decode("latin-1").strip("\x00 ")
+            info.setdefault("artist", tail[33:63].decode("latin-1").strip("\x00 "))
+    if not info.get("duration_ms") and info.get("tlen", "").isdigit():
+        info["duration_ms"] = int(info["tlen"])
+    info.pop("tlen", None)
+    return info
+
+def _parse_vorbis_comment(data, info):
+    """Блок комментариев Vorbis (FLAC, Ogg): длины little-endian, строки KEY=value."""
+    vendor_len = int.from_bytes(data[0:4], "little")
+    pos = 4 + vendor_len
+    count = int.from_bytes(data[pos:pos + 4], "little")
+    pos += 4
+    for _ in range(count):
+        length = int.from_bytes(data[pos:pos + 4], "little")
+        pos += 4
+        if pos + length > len(data):
+            break
+        key, _, value = data[pos:pos + length].decode("utf-8", "replace").partition("=")
+        pos += length
+        key = key.lower()
+        if key in ("title", "artist") and key not in info:
+            info[key] = value.strip()
+
+def _probe_flac(f, size):
+    info = {}
+    head = f.read(10)
+    if head[:3] == b"ID3":
+        f.seek(10 + _mp3_syncsafe(head[6:10]))
+    else:
+        f.seek(0)
+    if f.read(4) != b"fLaC":
+        return info
+    while True:
+        block = f.read(4)
+        if len(block) < 4:
+            break
+        kind, length = block[0] & 0x7F, int.from_bytes(block[1:4], "big")
+        if kind == 0:
+            d = f.read(length)
+            rate = (d[10] << 12) | (d[11] << 4) | (d[12] >> 4)
+            total = ((d[13] & 0x0F) << 32) | int.from_bytes(d[14:18], "big")
+            if rate:
+                info["duration_ms"] = total * 1000 // rate
+        elif kind == 4:
+            _parse_vorbis_comment(f.read(length), info)
+        else:
+            f.seek(length, os.SEEK_CUR)  # картинки и прочие блоки не читаем
+        if block[0] & 0x80:
+            break
+    return info
+
+def _probe_ogg(f, size):
+    info = {}
+    head = f.read(64 * 1024)
+    rate, pre_skip = 0, 0
+    if (i := head.find(b"\x01vorbis")) >= 0:
+        rate = int.from_bytes(head[i + 12:i + 16], "little")
+    elif (i := head.find(b"OpusHead")) >= 0:
+        rate, pre_skip = 48000, int.from_bytes(head[i + 10:i + 12], "little")
+    for marker in (b"\x03vorbis", b"OpusTags"):
+        if (i := head.find(marker)) >= 0:
+            try:
+                _parse_vorbis_comment(head[i + len(marker):], info)
+            except (IndexError, ValueError):
+                pass
+            break
+    f.seek(max(0, size - 64 * 1024))
+    tail = f.read()
+    if rate and (i := tail.rfind(b"OggS")) >= 0:
+        granule = int.from_bytes(tail[i + 6:i + 14], "little")
+        info["duration_ms"] = max(0, granule - pre_skip) * 1000 // rate
+    return info
+
+def _probe_wav(f, size):
+    info = {}
+    if f.read(12)[8:12] != b"WAVE":
+        return info
+    byte_rate = 0
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            break
+        kind, length = chunk[:4], int.from_bytes(chunk[4:8], "little")
+        if kind == b"fmt ":
+            byte_rate = int.from_bytes(f.read(length)[8:12], "little")
+        elif kind == b"data":
+            if byte_rate:
+                info["duration_ms"] = min(length, size - f.tell()) * 1000 // byte_rate
+            f.seek(length, os.SEEK_CUR)
+        elif kind == b"LIST":
+            data = f.read(length)
+            pos = 4 if data[:4] == b"INFO" else len(data)
+            while pos + 8 <= len(data):
+                sub, sub_len = data[pos:pos + 4], int.from_bytes(data[pos + 4:pos + 8], "little")
+                value = data[pos + 8:pos + 8 + sub_len].decode("utf-8", "replace").strip("\x00 ")
+                if sub == b"INAM": info.setdefault("title", value)
+                elif sub == b"IART": info.setdefault("artist", value)
+                pos += 8 + sub_len + (sub_len & 1)
+        else:
+            f.seek(length, os.SEEK_CUR)
+        if length & 1:
+            f.seek(1, os.SEEK_CUR)  # чанки выровнены по двум байтам
+    return info
+
+def _mp4_atoms(buf, start, end):
+    pos = start
+    while pos + 8 <= end:
+        length, kind = int.from_bytes(buf[pos:pos + 4], "big"), buf[pos + 4:pos + 8]
+        head = 8
+        if length == 1:
+            length, head = int.from_bytes(buf[pos + 8:pos + 16], "big"), 16
+        elif length == 0:
+            length = end - pos
+        if length < head:
+            return
+        yield kind, pos + head, min(pos + length, end)
+        pos += length
+
+def _probe_m4a(f, size):
+    info = {}
+    moov = None
+    pos = 0
+    while pos + 8 <= size and moov is None:  # верхний уровень читаем по заголовкам: mdat бывает огромным
+        f.seek(pos)
+        head = f.read(16)
+        length, kind = int.from_bytes(head[0:4], "big"), head[4:8]
+        if length == 1:
+            length = int.from_bytes(head[8:16], "big")
+        elif length == 0:
+            length = size - pos
+        if length < 8:
+            break
+        if kind == b"moov":
+            f.seek(pos)
+            moov = f.read(min(length, 16 * 1024 * 1024))
+        pos += length
+    if not moov:
+        return info
+    for kind, s, e in _mp4_atoms(moov, 8, len(moov)):
+        if kind == b"mvhd":
+            if moov[s] == 1:
+                scale, duration = int.from_bytes(moov[s + 20:s + 24], "big"), int.from_bytes(moov[s + 24:s + 32], "big")
+            else:
+                scale, duration = int.from_bytes(moov[s + 12:s + 16], "big"), int.from_bytes(moov[s + 16:s + 20], "big")
+            if scale:
+                info["duration_ms"] = duration * 1000 // scale
+        elif kind == b"udta":
+            for k2, s2, e2 in _mp4_atoms(moov, s, e):
+                if k2 != b"meta":
+                    continue
+                for k3, s3, e3 in _mp4_atoms(moov, s2 + 4, e2):  # meta — full box: 4 байта версии
+                    if k3 != b"ilst":
+                        continue
+                    for k4, s4, e4 in _mp4_atoms(moov, s3, e3):
+                        key = {b"\xa9nam": "title", b"\xa9ART": "artist"}.get(k4)
+                        for k5, s5, e5 in _mp4_atoms(moov, s4, e4):
+                            if key and k5 == b"data":
+                                info[key] = moov[s5 + 8:e5].decode("utf-8", "replace").strip()
+    return info
+
+_AUDIO_PROBES = {".mp3": _probe_mp3, ".flac": _probe_flac, ".ogg": _probe_ogg, ".wav": _probe_wav, ".m4a": _probe_m4a}
+
+def probe_audio_file(path, size):
+    """Название, исполнитель и длительность из тегов и заголовков, без декодирования звука."""
+    probe = _AUDIO_PROBES.get(os.path.splitext(path)[1].lower())
+    if probe is None:
+        return {}
+    try:
+        with open(path, "rb") as f:
+            info = probe(f, size)
+    except (OSError, IndexError, ValueError, KeyError, ZeroDivisionError) as e:
+        print(f"Не удалось прочитать теги {path}: {e}")
+        return {}
+    return {k: v for k, v in info.items() if v}
+
+def audio_fingerprint(path, size):
+    """Отпечаток файла: размер плюс начало и конец; меняется при правке тегов или звука."""
+    digest = hashlib.sha1(str(size).encode())
+    with open(path, "rb") as f:
+        digest.update(f.read(METADATA_FINGERPRINT_BYTES))
+        if size > 2 * METADATA_FINGERPRINT_BYTES:
+            f.seek(size - METADATA_FINGERPRINT_BYTES)
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def format_duration(ms):
+    seconds = int(ms) // 1000
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+class TrackMetadataCache(QObject):
+    """
+    Кэш метаданных треков (название, исполнитель, длительность, размер, mtime, отпечаток),
+    хранится в METADATA_FILE рядом с плейлистами. get() отвечает из памяти сразу;
+    request() отдает пути пулу фоновых потоков, которые перечитывают теги только у файлов
+    с изменившимся размером или mtime. updated приходит пачками со списком обновленных путей.
+    Файл пишет writer (StoreWriter), если он передан, иначе запись синхронная.
+    """
+    updated = pyqtSignal(list)
+    _probed = pyqtSignal(str, object)
+
+    def __init__(self, path, parent=None, writer=None):
+        super().__init__(parent)
+        self.path = path
+        self.writer = writer
+        self._entries = {}
+        try:
+            self._entries = read_json_recovering(path).get("tracks", {})
+        except (FileNotFoundError, json.JSONDecodeError, AttributeError):
+            pass
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._changed = []
+        self._probed.connect(self._on_probed)
+        self._notify_timer = QTimer(self)
+        self._notify_timer.setSingleShot(True)
+        self._notify_timer.setInterval(200)
+        self._notify_timer.timeout.connect(self._notify)
+        self._save_timer = QTimer(self)
+        self._save_timer.setSingleShot(True)
+        self._save_timer.setInterval(3000)
+        self._save_timer.timeout.connect(self.save)
+        self._workers = [threading.Thread(target=self._run, name="TrackMetadataProbe", daemon=True)
+                         for _ in range(METADATA_PROBE_WORKERS)]
+        for worker in self._workers:
+            worker.start()
+
+    def get(self, path):
+        return self._entries.get(path)
+
+    def request(self, paths):
+        with self._lock:
+            for path in paths:
+                if path not in self._queued:
+                    self._queued.add(path)
+                    self._queue.put(path)
+
+    def prune(self, keep_paths):
+        """Забывает треки, которых больше нет ни в одном плейлисте."""
+        stale = [p for p in self._entries if p not in keep_paths]
+        for path in stale:
+            del self._entries[path]
+        if stale:
+            self._save_timer.start()
+
+    def flush(self):
+        if self._save_timer.isActive() or self._changed:
+            self.save()
+
+    def save(self):
+        self._save_timer.stop()
+        path, data = self.path, {"tracks": dict(self._entries)}
+        def job():
+            try:
+                write_json_atomic(path, data, indent=None, keep_previous=False)
+            except (IOError, TypeError) as e:
+                print(f"Не удалось сохранить метаданные треков: {e}")
+        if self.writer:
+            self.writer.submit(job)
+        else:
+            job()
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            with self._lock:
+                self._queued.discard(path)
+                cached = self._entries.get(path)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if cached and cached.get("size") == st.st_size and cached.get("mtime") == st.st_mtime:
+                continue
+            try:
+                entry = {"size": st.st_size, "mtime": st.st_mtime, "fingerprint": audio_fingerprint(path, st.st_size)}
+                if cached and cached.get("fingerprint") == entry["fingerprint"]:
+                    entry.update({k: v for k, v in cached.items() if k not in entry})  # файл лишь «тронули»
+                else:
+                    entry.update(probe_audio_file(path, st.st_size))
+                self._probed.emit(path, entry)
+            except OSError:
+                continue
+            except RuntimeError:
+                return  # кэш удален вместе с контроллером
+
+    def _on_probed(self, path, entry):
+        self._entries[path] = entry
+        self._changed.append(path)
+        if not self._notify_timer.isActive():
+            self._notify_timer.start()
+
+    def _notify(self):
+        changed, self._changed = self._changed, []
+        if changed:
+            self.updated.emit(changed)
+            self._save_timer.start()
+
+
+def move_list_block(items, row, count, dest):
+    """Переносит items[row:row+count] так, чтобы блок встал перед прежней позицией dest (как beginMoveRows)."""
+    block = items[row:row + count]
+    del items[row:row + count]
+    start = dest - count if dest > row else dest
+    items[start:start] = block
+    return start
+
+
+class Playlist:
+    """
+    Упорядоченный список путей без повторов плюс словарь путь -> номер строки:
+    проверка «уже есть» и поиск трека за O(1). Массовые операции возвращают то,
+    что нужно одному сигналу об изменении (строку вставки, удаленные строки).
+    """
+    def __init__(self, paths=()):
+        self._paths = []
+        self._rows = {}
+        self.extend(paths)
+
+    def __len__(self):
+        return len(self._paths)
+
+    def __iter__(self):
+        return iter(self._paths)
+
+    def __getitem__(self, row):
+        return self._paths[row]
+
+    def __contains__(self, path):
+        return path in self._rows
+
+    def index_of(self, path):
+        return self._rows.get(path, -1)
+
+    def paths(self):
+        return list(self._paths)
+
+    def _reindex(self, start=0, end=None):
+        for i in range(start, len(self._paths) if end is None else end):
+            self._rows[self._paths[i]] = i
+
+    def extend(self, paths):
+        """Добавляет в конец новые пути; возвращает (строку вставки, добавленные пути)."""
+        row = len(self._paths)
+        added = []
+        for path in paths:
+            if path and path not in self._rows:
+                self._rows[path] = row + len(added)
+                added.append(path)
+        self._paths.extend(added)
+        return row, added
+
+    def remove_rows(self, rows):
+        """Удаляет строки за один проход; возвращает удаленные номера по убыванию."""
+        rows = sorted({r for r in rows if 0 <= r < len(self._paths)}, reverse=True)
+        if not rows:
+            return rows
+        removed = set(rows)
+        for r in rows:
+            del self._rows[self._paths[r]]
+        self._paths = [p for i, p in enumerate(self._paths) if i not in removed]
+        self._reindex(rows[-1])
+        return rows
+
+    def move(self, row, count, dest):
+        """Переносит блок строк перед позицию dest; возвращает новую строку начала блока."""
+        start = move_list_block(self._paths, row, count, dest)
+        self._reindex(min(row, dest), min(max(row + count, dest), len(self._paths)))
+        return start
+
+    def replace(self, paths):
+        self._paths, self._rows = [], {}
+        self.extend(paths)
+
+
+def pack_playlists(playlists):
+    """Компактная запись плейлистов: каталог хранится один раз, трек — пара [номер каталога, имя файла]."""
+    dirs, dir_ids, packed = [], {}, {}
+    for name, playlist in playlists.items():
+        items = []
+        for path in playlist:
+            folder, file_name = os.path.split(path)
+            idx = dir_ids.get(folder)
+            if idx is None:
+                idx = dir_ids[folder] = len(dirs)
+                dirs.append(folder)
+            items.append([idx, file_name])
+        packed[name] = items
+    return {"version": 2, "dirs": dirs, "playlists": packed}
+
+
+def unpack_playlists(data):
+    """Обратное pack_playlists; файлы старого формата хранят полные пути списком."""
+    dirs = data.get("dirs")
+    if dirs is None:
+        return {name: Playlist(paths) for name, paths in data.get("playlists", {}).items()}
+    return {name: Playlist(os.path.join(dirs[d], f) for d, f in items) for name, items in data.get("playlists", {}).items()}
+
+
+class AudioFolderScanner(QObject):
+    """
+    Рекурсивный поиск аудиофайлов в фоновом потоке. Найденные пути уходят пачками
+    по AUDIO_SCAN_BATCH через batch_found; сигналы доставляются в GUI-поток очередью.
+    """
+    batch_found = pyqtSignal(list)
+    progress = pyqtSignal(int) # просмотрено файлов
+    finished = pyqtSignal(bool) # True — прервано через cancel()
+
+    def __init__(self, folder_path, parent=None):
+        super().__init__(parent)
+        self.folder_path = folder_path
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="AudioFolderScanner", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def is_running(self):
+        return self._thread.is_alive()
+
+    def is_cancelled(self):
+        return self._cancel.is_set()
+
+    def _run(self):
+        batch, seen = [], 0
+        stack = [self.folder_path]
+        try:
+            while stack and not self._cancel.is_set():
+                try:
+                    entries = sorted(os.scandir(stack.pop()), key=lambda e: e.name.lower())
+                except OSError as e:
+                    print("add_folder error:", e)
+                    continue
+                subdirs = []
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                        continue
+                    seen += 1
+                    if entry.name.lower().endswith(AUDIO_EXTENSIONS):
+                        batch.append(entry.path)
+                        if len(batch) >= AUDIO_SCAN_BATCH:
+                            self.batch_found.emit(batch)
+                            self.progress.emit(seen)
+                            batch = []
+                stack.extend(reversed(subdirs)) # обход в глубину в алфавитном порядке
+            if batch and not self._cancel.is_set():
+                self.batch_found.emit(batch)
+            self.progress.emit(seen)
+        except RuntimeError:
+            return # объект удален вместе с контроллером
+        self.finished.emit(self._cancel.is_set())
+
+
 class GlobalAudioController(QObject):
     playlists_changed = pyqtSignal(list, str)
     current_playlist_changed = pyqtSignal(str)
-    tracks_changed = pyqtSignal(list)
+    tracks_changed = pyqtSignal(list) # список текущего плейлиста заменен целиком
+    tracks_inserted = pyqtSignal(int, list) # строка, добавленные пути
+    tracks_removed = pyqtSignal(list) # номера удаленных строк
+    tracks_moved = pyqtSignal(int, int, int) # строка, число строк, позиция вставки (как beginMoveRows)
     current_index_changed = pyqtSignal(int)
     state_changed = pyqtSignal(object)
-
-    def __init__(self, parent=None):
+    position_changed = pyqtSignal(int)
+    duration_changed = pyqtSignal(int)
+    volume_changed = pyqtSignal(float)
+    muted_changed = pyqtSignal(bool)
+    scan_progress = pyqtSignal(int, int) # просмотрено файлов, добавлено треков
+    scan_finished = pyqtSignal(int, bool) # добавлено треков, прервано
+
+    def __init__(self, parent=None, base_dir=None):
+        """base_dir — каталог файлов плеера и zen_audio (по умолчанию рядом с программой)."""
         super().__init__(parent)
-        self.player = QMediaPlayer()
-        self.audio_output = QAudioOutput()
-        self.player.setAudioOutput(self.audio_output)
-        self.player.playbackStateChanged.connect(self._relay_state_changed)
-        self.player.mediaStatusChanged.connect(self._on_media_status)
-        if getattr(sys, 'frozen', False):
-            base_dir = os.path.dirname(sys.executable)
+        self._volume = 0.5
+        self._muted = False
+        self._players = []
+        self._gains = {}  # плеер -> доля громкости при кроссфейде
+        for _ in range(2):
+            player = QMediaPlayer()
+            player.setAudioOutput(QAudioOutput(player))
+            player.playbackStateChanged.connect(self._relay_state_changed)
+            player.mediaStatusChanged.connect(self._on_media_status)
+            player.positionChanged.connect(self._relay_position)
+            player.durationChanged.connect(self._relay_duration)
+            self._players.append(player)
+            self._set_gain(player, 1.0)
+        self.player, self._next_player = self._players  # активный и загружающий следующий трек
+        self._preloaded_path = None
+        self._fading_out = None  # прежний плеер, доигрывающий хвост трека
+        self._fade_ms = 0
+        self._fade_clock = QElapsedTimer()
+        self._fade_timer = QTimer(self)
+        self._fade_timer.setInterval(CROSSFADE_STEP_MS)
+        self._fade_timer.timeout.connect(self._on_fade_tick)
+        if base_dir is not None:
+            self._zen_dir = os.path.join(base_dir, "zen_audio")
         else:
-            base_dir = os.path.dirname(os.path.abspath(__file__))
+            if getattr(sys, 'frozen', False):
+                base_dir = os.path.dirname(sys.executable)
+            else:
+                base_dir = os.path.dirname(os.path.abspath(__file__))
+            # zen_audio поставляется с программой (в сборке — внутри _MEIPASS)
+            self._zen_dir = os.path.join(getattr(sys, '_MEIPASS', base_dir), "zen_audio")
         self._playlists_file = os.path.join(base_dir, "audio_playlists.json")
+        self._playback_file = os.path.join(base_dir, PLAYBACK_STATE_FILE)
+        self._playlists_dirty = False
+        self._playback_dirty = False
+        self._checkpoint_pos = 0
+        self._resume_position = 0  # позиция восстановленного трека, выставляется после загрузки
+        self._persist_timer = QTimer(self)
+        self._persist_timer.setSingleShot(True)
+        self._persist_timer.setInterval(PLAYLIST_SAVE_DEBOUNCE_MS)
+        self._persist_timer.timeout.connect(self.flush)
+        self.writer = getattr(parent, "writer", None)  # поток записи TriggerButton: fsync не в GUI-потоке
+        self.metadata = TrackMetadataCache(os.path.join(base_dir, METADATA_FILE), self, self.writer)
+        self.tracks_changed.connect(self.metadata.request)
+        self.tracks_inserted.connect(lambda row, paths: self.metadata.request(paths))
+        # Следующий трек мог смениться; после удаления/перемещения индекс текущего
+        # исправляется уже после сигнала о строках, поэтому слушаем и current_index_changed
+        for signal in (self.tracks_changed, self.tracks_inserted, self.tracks_removed,
+                       self.tracks_moved, self.current_index_changed):
+            signal.connect(lambda *args: self._preload_next())
         self.playlists = {}
         self.playlist_order = []
         self.current_playlist = ""
         self.index = -1
-        self.audio_output.setVolume(0.5)
+        self._scanner = None
+        self._scan_playlist = ""
+        self._scan_added = 0
+        self._scan_queue = [] # папки, ожидающие своей очереди на сканирование
         self._load_playlists()
+        self.current_index_changed.connect(lambda i: self._save_playback_state())
+        self.state_changed.connect(lambda st: self._save_playback_state())
+        self.metadata.prune({p for playlist in self.playlists.values() for p in playlist})
 
 # В классе GlobalAudioController
     def _load_playlists(self):
         try:
-            if not os.path.exists(self._playlists_file): raise FileNotFoundError
-            with open(self._playlists_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            self.playlists = data.get("playlists", {})
+            data = read_json_recovering(self._playlists_file)
+            self.playlists = unpack_playlists(data)
             self.playlist_order = data.get("order", list(self.playlists.keys()))
             self.current_playlist = data.get("current", "")
         except (FileNotFoundError, json.JSONDecodeError):
             self.playlists = {}
             self.playlist_order = []
             self.current_playlist = ""
+        except (IndexError, TypeError, AttributeError, ValueError) as e:
+            # Файл читается как JSON, но структура испорчена: откладываем его, чтобы не затереть
+            print(f"Не удалось разобрать плейлисты: {e}")
+            _set_aside_corrupt(self._playlists_file)
+            self.playlists = {}
+            self.playlist_order = []
+            self.current_playlist = ""
             
         # --- НАЧАЛО НОВОГО КОДА ---
         # Проверяем и создаем плейлист "Zen" по умолчанию, если его нет
         if "Zen" not in self.playlists:
-            zen_dir = ""
-            try:
-                # Определяем путь к папке zen_audio
-                base_dir = sys._MEIPASS if getattr(sys, 'frozen', False) else os.path.dirname(os.path.abspath(__file__))
-                zen_dir = os.path.join(base_dir, "zen_audio")
-            except Exception:
-                pass
-
-            if zen_dir and os.path.isdir(zen_dir):
-                exts = ('.mp3', '.wav', '.ogg', '.flac', '.m4a')
-                zen_tracks = [os.path.join(zen_dir, f) for f in os.listdir(zen_dir) if f.lower().endswith(exts)]
+            zen_dir = self._zen_dir
+            if os.path.isdir(zen_dir):
+                zen_tracks = [os.path.join(zen_dir, f) for f in os.listdir(zen_dir) if f.lower().endswith(AUDIO_EXTENSIONS)]
                 if zen_tracks:
-                    self.playlists["Zen"] = zen_tracks
+                    self.playlists["Zen"] = Playlist(zen_tracks)
                     if "Zen" not in self.playlist_order:
                         self.playlist_order.insert(0, "Zen") # Добавляем в начало
                     self._save_playlists() # Сразу сохраняем, чтобы он был при следующем запуске
         # --- КОНЕЦ НОВОГО КОДА ---
 
-        if not self.playlists: self.playlists["Default"] = []
+        state = self._load_playback_state()
+        if state.get("playlist") in self.playlists:
+            self.current_playlist = state["playlist"]
+
+        if not self.playlists: self.playlists["Default"] = Playlist()
         if not self.playlist_order: self.playlist_order = list(self.playlists.keys())
         if not self.current_playlist or self.current_playlist not in self.playlists:
             self.current_playlist = self.playlist_order[0] if self.playlist_order else ""
+        self._resume_playback(state)
         self._emit_all()
 
-
+    # --- Сохранение плейлистов и позиции ---
+    # Правки только помечают данные измененными; запись — одна на PLAYLIST_SAVE_DEBOUNCE_MS
+    # и при выходе (flush). Позиция хранится отдельным маленьким файлом, чтобы ее
+    # периодическое сохранение не переписывало большой файл плейлистов.
     def _save_playlists(self):
+        self._playlists_dirty = True
+        self._persist_timer.start()
+
+    def _save_playback_state(self):
+        self._playback_dirty = True
+        self._persist_timer.start()
+
+    def _playback_state(self):
+        tracks = self.tracks()
+        playing = 0 <= self.index < len(tracks)
+        return {"playlist": self.current_playlist,
+                "track": tracks[self.index] if playing else "",
+                "position": (self._resume_position or self.player.position()) if playing else 0}
+
+    def _load_playback_state(self):
         try:
-            data = {"playlists": self.playlists, "order": self.playlist_order, "current": self.current_playlist}
-            with open(self._playlists_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-        except (IOError, TypeError) as e:
-            print(f"Не удалось сохранить плейлисты: {e}")
+            state = read_json_recovering(self._playback_file)
+            return state if isinstance(state, dict) else {}
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _resume_playback(self, state):
+        """Готовит к воспроизведению трек из сохраненного состояния (без автозапуска)."""
+        row = self.tracks().index_of(state.get("track", ""))
+        if row < 0:
+            return
+        self.index = row
+        self._resume_position = max(0, int(state.get("position", 0)))
+        self._checkpoint_pos = self._resume_position
+        self.player.setSource(QUrl.fromLocalFile(self.tracks()[row]))
+
+    def flush(self):
+        """Пишет на диск все отложенные изменения (по таймеру и при выходе из программы)."""
+        self._persist_timer.stop()
+        # Данные собираются здесь, а пишутся (с fsync) в потоке записи
+        playlists = playback = None
+        if self._playlists_dirty:
+            self._playlists_dirty = False
+            playlists = pack_playlists(self.playlists)
+            playlists["order"] = self.playlist_order[:]
+        if self._playback_dirty:
+            self._playback_dirty = False
+            playback = self._playback_state()
+        playlists_file, playback_file = self._playlists_file, self._playback_file
+        def job():
+            if playlists is not None:
+                try:
+                    write_json_atomic(playlists_file, playlists, indent=None)
+                except (IOError, TypeError) as e:
+                    print(f"Не удалось сохранить плейлисты: {e}")
+            if playback is not None:
+                try:
+                    write_json_atomic(playback_file, playback, indent=None, keep_previous=False)
+                except (IOError, TypeError) as e:
+                    print(f"Не удалось сохранить позицию воспроизведения: {e}")
+        if playlists is not None or playback is not None:
+            if self.writer:
+                self.writer.submit(job)
+            else:
+                job()
+        self.metadata.flush()
 
     def _emit_all(self):
         names = [n for n in self.playlist_order if n in self.playlists]
@@ -3626,7 +6082,27 @@ class GlobalAudioController(QObject):
         self.state_changed.emit(self.player.playbackState())
 
     def get_tracks(self):
-        return list(self.playlists.get(self.current_playlist, []))
+        """Копия путей текущего плейлиста (для сигналов и внешнего кода)."""
+        return self.tracks().paths()
+
+    def tracks(self):
+        """Текущий плейлист без копирования; менять только через методы контроллера."""
+        playlist = self.playlists.get(self.current_playlist)
+        return playlist if playlist is not None else Playlist()
+
+    def total_duration_ms(self):
+        """Суммарная длительность текущего плейлиста по кэшу; треки без данных не учитываются."""
+        total = 0
+        for path in self.tracks():
+            entry = self.metadata.get(path)
+            if entry:
+                total += entry.get("duration_ms", 0)
+        return total
+
+    def track_title(self, path):
+        entry = self.metadata.get(path) or {}
+        title = entry.get("title") or os.path.basename(path)
+        return f"{entry['artist']} — {title}" if entry.get("artist") else title
 
     def switch_playlist_by_offset(self, delta: int):
         names = [n for n in self.playlist_order if n in self.playlists]
@@ -3643,7 +6119,6 @@ class GlobalAudioController(QObject):
         self.current_playlist = name
         self.index = -1
         self._emit_all()
-        self._save_playlists()
     
     def add_playlist(self, name: str):
         name = name.strip() or "New"
@@ -3652,8 +6127,9 @@ class GlobalAudioController(QObject):
         while name in self.playlists:
             k += 1
             name = f"{base} {k}"
-        self.playlists[name] = []
+        self.playlists[name] = Playlist()
         self.playlist_order.append(name)
+        self._save_playlists()
         self.set_current_playlist(name)
     
     def rename_playlist(self, old: str, new: str):
@@ -3663,11 +6139,15 @@ class GlobalAudioController(QObject):
         self.playlists[new] = self.playlists.pop(old)
         self.playlist_order = [new if x == old else x for x in self.playlist_order]
         if self.current_playlist == old: self.current_playlist = new
+        if self._scan_playlist == old: self._scan_playlist = new
+        self._scan_queue = [(folder, new if pl == old else pl) for folder, pl in self._scan_queue]
         self._emit_all()
         self._save_playlists()
     
     def delete_playlist(self, name: str):
         if name not in self.playlists or len(self.playlists) <= 1: return
+        self._scan_queue = [(folder, pl) for folder, pl in self._scan_queue if pl != name]
+        if self._scan_playlist == name: self.cancel_folder_scan()
         del self.playlists[name]
         self.playlist_order = [x for x in self.playlist_order if x != name]
         if self.current_playlist == name:
@@ -3678,126 +6158,454 @@ class GlobalAudioController(QObject):
     
     def add_files(self, paths: list[str]):
         if not paths: return
-        tracks = self.get_tracks()
-        added = 0
-        for p in paths:
-            if p and os.path.isfile(p) and p not in tracks:
-                tracks.append(p)
-                added += 1
+        tracks = self.playlists.setdefault(self.current_playlist, Playlist())
+        row, added = tracks.extend(p for p in paths if p and p not in tracks and os.path.isfile(p))
         if added:
-            self.playlists[self.current_playlist] = tracks
-            self.tracks_changed.emit(self.get_tracks())
+            self.tracks_inserted.emit(row, added)
             self._save_playlists()
     
+    # --- Фоновое сканирование папок ---
     def add_folder(self, folder_path: str):
+        """Запускает поиск треков в папке; пока идет сканирование, следующие папки ждут в очереди."""
         if not folder_path or not os.path.isdir(folder_path): return
-        exts = ('.mp3', '.wav', '.ogg', '.flac', '.m4a')
-        tracks = self.get_tracks()
-        added = 0
-        try:
-            for root, _, files in os.walk(folder_path):
-                for f in files:
-                    if f.lower().endswith(exts):
-                        p = os.path.join(root, f)
-                        if p not in tracks:
-                            tracks.append(p)
-                            added += 1
-        except Exception as e:
-            print("add_folder error:", e)
+        self._scan_queue.append((folder_path, self.current_playlist))
+        if not self.is_scanning():
+            self._start_next_scan()
+
+    def is_scanning(self) -> bool:
+        return self._scanner is not None
+
+    def cancel_folder_scan(self):
+        self._scan_queue.clear()
+        if self._scanner is not None:
+            self._scanner.cancel()
+
+    def _start_next_scan(self):
+        while self._scan_queue:
+            folder_path, playlist = self._scan_queue.pop(0)
+            if playlist not in self.playlists:
+                continue
+            self._scan_playlist = playlist
+            self._scan_added = 0
+            self._scanner = AudioFolderScanner(folder_path, self)
+            self._scanner.batch_found.connect(self._on_scan_batch)
+            self._scanner.progress.connect(self._on_scan_progress)
+            self._scanner.finished.connect(self._on_scan_finished)
+            self._scanner.start()
+            return
+
+    def _on_scan_batch(self, paths: list):
+        if self.sender() is not self._scanner or self._scanner.is_cancelled():
+            return # пачка от уже прерванного сканера
+        tracks = self.playlists.get(self._scan_playlist)
+        if tracks is None:
+            return
+        row, added = tracks.extend(paths) # текущий трек и его индекс не сдвигаются — добавляем в конец
+        if not added:
+            return
+        self._scan_added += len(added)
+        if self._scan_playlist == self.current_playlist:
+            self.tracks_inserted.emit(row, added)
+        else:
+            self.metadata.request(added)
+
+    def _on_scan_progress(self, seen: int):
+        if self.sender() is self._scanner:
+            self.scan_progress.emit(seen, self._scan_added)
+
+    def _on_scan_finished(self, cancelled: bool):
+        scanner = self.sender()
+        if scanner is not self._scanner:
+            return
+        self._scanner = None
+        scanner.deleteLater()
+        added = self._scan_added
+        self._scan_playlist = ""
         if added:
-            self.playlists[self.current_playlist] = tracks
-            self.tracks_changed.emit(self.get_tracks())
             self._save_playlists()
+        self.scan_finished.emit(added, cancelled)
+        self._start_next_scan()
     
     def remove_indexes(self, idxs: list[int]):
         if not idxs: return
-        tracks = self.get_tracks()
-        idxs = sorted(set([i for i in idxs if 0 <= i < len(tracks)]), reverse=True)
+        tracks = self.tracks()
         cur_path = self.player.source().toLocalFile() if self.player.source().isValid() else None
-        for i in idxs: del tracks[i]
-        self.playlists[self.current_playlist] = tracks
+        idxs = tracks.remove_rows(idxs)
+        if not idxs: return
+        self.tracks_removed.emit(idxs)
         if cur_path not in tracks:
             self.index = -1
             self.stop()
         else:
-            self.index = tracks.index(cur_path)
-        self.tracks_changed.emit(self.get_tracks())
+            self.index = tracks.index_of(cur_path)
         self.current_index_changed.emit(self.index)
         self._save_playlists()
+
+    def move_tracks(self, row: int, count: int, dest: int) -> bool:
+        """Переносит count треков начиная с row перед позицию dest; играющий трек сохраняет свой индекс."""
+        tracks = self.tracks()
+        if count <= 0 or row < 0 or row + count > len(tracks) or not 0 <= dest <= len(tracks):
+            return False
+        if row <= dest <= row + count:
+            return False
+        start = tracks.move(row, count, dest)
+        self.tracks_moved.emit(row, count, dest)
+        if row <= self.index < row + count:
+            self.index = start + self.index - row
+        elif row + count <= self.index < dest:
+            self.index -= count
+        elif dest <= self.index < row:
+            self.index += count
+        else:
+            self._save_playlists()
+            return True
+        self.current_index_changed.emit(self.index)
+        self._save_playlists()
+        return True
     
     def set_order(self, new_files_list: list[str], current_path: str | None = None):
-        self.playlists[self.current_playlist] = list(new_files_list or [])
-        if current_path and current_path in self.playlists[self.current_playlist]:
-            self.index = self.playlists[self.current_playlist].index(current_path)
+        tracks = self.playlists.setdefault(self.current_playlist, Playlist())
+        tracks.replace(new_files_list or [])
+        if current_path and current_path in tracks:
+            self.index = tracks.index_of(current_path)
             self.current_index_changed.emit(self.index)
-        elif not self.playlists[self.current_playlist]:
+        elif not tracks:
             self.index = -1
             self.stop()
         self.tracks_changed.emit(self.get_tracks())
         self._save_playlists()
 
+    # --- Воспроизведение ---
+    # Два плеера: активный играет, второй заранее открывает следующий трек плейлиста.
+    # Переход — смена ролей без повторного открытия файла; при audio_crossfade_sec > 0
+    # оба играют одновременно, громкость перетекает от старого к новому.
     def is_playing(self):
         return self.player.playbackState() == QMediaPlayer.PlaybackState.PlayingState
 
+    def playback_state(self):
+        return self.player.playbackState()
+
+    def position(self) -> int:
+        return self.player.position()
+
+    def duration(self) -> int:
+        return self.player.duration()
+
+    def set_position(self, ms: int):
+        self.player.setPosition(ms)
+        self._checkpoint_pos = ms
+        self._save_playback_state()
+
+    def _crossfade_ms(self):
+        dm = self.parent()
+        settings = dm.get_settings() if dm and hasattr(dm, 'get_settings') else DEFAULT_SETTINGS
+        return max(0, int(settings.get("audio_crossfade_sec", 0))) * 1000
+
+    def _transition_ms(self, dur):
+        """Длительность кроссфейда для трека длиной dur: короткий трек не должен затухать с первой секунды."""
+        return min(self._crossfade_ms(), int(dur * CROSSFADE_MAX_SHARE)) if dur > 0 else 0
+
+    def _set_gain(self, player, gain):
+        self._gains[player] = gain
+        output = player.audioOutput()
+        output.setVolume(self._volume * gain)
+        output.setMuted(self._muted)
+
+    def _preload_next(self):
+        """Открывает следующий трек во втором плеере, чтобы переход не ждал загрузки файла."""
+        if self._fading_out is not None or \
+                self._next_player.playbackState() == QMediaPlayer.PlaybackState.PlayingState:
+            return  # второй плеер еще доигрывает предыдущий трек
+        tracks = self.tracks()
+        nxt = self.index + 1  # при index == -1 (новый плейлист) следующим будет первый трек
+        path = tracks[nxt] if nxt < len(tracks) else None
+        if path == self._preloaded_path:
+            return
+        self._preloaded_path = path
+        self._next_player.setSource(QUrl.fromLocalFile(path) if path else QUrl())
+
+    def _swap_to(self, i, path):
+        """Делает второй плеер активным и запускает в нем трек i; прежний активный возвращает вызывающему."""
+        old, new = self.player, self._next_player
+        self._resume_position = 0
+        if self._preloaded_path != path:
+            new.setSource(QUrl.fromLocalFile(path))
+        self._preloaded_path = None
+        self.player, self._next_player = new, old
+        self.index = i
+        self._set_gain(new, 1.0)
+        new.play()
+        self.current_index_changed.emit(self.index)
+        self.duration_changed.emit(new.duration())
+        self.position_changed.emit(new.position())
+        self.state_changed.emit(new.playbackState())
+        return old
+
+    def _begin_transition(self, finished=False):
+        """Переход к следующему треку без паузы: следующий уже загружен во втором плеере.
+        finished — текущий трек уже доиграл (EndOfMedia), доигрывать и затухать нечему."""
+        tracks = self.tracks()
+        nxt = self.index + 1
+        if self._fading_out is not None or not 0 <= nxt < len(tracks):
+            return False
+        fade_ms = self._transition_ms(self.player.duration())
+        old = self._swap_to(nxt, tracks[nxt])
+        if finished or not fade_ms or old.playbackState() != QMediaPlayer.PlaybackState.PlayingState:
+            old.stop()  # без кроссфейда прежний трек замолкает в момент переключения
+            self._preload_next()
+            return True
+        # Прежний трек затухает, пока нарастает следующий, затем освобождает плеер
+        self._fading_out = old
+        self._fade_ms = fade_ms
+        self._fade_clock.start()
+        self._set_gain(self.player, 0.0)
+        self._fade_timer.start()
+        return True
+
+    def _on_fade_tick(self):
+        if self._fading_out is None:
+            self._fade_timer.stop()
+            return
+        progress = min(1.0, self._fade_clock.elapsed() / self._fade_ms) if self._fade_ms else 1.0
+        self._set_gain(self.player, progress)
+        self._set_gain(self._fading_out, 1.0 - progress)
+        if progress >= 1.0:
+            self._finish_transition()
+
+    def _finish_transition(self):
+        if self._fading_out is None:
+            return
+        self._fade_timer.stop()
+        old, self._fading_out = self._fading_out, None
+        old.stop()
+        self._set_gain(old, 1.0)
+        self._set_gain(self.player, 1.0)
+        self._preload_next()
+
     def play_index(self, i: int):
-        tracks = self.get_tracks()
+        tracks = self.tracks()
         if not tracks: return
         i = max(0, min(len(tracks) - 1, i))
-        self.index = i
-        self.player.setSource(QUrl.fromLocalFile(tracks[self.index]))
-        self.player.play()
-        self.current_index_changed.emit(self.index)
+        self._finish_transition()
+        self._resume_position = 0
+        if tracks[i] == self._preloaded_path:
+            self._swap_to(i, tracks[i]).stop()  # следующий трек уже открыт — переключаемся сразу
+        else:
+            self.index = i
+            self.player.setSource(QUrl.fromLocalFile(tracks[self.index]))
+            self.player.play()
+            self.current_index_changed.emit(self.index)
+        self._preload_next()
 
     def toggle_play_pause(self):
         if self.is_playing():
+            self._finish_transition()
             self.player.pause()
         else:
-            tracks = self.get_tracks()
+            tracks = self.tracks()
             if self.index < 0 and tracks:
                 self.index = 0
                 self.current_index_changed.emit(self.index)
                 self.player.setSource(QUrl.fromLocalFile(tracks[self.index]))
             if tracks:
                 self.player.play()
+                self._preload_next()
 
     def next(self):
-        tracks = self.get_tracks()
+        tracks = self.tracks()
         if not tracks: return
         self.play_index((self.index + 1) % len(tracks))
 
     def prev(self):
-        tracks = self.get_tracks()
+        tracks = self.tracks()
         if not tracks: return
         self.play_index((self.index - 1) % len(tracks))
 
     def stop(self):
+        self._finish_transition()
         self.player.stop()
 
     def set_volume(self, v: int):
         new_volume_float = max(0.0, min(1.0, v / 100.0))
-        if self.audio_output.volume() != new_volume_float:
-            self.audio_output.setVolume(new_volume_float)
+        if self._volume != new_volume_float:
+            self._volume = new_volume_float
+            for player in self._players:
+                self._set_gain(player, self._gains[player])
+            self.volume_changed.emit(new_volume_float)
 
     def volume(self) -> int:
-        return int(round(self.audio_output.volume() * 100))
+        return int(round(self._volume * 100))
 
     def toggle_mute(self):
-        self.audio_output.setMuted(not self.audio_output.isMuted())
+        self._muted = not self._muted
+        for player in self._players:
+            self._set_gain(player, self._gains[player])
+        self.muted_changed.emit(self._muted)
 
     def is_muted(self) -> bool:
-        return self.audio_output.isMuted()
+        return self._muted
 
     def _relay_state_changed(self, st):
-        self.state_changed.emit(st)
+        if self.sender() is self.player:
+            self.state_changed.emit(st)
+
+    def _relay_duration(self, dur):
+        if self.sender() is self.player:
+            self.duration_changed.emit(dur)
+
+    def _relay_position(self, pos):
+        if self.sender() is not self.player:
+            return
+        self.position_changed.emit(pos)
+        if abs(pos - self._checkpoint_pos) >= PLAYBACK_CHECKPOINT_MS and self.is_playing():
+            self._checkpoint_pos = pos
+            self._save_playback_state()
+        # При кроссфейде следующий трек стартует за время затухания до конца текущего.
+        # Без кроссфейда ждем EndOfMedia: следующий уже открыт во втором плеере, и треки не накладываются
+        dur = self.player.duration()
+        if dur > 0 and self._fading_out is None and self.is_playing():
+            lead = self._transition_ms(dur)
+            if lead and dur - pos <= lead:
+                self._begin_transition()
 
     def _on_media_status(self, status):
-        if status == QMediaPlayer.MediaStatus.EndOfMedia:
-            if self.index < len(self.get_tracks()) - 1:
-                self.next()
+        if status == QMediaPlayer.MediaStatus.LoadedMedia and self.sender() is self.player and self._resume_position:
+            position, self._resume_position = self._resume_position, 0
+            self.player.setPosition(position)  # продолжаем с места, где остановились в прошлый раз
+            self.position_changed.emit(position)
+            return
+        if status != QMediaPlayer.MediaStatus.EndOfMedia:
+            return
+        if self.sender() is self._fading_out:
+            self._finish_transition()
+            return
+        if self.sender() is not self.player:
+            return
+        if not self._begin_transition(finished=True):
+            self.stop()
+            self.index = -1
+            self.current_index_changed.emit(self.index)
+            self._preload_next()
+
+class PlaylistModel(QAbstractListModel):
+    """
+    Треки текущего плейлиста для QListView. Повторяет изменения контроллера по сигналам,
+    поэтому вставка, удаление, перенос и смена трека затрагивают только свои строки.
+    Номер строки и выделение играющего трека рисует PlaylistItemDelegate.
+    """
+    DurationRole = Qt.ItemDataRole.UserRole + 1
+    current_row_changed = pyqtSignal(int, int) # прежняя и новая строка играющего трека
+
+    def __init__(self, controller, parent=None):
+        super().__init__(parent)
+        self.ctrl = controller
+        self._tracks = Playlist()
+        self._current = -1
+        self._reset(controller.get_tracks())
+        self._current = controller.index
+        controller.tracks_changed.connect(self._reset)
+        controller.tracks_inserted.connect(self._insert)
+        controller.tracks_removed.connect(self._remove)
+        controller.tracks_moved.connect(self._move)
+        controller.current_index_changed.connect(self._set_current)
+        controller.metadata.updated.connect(self._metadata_updated)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._tracks)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        path = self._tracks[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self.ctrl.track_title(path)
+        if role in (Qt.ItemDataRole.UserRole, Qt.ItemDataRole.ToolTipRole):
+            return path
+        if role == self.DurationRole:
+            entry = self.ctrl.metadata.get(path)
+            return entry.get("duration_ms", 0) if entry else 0
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemFlag.ItemIsDropEnabled
+        return Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable | Qt.ItemFlag.ItemIsDragEnabled
+
+    def supportedDropActions(self):
+        return Qt.DropAction.MoveAction
+
+    def moveRows(self, source_parent, source_row, count, dest_parent, dest_child):
+        # QListView в режиме InternalMove переносит строки через moveRow; порядок меняет контроллер
+        if source_parent.isValid() or dest_parent.isValid() or count <= 0:
+            return False
+        if source_row <= dest_child <= source_row + count:
+            return False
+        return self.ctrl.move_tracks(source_row, count, dest_child)
+
+    def current_row(self):
+        return self._current
+
+    def _reset(self, tracks):
+        self.beginResetModel()
+        self._tracks = Playlist(tracks)
+        self.endResetModel()
+
+    def _insert(self, row, paths):
+        # Контроллер добавляет только в конец плейлиста
+        self.beginInsertRows(QModelIndex(), row, row + len(paths) - 1)
+        self._tracks.extend(paths)
+        self.endInsertRows()
+
+    def _remove(self, rows):
+        ranges = []  # непрерывные диапазоны строк, с конца
+        for row in sorted(rows, reverse=True):
+            if ranges and ranges[-1][0] == row + 1:
+                ranges[-1][0] = row
             else:
-                self.stop()
-                self.index = -1
-                self.current_index_changed.emit(self.index)
+                ranges.append([row, row])
+        if len(ranges) > MODEL_REMOVE_RANGES_MAX:
+            self.beginResetModel()
+            self._tracks.remove_rows(rows)
+            self.endResetModel()
+            return
+        for first, last in ranges:
+            self.beginRemoveRows(QModelIndex(), first, last)
+            self._tracks.remove_rows(range(first, last + 1))
+            self.endRemoveRows()
+
+    def _move(self, row, count, dest):
+        if not self.beginMoveRows(QModelIndex(), row, row + count - 1, QModelIndex(), dest):
+            return
+        self._tracks.move(row, count, dest)
+        self.endMoveRows()
+
+    def _set_current(self, row):
+        # Без dataChanged: QListView на него перекладывает все строки, а данные строк не менялись —
+        # виду достаточно перерисовать две строки (см. GlobalAudioWidget._repaint_rows)
+        old, self._current = self._current, row
+        if old != row:
+            self.current_row_changed.emit(old, row)
+
+    def _metadata_updated(self, paths):
+        for path in paths:
+            row = self._tracks.index_of(path)
+            if row >= 0:
+                index = self.index(row)
+                self.dataChanged.emit(index, index)
+
+
+class PlaylistItemDelegate(QStyledItemDelegate):
+    """Дорисовывает номер строки и длительность, играющий трек выделяет жирным."""
+    def initStyleOption(self, option, index):
+        super().initStyleOption(option, index)
+        text = f"{index.row() + 1}. {option.text}"
+        duration = index.data(PlaylistModel.DurationRole)
+        if duration:
+            text += f"  ({format_duration(duration)})"
+        option.text = text
+        if index.row() == index.model().current_row():
+            option.font.setBold(True)
+
 
 class GlobalAudioWidget(QWidget):
     close_requested = pyqtSignal()
@@ -3849,7 +6657,12 @@ class GlobalAudioWidget(QWidget):
         transport.addStretch()
         main_layout.addLayout(transport)
 
-        self.list = QListWidget()
+        self.model = PlaylistModel(self.ctrl, self)
+        self.list = QListView()
+        self.list.setObjectName("Playlist")
+        self.list.setModel(self.model)
+        self.list.setItemDelegate(PlaylistItemDelegate(self.list))
+        self.list.setUniformItemSizes(True)
         self.list.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
         self.list.setDragDropMode(QAbstractItemView.DragDropMode.InternalMove)
         self.list.setDefaultDropAction(Qt.DropAction.MoveAction)
@@ -3862,6 +6675,8 @@ class GlobalAudioWidget(QWidget):
         self.audio_add_files_btn = QToolButton()
         self.audio_add_folder_btn = QToolButton()
         self.audio_remove_btn = QToolButton()
+        self.audio_scan_label = QLabel()
+        self.audio_scan_cancel_btn = QToolButton()
         self.audio_vol_slider = QSlider(Qt.Orientation.Horizontal)
         self.audio_vol_slider.setRange(0, 100)
         self.audio_vol_slider.setFixedSize(64, 16)
@@ -3869,6 +6684,8 @@ class GlobalAudioWidget(QWidget):
         fb.addWidget(self.audio_add_files_btn)
         fb.addWidget(self.audio_add_folder_btn)
         fb.addWidget(self.audio_remove_btn)
+        fb.addWidget(self.audio_scan_label)
+        fb.addWidget(self.audio_scan_cancel_btn)
         fb.addStretch()
         fb.addWidget(self.audio_vol_slider)
         fb.addWidget(self.audio_mute_btn)
@@ -3880,54 +6697,60 @@ class GlobalAudioWidget(QWidget):
         self.play_btn.clicked.connect(self.ctrl.toggle_play_pause)
         self.stop_btn.clicked.connect(self.ctrl.stop)
         self.next_btn.clicked.connect(self.ctrl.next)
-        self.progress_slider.sliderMoved.connect(self.ctrl.player.setPosition)
+        self.progress_slider.sliderMoved.connect(self.ctrl.set_position)
         self.progress_slider.sliderPressed.connect(lambda: setattr(self, 'is_slider_pressed', True))
         self.progress_slider.sliderReleased.connect(lambda: setattr(self, 'is_slider_pressed', False))
-        self.list.itemDoubleClicked.connect(self._play_selected)
-        self.list.model().rowsMoved.connect(self._on_rows_moved)
+        self.list.doubleClicked.connect(self._play_selected)
+        self.model.current_row_changed.connect(self._repaint_rows)
         self.audio_add_files_btn.clicked.connect(self._add_files)
         self.audio_add_folder_btn.clicked.connect(self._add_folder)
         self.audio_remove_btn.clicked.connect(self._remove_selected)
+        self.audio_scan_cancel_btn.clicked.connect(self.ctrl.cancel_folder_scan)
         self.audio_vol_slider.valueChanged.connect(self.ctrl.set_volume)
         self.audio_mute_btn.clicked.connect(self._toggle_mute)
 
         self.ctrl.playlists_changed.connect(self._on_playlists_changed)
         self.ctrl.current_playlist_changed.connect(self._on_current_playlist)
-        self.ctrl.tracks_changed.connect(self._reload_tracks)
+        self.ctrl.tracks_changed.connect(self._update_total)
+        self.ctrl.tracks_inserted.connect(self._update_total)
+        self.ctrl.tracks_removed.connect(self._update_total)
+        self.ctrl.metadata.updated.connect(self._update_total)
         self.ctrl.current_index_changed.connect(self._on_current_changed)
         self.ctrl.state_changed.connect(self._on_state_changed)
-        self.ctrl.player.positionChanged.connect(self._on_position_changed)
-        self.ctrl.player.durationChanged.connect(self._on_duration_changed)
-        self.ctrl.audio_output.volumeChanged.connect(self.update_slider_volume)
-        self.ctrl.audio_output.mutedChanged.connect(lambda muted: self._update_mute_icon())
+        self.ctrl.scan_progress.connect(self._on_scan_progress)
+        self.ctrl.scan_finished.connect(lambda added, cancelled: self._set_scan_visible(False))
+        self.ctrl.position_changed.connect(self._on_position_changed)
+        self.ctrl.duration_changed.connect(self._on_duration_changed)
+        self.ctrl.volume_changed.connect(self.update_slider_volume)
+        self.ctrl.muted_changed.connect(lambda muted: self._update_mute_icon())
         
         self._on_playlists_changed(getattr(self.ctrl, "playlist_order", []), getattr(self.ctrl, "current_playlist", ""))
-        self._reload_tracks(self.ctrl.get_tracks())
         self._on_current_changed(getattr(self.ctrl, "index", -1))
         
         dm = self.ctrl.parent()
         if dm and hasattr(dm, 'get_settings'):
             self.apply_theme_icons(dm.get_settings())
         
-        self.update_slider_volume(self.ctrl.audio_output.volume())
-        self._on_duration_changed(self.ctrl.player.duration())
+        self.update_slider_volume(self.ctrl.volume() / 100.0)
+        self._on_duration_changed(self.ctrl.duration())
+        self._set_scan_visible(self.ctrl.is_scanning())
 
     # ДОБАВИТЬ ЭТОТ МЕТОД ВНУТРЬ КЛАССА GlobalAudioWidget
     def apply_zen_style(self, floating_fg, component_bg, hover_bg, border_color):
         """Применяет специальный стиль для режима Zen."""
         stylesheet = f"""
             /* Стили для плеера в ZenMode */
-            QListWidget {{
+            QListView#Playlist {{
                 background-color: {component_bg};
                 color: {floating_fg};
                 border: 1px solid {border_color};
                 border-radius: 6px;
             }}
-            QListWidget::item {{
+            QListView#Playlist::item {{
                 padding: 5px;
                 color: {floating_fg};
             }}
-            QListWidget::item:selected {{
+            QListView#Playlist::item:selected {{
                 background-color: {hover_bg};
                 border-radius: 4px;
             }}
@@ -3991,15 +6814,17 @@ class GlobalAudioWidget(QWidget):
         self.audio_add_files_btn.setIcon(ThemedIconProvider.icon("add_file", settings))
         self.audio_add_folder_btn.setIcon(ThemedIconProvider.icon("add_folder", settings))
         self.audio_remove_btn.setIcon(ThemedIconProvider.icon("trash", settings))
-        self._on_state_changed(self.ctrl.player.playbackState())
+        self.audio_scan_cancel_btn.setIcon(ThemedIconProvider.icon("close", settings))
+        self._on_state_changed(self.ctrl.playback_state())
         self._update_mute_icon()
         self.retranslate_ui()
 
     def retranslate_ui(self):
-        self.playlist_label.setText(self.ctrl.current_playlist or self.loc.get("playlist", "Плейлист"))
+        self._set_playlist_label(self.ctrl.current_playlist)
         self.audio_add_files_btn.setToolTip(self.loc.get("audio_add_files", "Добавить файлы"))
         self.audio_add_folder_btn.setToolTip(self.loc.get("audio_add_folder", "Добавить папку"))
         self.audio_remove_btn.setToolTip(self.loc.get("audio_remove_selected", "Удалить выбранные"))
+        self.audio_scan_cancel_btn.setToolTip(self.loc.get("audio_scan_cancel", "Остановить добавление папки"))
         self.audio_vol_slider.setToolTip(self.loc.get("audio_volume", "Громкость"))
         self._update_mute_icon()
         
@@ -4012,13 +6837,18 @@ class GlobalAudioWidget(QWidget):
         self.progress_slider.setRange(0, dur)
         self.duration_label.setText(f"{dur//60000:02d}:{dur//1000%60:02d}")
         if dur > 0:
-            self._on_position_changed(self.ctrl.player.position())
+            self._on_position_changed(self.ctrl.position())
 
     def _on_playlists_changed(self, names, current):
-        self.playlist_label.setText(current or (names[0] if names else self.loc.get("playlist", "Плейлист")))
+        self._set_playlist_label(current or (names[0] if names else ""))
 
     def _on_current_playlist(self, name: str):
-        self.playlist_label.setText(name or self.loc.get("playlist", "Плейлист"))
+        self._set_playlist_label(name)
+
+    def _set_playlist_label(self, name):
+        text = name or self.loc.get("playlist", "Плейлист")
+        total = self.ctrl.total_duration_ms()
+        self.playlist_label.setText(f"{text} · {format_duration(total)}" if total else text)
 
     def _open_playlist_menu(self):
         dm = self.ctrl.parent()
@@ -4054,33 +6884,20 @@ class GlobalAudioWidget(QWidget):
         if ok == QMessageBox.StandardButton.Yes:
             self.ctrl.delete_playlist(cur)
 
-    def _reload_tracks(self, files: list):
-        self.list.clear()
-        for i, path in enumerate(files):
-            it = QListWidgetItem(f"{i+1}. {os.path.basename(path)}")
-            it.setData(Qt.ItemDataRole.UserRole, path)
-            self.list.addItem(it)
+    def _repaint_rows(self, *rows):
+        for row in rows:
+            if 0 <= row < self.model.rowCount():
+                self.list.update(self.model.index(row))
 
-    def _on_rows_moved(self, parent, start, end, destParent, destRow):
-        new_files = [self.list.item(i).data(Qt.ItemDataRole.UserRole) for i in range(self.list.count())]
-        current_path = self.ctrl.player.source().toLocalFile() if self.ctrl.player.source().isValid() else None
-        self.ctrl.set_order(new_files, current_path)
-        self._renumber()
-
-    def _renumber(self):
-        for i in range(self.list.count()):
-            it = self.list.item(i)
-            it.setText(f"{i+1}. {os.path.basename(it.data(Qt.ItemDataRole.UserRole))}")
+    def _update_total(self, *args):
+        self._set_playlist_label(self.ctrl.current_playlist)
 
     def _on_current_changed(self, idx: int):
-        for i in range(self.list.count()):
-            it = self.list.item(i)
-            f = it.font()
-            f.setBold(i == idx)
-            it.setFont(f)
-        if 0 <= idx < self.list.count():
-            self.list.setCurrentRow(idx)
-            self.list.scrollToItem(self.list.item(idx), QAbstractItemView.ScrollHint.PositionAtCenter)
+        # Жирный шрифт играющего трека рисует делегат; здесь только прокрутка к нему
+        if 0 <= idx < self.model.rowCount():
+            index = self.model.index(idx)
+            self.list.setCurrentIndex(index)
+            self.list.scrollTo(index, QAbstractItemView.ScrollHint.PositionAtCenter)
 
     def _on_state_changed(self, st):
         dm = self.ctrl.parent()
@@ -4092,8 +6909,8 @@ class GlobalAudioWidget(QWidget):
             self.play_btn.setIcon(ThemedIconProvider.icon("play", settings))
             self.play_btn.setToolTip(self.loc.get("audio_play", "Воспроизвести"))
 
-    def _play_selected(self, item: QListWidgetItem):
-        self.ctrl.play_index(self.list.row(item))
+    def _play_selected(self, index: QModelIndex):
+        self.ctrl.play_index(index.row())
 
     def _add_files(self):
         paths, _ = QFileDialog.getOpenFileNames(self, self.loc.get("audio_add_files", "Добавить файлы"), "", "Audio Files (*.mp3 *.wav *.ogg *.flac *.m4a);;All Files (*)")
@@ -4104,9 +6921,22 @@ class GlobalAudioWidget(QWidget):
         folder = QFileDialog.getExistingDirectory(self, self.loc.get("audio_add_folder", "Добавить папку"), "")
         if folder:
             self.ctrl.add_folder(folder)
+            self._set_scan_visible(self.ctrl.is_scanning())
+
+    def _set_scan_visible(self, visible: bool):
+        self.audio_scan_label.setVisible(visible)
+        self.audio_scan_cancel_btn.setVisible(visible)
+        if visible and not self.audio_scan_label.text():
+            self.audio_scan_label.setText(self.loc.get("audio_scan_started", "Поиск музыки..."))
+        elif not visible:
+            self.audio_scan_label.clear()
+
+    def _on_scan_progress(self, seen: int, added: int):
+        self._set_scan_visible(True)
+        self.audio_scan_label.setText(self.loc.get("audio_scan_progress", "Файлов: {seen}, добавлено: {added}").format(seen=seen, added=added))
 
     def _remove_selected(self):
-        rows = [self.list.row(it) for it in self.list.selectedItems()]
+        rows = [index.row() for index in self.list.selectionModel().selectedRows()]
         self.ctrl.remove_indexes(rows)
 
     def _toggle_mute(self):
@@ -4122,6 +6952,8 @@ class GlobalAudioWidget(QWidget):
 
 class TriggerButton(QPushButton):
     settings_changed = pyqtSignal(dict)
+    backup_finished = pyqtSignal(str, str, object)  # путь копии, текст ошибки, поколение данных
+    save_failed = pyqtSignal()  # фоновая запись данных не удалась, записи ждут повтора в хранилище
     
     def __init__(self, loc_manager):
         super().__init__("")
@@ -4140,13 +6972,32 @@ class TriggerButton(QPushButton):
         self.is_entering_zen = False
         self.is_switching_to_window = False
         self.note_to_select_after_load = None
-        self.all_notes_cache = []
+        self.notes_by_ts = {}  # timestamp -> заметка; единственный источник, порядок вставки = порядок заметок
+        self._notes_list = None  # all_notes_cache, собранный из notes_by_ts после последнего изменения
         self.note_tree_cache = []
+        self.task_lists_cache = {"Default": []}
+        self.active_task_list_cache = "Default"
+        self.store = None
+        self.writer = StoreWriter()
+        self.backup_store = BackupStore(BACKUP_DIR, self.writer)
+        self.note_history = NoteHistory(HISTORY_DIR)
+        self._backup_generation = None  # поколение данных, попавшее в последний бэкап
+        self._backup_running = False
+        self.backup_finished.connect(self._on_backup_finished)
+        self._pending_save = None  # (container, данные) последнего запроса на сохранение
+        # Частые сохранения (каждый символ в редакторе) схлопываются в одну запись
+        self.save_timer = QTimer(self)
+        self.save_timer.setSingleShot(True)
+        self.save_timer.setInterval(SAVE_DEBOUNCE_MS)
+        self.save_timer.timeout.connect(self._flush_pending_save)
+        self.save_failed.connect(self.save_timer.start)  # повтор через SAVE_DEBOUNCE_MS
         self.notes_root_folder = "Заметки"
         self.global_audio = GlobalAudioController(self)
         self.zen_return_to_window_mode = False
         
         self.load_settings()
+        ThemedIconProvider.prerender(self.settings)
+        self.store = self._create_store()
         self._load_and_validate_data()
         self.loc.language_changed.connect(self._on_language_changed)
         self.loc.set_language(self.settings.get("language", "ru_RU"))
@@ -4155,16 +7006,127 @@ class TriggerButton(QPushButton):
         self.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
         self.customContextMenuRequested.connect(self._on_context_menu)
         self.backup_timer = QTimer(self)
-        self.backup_timer.timeout.connect(self.create_backup)
+        self.backup_timer.timeout.connect(lambda: self.create_backup(only_if_changed=True))
         self.backup_timer.start(600000)
         QApplication.instance().aboutToQuit.connect(self.on_app_quit)
         self._popup_lock = False
 
 
+    def _create_store(self):
+        """Создает хранилище по настройке storage_backend (json | sqlite)."""
+        if self.settings.get("storage_backend", "json") == "sqlite":
+            try:
+                return SqliteDataStore(SQLITE_FILE, DATA_FILE, JOURNAL_FILE)
+            except sqlite3.DatabaseError as e:
+                return self._recover_corrupt_database(e)
+            except sqlite3.Error as e:
+                print(f"Не удалось открыть {SQLITE_FILE}, используется JSON: {e}")
+        # Возврат на JSON: если ведущей была база, сначала выгружаем ее в data.json
+        SqliteDataStore.release_to_json(SQLITE_FILE, DATA_FILE, JOURNAL_FILE)
+        return DataJournal(DATA_FILE, JOURNAL_FILE)
+
+    def _recover_corrupt_database(self, error):
+        """
+        Откладывает поврежденную базу и открывает новую. data.json мог остаться от последнего
+        переключения на SQLite, поэтому сначала берем самый свежий бэкап, если он новее.
+        Пользователь видит, куда отложен файл и откуда взяты данные.
+        """
+        print(f"База {SQLITE_FILE} повреждена: {error}")
+        aside = SqliteDataStore.set_aside_corrupt(SQLITE_FILE)
+        json_time = max((os.path.getmtime(p) for p in (DATA_FILE, JOURNAL_FILE) if os.path.exists(p)), default=0)
+        restored = backup_time = None
+        for path, entry in self.backup_store.entries():
+            if entry["time"].timestamp() <= json_time:
+                break
+            try:
+                restored, backup_time = self.backup_store.load(path), entry["time"]
+                break
+            except (OSError, KeyError, ValueError) as e:  # ValueError включает JSONDecodeError
+                print(f"Не удалось прочитать бэкап {path}: {e}")
+        try:
+            store = SqliteDataStore(SQLITE_FILE, DATA_FILE, JOURNAL_FILE)
+        except sqlite3.Error as e:
+            print(f"Не удалось открыть {SQLITE_FILE}, используется JSON: {e}")
+            store = DataJournal(DATA_FILE, JOURNAL_FILE)
+        if restored is not None:
+            store.write_snapshot(restored)  # база становится ведущей и не переносит устаревший data.json
+            text = self.loc.get("db_recovered_from_backup", "Файл {db} поврежден и отложен как {aside}.\nДанные восстановлены из резервной копии от {date}.")
+            date = backup_time
+        else:
+            text = self.loc.get("db_recovered_from_json", "Файл {db} поврежден и отложен как {aside}.\nДанные загружены из {json} (сохранен {date}).")
+            date = datetime.fromtimestamp(json_time) if json_time else None
+        QMessageBox.warning(self, self.loc.get("db_recovered_title", "База данных повреждена"),
+                            text.format(db=SQLITE_FILE, aside=aside or SQLITE_FILE, json=DATA_FILE,
+                                        date=date.strftime("%Y-%m-%d %H:%M:%S") if date else "—"))
+        return store
+
+    def has_lazy_note_bodies(self):
+        return bool(self.store and self.store.lazy_bodies)
+
+    def search_notes(self, text):
+        """Кандидаты для поиска из индекса хранилища (множество timestamp) или None."""
+        return self.store.search(text) if self.store else None
+
     def on_app_quit(self):
         container = self._choose_ui()
         if container:
             self.save_app_data(force_container=container)
+        self.flush_saves()
+        self.global_audio.flush()
+        try:
+            self.store.compact()
+        except Exception as e:
+            print(f"Не удалось свернуть журнал: {e}")
+        self.writer.close()
+        self.store.close()
+
+    def _schedule_save(self, container, data):
+        """Запоминает последние данные и откладывает запись на SAVE_DEBOUNCE_MS."""
+        self._pending_save = (container, data)
+        self.save_timer.start()
+
+    def _flush_pending_save(self):
+        """Считает изменения в GUI-потоке и отдает запись на диск фоновому потоку."""
+        self.save_timer.stop()
+        store = self.store
+        if self._pending_save is None:
+            if store and store.has_unwritten():
+                self.writer.submit(lambda: self._write_pending(store, []))  # повтор неудавшейся записи
+            return
+        container, data = self._pending_save
+        self._pending_save = None
+        previous_texts = {}
+        try:
+            records = store.prepare(data, previous_texts)
+        except Exception as e:
+            print(f"Ошибка сохранения данных: {e}")
+            return
+        if records:
+            # История пишется раньше данных: ленивому хранилищу прежний текст еще доступен с диска
+            history = self.note_history
+            budget = max(0, int(self.settings.get("note_history_budget_kb", 256))) * 1024
+            load_previous = store.get_body if store.lazy_bodies else None
+            self.writer.submit(lambda: history.apply_records(records, previous_texts, budget, load_previous))
+        if records or store.has_unwritten():
+            self.writer.submit(lambda: self._write_pending(store, records))
+        try:
+            if container and container.isVisible():
+                container.set_status_saved()
+        except RuntimeError:
+            pass  # окно уже удалено
+
+    def _write_pending(self, store, records):
+        # Выполняется в потоке записи; при ошибке записи остаются в хранилище и повторяются
+        try:
+            store.write_pending(records)
+        except Exception as e:
+            print(f"Ошибка записи данных, повтор позже: {e}")
+            self.save_failed.emit()
+
+    def flush_saves(self):
+        """Немедленно записывает отложенное сохранение и ждет завершения фоновой записи."""
+        self._flush_pending_save()
+        self.writer.flush()
         
     def _on_left_click(self):
         if self.main_window and self.main_window.isVisible():
@@ -4181,16 +7143,17 @@ class TriggerButton(QPushButton):
             self.show_main_popup()
 
     def save_settings(self):
-        try:
-            with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(self.settings, f, ensure_ascii=False, indent=4)
-        except Exception as e:
-            print(f"Ошибка сохранения настроек: {e}")
+        settings = json.loads(json.dumps(self.settings))  # копия: запись идет в потоке записи
+        def job():
+            try:
+                write_json_atomic(SETTINGS_FILE, settings)
+            except Exception as e:
+                print(f"Ошибка сохранения настроек: {e}")
+        self.writer.submit(job)
 
     def load_settings(self):
         try:
-            with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
-                loaded_settings = json.load(f)
+            loaded_settings = read_json_recovering(SETTINGS_FILE)
             settings = DEFAULT_SETTINGS.copy()
             settings.update(loaded_settings)
             self.settings = settings
@@ -4200,9 +7163,23 @@ class TriggerButton(QPushButton):
     def get_settings(self):
         return self.settings
 
+    @property
+    def all_notes_cache(self):
+        """Заметки списком в порядке notes_by_ts; пересобирается лениво, только после изменений."""
+        if self._notes_list is None:
+            self._notes_list = list(self.notes_by_ts.values())
+        return self._notes_list
+
     def get_all_notes_from_cache(self):
         return self.all_notes_cache
 
+    def get_note_from_cache(self, timestamp):
+        return self.notes_by_ts.get(timestamp)
+
+    def _set_notes_cache(self, notes):
+        self.notes_by_ts = {n['timestamp']: n for n in notes if n.get('timestamp')}
+        self._notes_list = None
+
     def _choose_ui(self):
         # Этот метод теперь также обновляет last_active_ui
         if self.main_window and self.main_window.isVisible():
@@ -4216,8 +7193,7 @@ class TriggerButton(QPushButton):
     def _get_current_note_ts(self, container):
         if not container: return None
         try:
-            if item := container.notes_panel.current_note_item:
-                return (item.data(Qt.ItemDataRole.UserRole) or {}).get('timestamp')
+            return container.notes_panel.current_note_ts
         except Exception:
             pass
         return None
@@ -4422,6 +7398,9 @@ class TriggerButton(QPushButton):
     def update_settings(self, new_settings):
         self.settings = new_settings
         self.save_settings()
+        # Иконки старой темы больше не нужны; новую рендерим одним проходом
+        ThemedIconProvider.invalidate(new_settings)
+        ThemedIconProvider.prerender(new_settings)
         self.update_position_and_style()
         
         if self.main_popup: 
@@ -4440,23 +7419,54 @@ class TriggerButton(QPushButton):
         
         self.settings_changed.emit(self.settings)
 
-    def create_backup(self):
+    def create_backup(self, only_if_changed=False):
+        """
+        Создает бэкап в потоке записи (после уже поставленных в очередь сохранений).
+        only_if_changed — для таймера: если данные не менялись с прошлого бэкапа, ничего не делаем.
+        """
         # Сохраняем актуальные данные перед бэкапом
         self.save_app_data()
-        
-        if not os.path.exists(BACKUP_DIR):
-            os.makedirs(BACKUP_DIR)
-        
-        if os.path.exists(DATA_FILE):
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_path = os.path.join(BACKUP_DIR, f"data_{timestamp}.bak")
+        self._flush_pending_save()
+        if not self.store or self._backup_running:
+            return
+        generation = self.store.generation
+        if only_if_changed and generation == self._backup_generation:
+            return
+
+        store, backup_store = self.store, self.backup_store
+        def job():
             try:
-                # ИЗМЕНЕНИЕ: Копируем основной файл данных, который уже содержит все структуры
-                shutil.copyfile(DATA_FILE, backup_path)
-                print(f"Резервная копия создана: {backup_path}")
-                QMessageBox.information(self, "Бэкап", f"Резервная копия успешно создана!")
+                # В бэкап попадают данные формата data.json, независимо от хранилища.
+                # Поколение живет только до перезапуска, поэтому при only_if_changed
+                # сверяется еще и хеш содержимого с последним снимком
+                path = backup_store.create(store.export_data(), only_if_changed=only_if_changed)
+                path, error = path or "", ""
             except Exception as e:
-                print(f"Не удалось создать резервную копию: {e}")
+                path, error = "", str(e)
+            try:
+                self.backup_finished.emit(path, error, generation)
+            except RuntimeError:
+                pass  # программа уже закрывается, окно удалено
+
+        self._backup_running = True
+        self.writer.submit(job)
+
+    def _on_backup_finished(self, path, error, generation):
+        self._backup_running = False
+        if error:
+            print(f"Не удалось создать резервную копию: {error}")
+            self.show_status_message(self.loc.get("backup_failed_status", "Не удалось создать резервную копию"))
+            return
+        self._backup_generation = generation
+        if not path:
+            return  # данные совпали с последним снимком, копия не нужна
+        print(f"Резервная копия создана: {path}")
+        self.show_status_message(self.loc.get("backup_created_status", "Резервная копия создана"))
+
+    def show_status_message(self, text):
+        """Ненавязчивое уведомление в строке состояния активного окна (без модального диалога)."""
+        if ui := self._choose_ui():
+            ui.show_status_message(text)
 
     def restore_from_backup(self):
         dialog = BackupManagerDialog(self, self.loc)
@@ -4468,11 +7478,11 @@ class TriggerButton(QPushButton):
             reply = QMessageBox.question(self, self.loc.get("restore_menu"), self.loc.get("backup_confirm_restore").format(date=dialog.get_date_from_filename(selected_file)))
             if reply == QMessageBox.StandardButton.Yes:
                 try:
-                    shutil.copyfile(selected_file, DATA_FILE)
-                    
-                    # ИЗМЕНЕНИЕ: Принудительно перезагружаем данные в активное окно
+                    restored = self.backup_store.load(selected_file)
+                    # Копия сразу пишется в хранилище и кеш, без повторного чтения с диска
+                    self._load_and_validate_data(restored)
                     if ui := self._choose_ui():
-                        self.reload_from_disk(ui)
+                        self._update_ui_from_cache(ui)
                     
                     QMessageBox.information(self, "Успех", "Данные восстановлены.")
                 except Exception as e:
@@ -4548,14 +7558,16 @@ class TriggerButton(QPushButton):
             "note_tree": [{"type": "folder", "name": self.notes_root_folder, "children": [{"type": "note", "timestamp": now}]}]
         }
 
-    def _load_and_validate_data(self):
-        data_changed = False
-        try:
-            with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            data = self._create_default_data()
-            data_changed = True
+    def _load_and_validate_data(self, data=None):
+        """Читает данные из хранилища или, если data передана (восстановление), записывает ее в хранилище."""
+        self.flush_saves()
+        data_changed = data is not None
+        if data is None:
+            try:
+                data = self._load_store()
+            except (FileNotFoundError, json.JSONDecodeError, sqlite3.DatabaseError):
+                data = self._create_default_data()
+                data_changed = True
         
         if "notes" not in data or not isinstance(data["notes"], list):
             data["notes"] = []
@@ -4573,33 +7585,45 @@ class TriggerButton(QPushButton):
         if self._dedupe_notes_and_fix_tree(data): data_changed = True
         
         if data_changed:
-            try:
-                with open(DATA_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=4)
-            except Exception as e:
-                print(f"Error saving validated data: {e}")
+            # Состояние хранилища меняется сразу, а сам снимок пишет поток записи
+            store = self.store
+            records = store.stage_snapshot(data)
+            self.writer.submit(lambda: self._write_pending(store, records))
                 
-        self.all_notes_cache = data.get("notes", [])
+        self.task_lists_cache = data.get("task_lists", {})
+        self.active_task_list_cache = data.get("active_task_list", "Default")
+        self._set_notes_cache(data.get("notes", []))
         self.note_tree_cache = self._reconcile_note_tree_with_notes(data.get("note_tree", []), self.all_notes_cache)
 
-    def reload_from_disk(self, container):
-        self._load_and_validate_data()
+    def _load_store(self):
+        try:
+            return self.store.load()
+        except sqlite3.DatabaseError as e:
+            if not isinstance(self.store, SqliteDataStore):
+                raise
+            # Данные по умолчанию поверх поврежденной базы не пишем: откладываем ее
+            # и открываем новую (из свежего бэкапа или data.json)
+            self.store.close()
+            self.store = self._recover_corrupt_database(e)
+            return self.store.load()
+
+    def reload_from_disk(self, container, force=False):
+        # Кеш в памяти ведущий; с диска перечитываем, только если файл поменяли извне.
+        # Диск не ждем: пока поток записи пишет (или повторяет) наши изменения, файлы меняем
+        # мы сами, и проверка откладывается до следующего открытия окна
+        self._flush_pending_save()
+        own_writes = self.writer.busy() or self.store.has_unwritten()
+        if force or (not own_writes and self.store.changed_on_disk()):
+            self._load_and_validate_data()
         self._update_ui_from_cache(container)
 
     def _update_ui_from_cache(self, container):
         if not container: return
-        try:
-             with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-        except Exception:
-            data = {}
-            
-        task_lists = data.get("task_lists", {})
-        active_list = data.get("active_task_list", "Default")
-        container.tasks_panel.load_task_lists(task_lists, active_list)
+        # Задачи берем из кеша: на диске они могут лежать в журнале, а не в снимке
+        container.tasks_panel.load_task_lists(self.task_lists_cache, self.active_task_list_cache)
         
         notes_panel = container.notes_panel
-        notes_panel.note_list_widget.blockSignals(True)
+        notes_panel.ignore_selection_changes = True
         try:
             if isinstance(container, MainPopup):
                 folder = self._find_folder_node(self.note_tree_cache, self.notes_root_folder) or {"children": []}
@@ -4615,9 +7639,9 @@ class TriggerButton(QPushButton):
                 notes_panel.find_and_select_note_by_timestamp(self.note_to_select_after_load)
                 self.note_to_select_after_load = None
         finally:
-            notes_panel.note_list_widget.blockSignals(False)
-            if notes_panel.note_list_widget.currentItem():
-                notes_panel.display_selected_note(notes_panel.note_list_widget.currentItem(), None)
+            notes_panel.ignore_selection_changes = False
+            if notes_panel.note_list_view.currentIndex().isValid():
+                notes_panel.display_selected_note(notes_panel.note_list_view.currentIndex())
             else:
                 notes_panel.clear_for_new_note(force=True)
                 
@@ -4723,16 +7747,19 @@ class TriggerButton(QPushButton):
             
             # Обновляем кеш заметок данными из редактора
             ui_notes = container.notes_panel.get_notes_data()
-            all_notes_dict = {n['timestamp']: n for n in self.all_notes_cache}
             for note in ui_notes:
-                if note.get("timestamp"):
-                    all_notes_dict[note['timestamp']] = note
-            self.all_notes_cache = list(all_notes_dict.values())
+                ts = note.get("timestamp")
+                if ts and self.notes_by_ts.get(ts) is not note:
+                    self.notes_by_ts[ts] = note
+                    self._notes_list = None
 
             # Дерево берем из WindowMain, если он активен, иначе из кеша
             if isinstance(container, WindowMain):
                 self.note_tree_cache = container.get_note_tree_data()
 
+            self.task_lists_cache = tasks_data
+            self.active_task_list_cache = active_task_list
+
             data_to_save = {
                 "task_lists": tasks_data,
                 "active_task_list": active_task_list,
@@ -4744,25 +7771,18 @@ class TriggerButton(QPushButton):
             return
 
         final_tree = self._reconcile_note_tree_with_notes(data_to_save.get("note_tree", []), data_to_save.get("notes", []))
-        data_to_save["note_tree"] = final_tree
+        data_to_save["note_tree"] = self.note_tree_cache = final_tree
         
-        try:
-            with open(DATA_FILE, 'w', encoding='utf-8') as f:
-                json.dump(data_to_save, f, ensure_ascii=False, indent=4)
-            if container.isVisible():
-                container.set_status_saved()
-        except Exception as e:
-            print(f"Ошибка сохранения данных: {e}")
+        self._schedule_save(container, data_to_save)
 
     def delete_note_by_timestamp_from_all_data(self, timestamp: str):
         if not timestamp: return
-        self.all_notes_cache = [note for note in self.all_notes_cache if note.get("timestamp") != timestamp]
-        def find_and_remove_in_tree(nodes):
-            nodes[:] = [node for node in nodes if not (node.get("type") == "note" and node.get("timestamp") == timestamp)]
-            for node in nodes:
-                if node.get("type") == "folder":
-                    find_and_remove_in_tree(node.get("children", []))
-        find_and_remove_in_tree(self.note_tree_cache)
+        if self.notes_by_ts.pop(timestamp, None) is not None:
+            self._notes_list = None
+        # Элемент дерева окна удаляется через его _note_items (on_note_deleted), а узел
+        # в note_tree_cache отбрасывает сверка дерева с заметками при сохранении
+        if self.main_window and hasattr(self.main_window, "tree_sidebar"):
+            self.main_window.tree_sidebar.on_note_deleted(timestamp)
         self.save_app_data()
 
     # В классе TriggerButton
@@ -4777,19 +7797,17 @@ class TriggerButton(QPushButton):
             return
 
         note_found = False
-        if note_timestamp:
-            # Ищем заметку в кеше и обновляем ее
-            for note in self.all_notes_cache:
-                if note.get("timestamp") == note_timestamp:
-                    note["text"] = new_text
-                    note_found = True
-                    break
+        if note_timestamp and (note := self.notes_by_ts.get(note_timestamp)) is not None:
+            # Заметка есть в кеше — обновляем ее
+            note["text"] = new_text
+            note_found = True
         
         if not note_found:
             # Если заметка не найдена (была новая), создаем ее
             new_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
             new_note = {"timestamp": new_timestamp, "text": new_text, "pinned": False}
-            self.all_notes_cache.append(new_note)
+            self.notes_by_ts[new_timestamp] = new_note
+            self._notes_list = None
             # Обновляем timestamp, чтобы после выхода из Zen выделилась новая заметка
             self.zen_source_timestamp = new_timestamp 
             # Добавляем новую заметку в дерево
@@ -4804,16 +7822,11 @@ class TriggerButton(QPushButton):
             "note_tree": self.note_tree_cache,
             # Данные по задачам просто берем из кеша, как они были до входа в Zen.
             # Это безопасно, так как в Zen мы их не меняем.
-            "task_lists": self.main_popup.tasks_panel.get_task_lists_data() if self.main_popup else {},
-            "active_task_list": self.main_popup.tasks_panel.current_list_name if self.main_popup else "Default"
+            "task_lists": self.task_lists_cache,
+            "active_task_list": self.active_task_list_cache
         }
 
-        try:
-            with open(DATA_FILE, 'w', encoding='utf-8') as f:
-                json.dump(data_to_save, f, ensure_ascii=False, indent=4)
-            print("Data saved successfully after Zen mode.")
-        except Exception as e:
-            print(f"Ошибка сохранения данных после Zen: {e}")
+        self._schedule_save(None, data_to_save)
 
 
     def main_popup_on_data_changed(self):
@@ -4821,8 +7834,6 @@ class TriggerButton(QPushButton):
         if not container: return
         try:
             is_dirty = getattr(container.notes_panel, "is_dirty", False)
-            if isinstance(container, WindowMain) and container.current_edit_target and container.current_edit_target[0] == "folder":
-                is_dirty = container.notes_panel.notes_editor.toPlainText() != container.notes_panel.saved_text
             if is_dirty:
                 container.on_data_changed()
             else:
@@ -4838,6 +7849,7 @@ class BackupManagerDialog(QDialog):
         self.setMinimumSize(400, 300)
         
         self.selected_backup = None
+        self.backup_store = getattr(parent, "backup_store", None) or BackupStore(BACKUP_DIR)
         
         layout = QVBoxLayout(self)
         info_label = QLabel(self.loc.get("backup_available_copies"))
@@ -4894,24 +7906,38 @@ class BackupManagerDialog(QDialog):
             self.backup_list_widget.addItem(self.loc.get("backup_no_copies"))
             return
             
-        backups = sorted(glob(os.path.join(BACKUP_DIR, "data_*.bak")), reverse=True)
+        # Все сведения берем из сводки BackupStore — без обхода каталога и чтения копий
+        backups = self.backup_store.entries()
         if not backups:
             self.backup_list_widget.addItem(self.loc.get("backup_no_copies"))
             return
             
-        for backup_file in backups:
-            item_text = self.get_date_from_filename(backup_file)
+        details_fmt = self.loc.get("backup_item_details", "{date} — заметок: {notes}, {size}")
+        self.backup_list_widget.setUpdatesEnabled(False)
+        for backup_file, info in backups:
+            date = info["time"].strftime("%Y-%m-%d %H:%M:%S")
+            if info["notes"] is None:
+                item_text = date
+            else:
+                item_text = details_fmt.format(date=date, notes=info["notes"], size=self._format_size(info["size"]))
             item = QListWidgetItem(item_text)
             item.setData(Qt.ItemDataRole.UserRole, backup_file)
             self.backup_list_widget.addItem(item)
+        self.backup_list_widget.setUpdatesEnabled(True)
+
+    @staticmethod
+    def _format_size(size):
+        if size is None:
+            return "?"
+        for unit in ("B", "KB", "MB"):
+            if size < 1024:
+                return f"{size:.0f} {unit}"
+            size /= 1024
+        return f"{size:.1f} GB"
     
     def get_date_from_filename(self, filename):
-        try:
-            timestamp_str = os.path.basename(filename).replace("data_", "").replace(".bak", "")
-            dt_obj = datetime.strptime(timestamp_str, "%Y%m%d_%H%M%S")
-            return dt_obj.strftime("%Y-%m-%d %H:%M:%S")
-        except ValueError:
-            return os.path.basename(filename)
+        dt_obj = self.backup_store.backup_time(filename)
+        return dt_obj.strftime("%Y-%m-%d %H:%M:%S") if dt_obj else os.path.basename(filename)
 
     def update_button_states(self):
         has_selection = bool(self.backup_list_widget.selectedItems())
@@ -4934,12 +7960,79 @@ class BackupManagerDialog(QDialog):
                                      self.loc.get("backup_confirm_delete"))
                                      
         if reply == QMessageBox.StandardButton.Yes:
-            try:
-                os.remove(file_path)
-                self.populate_backups()
-                self.update_button_states()
-            except OSError as e:
-                QMessageBox.critical(self, "Ошибка", f"Не удалось удалить файл: {e}")
+            # Из списка копия пропадает сразу, файлы удаляет поток записи
+            self.backup_store.delete(file_path)
+            self.populate_backups()
+            self.update_button_states()
+
+class NoteHistoryDialog(QDialog):
+    """Просмотр версий заметки; выбранная версия возвращается в selected_text."""
+    def __init__(self, parent, loc, revisions, settings):
+        super().__init__(parent)
+        self.loc = loc
+        self.revisions = revisions  # [(время, текст)] от новых к старым
+        self.selected_text = None
+        self.setWindowTitle(self.loc.get("note_history_title", "История версий"))
+        self.setMinimumSize(600, 400)
+
+        layout = QVBoxLayout(self)
+        splitter = QSplitter(Qt.Orientation.Horizontal)
+        self.revision_list = QListWidget()
+        self.preview = QPlainTextEdit()
+        self.preview.setReadOnly(True)
+        splitter.addWidget(self.revision_list)
+        splitter.addWidget(self.preview)
+        splitter.setSizes([180, 420])
+
+        button_layout = QHBoxLayout()
+        self.restore_button = QPushButton(self.loc.get("note_history_restore_btn", "Вернуть эту версию"))
+        self.cancel_button = QPushButton("Cancel")
+        button_layout.addStretch()
+        button_layout.addWidget(self.restore_button)
+        button_layout.addWidget(self.cancel_button)
+        layout.addWidget(splitter, 1)
+        layout.addLayout(button_layout)
+
+        current_label = self.loc.get("note_history_current", "текущая")
+        for i, (time_str, text) in enumerate(revisions):
+            item = QListWidgetItem(f"{time_str} ({current_label})" if i == 0 else time_str)
+            item.setData(Qt.ItemDataRole.UserRole, i)
+            self.revision_list.addItem(item)
+
+        self.revision_list.currentRowChanged.connect(self._show_revision)
+        self.revision_list.itemDoubleClicked.connect(self.accept)
+        self.restore_button.clicked.connect(self.accept)
+        self.cancel_button.clicked.connect(self.reject)
+        if revisions:
+            self.revision_list.setCurrentRow(0)
+        self.restore_button.setEnabled(bool(revisions))
+
+        is_dark, accent, bg, text_color, _ = theme_colors(settings)
+        comp_bg = QColor(bg).lighter(115).name() if is_dark else QColor(bg).darker(105).name()
+        border = "#555" if is_dark else "#ced4da"
+        self.setStyleSheet(f"""
+            QDialog {{ background-color: {bg}; }}
+            QListWidget, QPlainTextEdit {{
+                background-color: {comp_bg}; border: 1px solid {border};
+                color: {text_color}; border-radius: 4px;
+            }}
+            QListWidget::item:selected {{ background-color: {accent}; }}
+            QPushButton {{
+                background-color: {comp_bg}; color: {text_color}; border: 1px solid {border};
+                padding: 6px 12px; border-radius: 4px; min-width: 80px;
+            }}
+            QPushButton:hover {{ border-color: {accent}; }}
+        """)
+
+    def _show_revision(self, row):
+        if 0 <= row < len(self.revisions):
+            self.preview.setPlainText(self.revisions[row][1])
+
+    def accept(self):
+        row = self.revision_list.currentRow()
+        if 0 <= row < len(self.revisions):
+            self.selected_text = self.revisions[row][1]
+            super().accept()
 
 class ThemedIconProvider:
     SVG = {
@@ -4960,20 +8053,56 @@ class ThemedIconProvider:
         "file":"<svg viewBox='0 0 24 24'><path fill='{c}' d='M14 2H6a2 2 0 0 0-2 2v16a2 2 0 0 0 2 2h12a2 2 0 0 0 2-2V8l-6-6z M13 9V3.5L18.5 9H13z'/></svg>",
         "pin":"<svg viewBox='0 0 24 24'><path fill='{c}' d='M16 12V4h1V2H7v2h1v8l-2 2v2h5.2v6h1.6v-6H18v-2l-2-2z'/></svg>",
     }
+    # (имя, цвет, ширина, высота, devicePixelRatio) -> QIcon: SVG рендерится один раз на ключ
+    _cache = {}
+
+    @staticmethod
+    def _color(settings: dict) -> str:
+        is_dark = settings.get("theme") == "dark"
+        return settings.get("dark_theme_text") if is_dark else settings.get("light_theme_text")
+
+    @staticmethod
+    def _device_pixel_ratio() -> float:
+        app = QApplication.instance()
+        return app.devicePixelRatio() if app else 1.0
+
     @staticmethod
     def icon(name: str, settings: dict, size: QSize = QSize(18, 18)) -> QIcon:
         svg = ThemedIconProvider.SVG.get(name)
         if not svg: return QIcon()
-        is_dark = settings.get("theme") == "dark"
-        color = settings.get("dark_theme_text") if is_dark else settings.get("light_theme_text")
+        color = ThemedIconProvider._color(settings)
+        dpr = ThemedIconProvider._device_pixel_ratio()
+        key = (name, color, size.width(), size.height(), dpr)
+        cached = ThemedIconProvider._cache.get(key)
+        if cached is not None:
+            return cached
         data = svg.replace("{c}", color)
         renderer = QSvgRenderer(bytearray(data, encoding="utf-8"))
-        pm = QPixmap(size)
+        pm = QPixmap(round(size.width() * dpr), round(size.height() * dpr))
+        pm.setDevicePixelRatio(dpr)
         pm.fill(Qt.GlobalColor.transparent)
         p = QPainter(pm)
-        renderer.render(p)
+        renderer.render(p, QRectF(0, 0, size.width(), size.height()))
         p.end()
-        return QIcon(pm)
+        icon = QIcon(pm)
+        ThemedIconProvider._cache[key] = icon
+        return icon
+
+    @staticmethod
+    def prerender(settings: dict, size: QSize = QSize(18, 18)):
+        """Заранее рендерит весь набор иконок для текущей темы."""
+        for name in ThemedIconProvider.SVG:
+            ThemedIconProvider.icon(name, settings, size)
+
+    @staticmethod
+    def invalidate(settings: dict = None):
+        """Сбрасывает кеш; если переданы настройки — оставляет иконки их цвета."""
+        if settings is None:
+            ThemedIconProvider._cache.clear()
+            return
+        color = ThemedIconProvider._color(settings)
+        for key in [k for k in ThemedIconProvider._cache if k[1] != color]:
+            del ThemedIconProvider._cache[key]
 
 # --- Точка входа ---
 if __name__ == "__main__":
@@ -0,0 +1,79 @@
+"""
+Замер стоимости надежной записи (write_json_atomic: временный файл, fsync, rename, .prev)
+и того, сколько из нее достается GUI-потоку, когда запись идет через StoreWriter.
+
+    python tests/bench_durable_writes.py [число заметок]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import main
+
+ROUNDS = 20
+
+
+def make_data(notes):
+    return {
+        "task_lists": {"Default": [{"text": f"задача {i}", "completed": i % 2 == 0} for i in range(50)]},
+        "active_task_list": "Default",
+        "notes": [{"timestamp": f"2024-01-01 00:00:{i:06d}", "text": f"Заметка {i}\n" + "текст " * 60, "pinned": False}
+                  for i in range(notes)],
+        "note_tree": [],
+    }
+
+
+def ms(seconds):
+    return f"{seconds * 1000:8.2f} ms"
+
+
+def bench(label, path, data):
+    # Как раньше: запись целиком в GUI-потоке
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        main.write_json_atomic(path, data)
+    direct = (time.perf_counter() - start) / ROUNDS
+
+    # Как сейчас: GUI-поток только ставит задание в очередь
+    writer = main.StoreWriter()
+    submit = 0.0
+    start_all = time.perf_counter()
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        writer.submit(lambda: main.write_json_atomic(path, data))
+        submit += time.perf_counter() - start
+    writer.flush()
+    drained = (time.perf_counter() - start_all) / ROUNDS
+    writer.close()
+    size = os.path.getsize(path)
+    print(f"{label:<22}{size / 1024:9.1f} KB  в GUI-потоке: {ms(direct)}  через StoreWriter: {ms(submit / ROUNDS)}"
+          f"  (фоном {ms(drained)})")
+
+
+def main_bench():
+    notes = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with tempfile.TemporaryDirectory() as work:
+        bench("настройки", os.path.join(work, "settings.json"), dict(main.DEFAULT_SETTINGS))
+        bench(f"data.json ({notes} заметок)", os.path.join(work, "data.json"), make_data(notes))
+        store = main.DataJournal(os.path.join(work, "d.json"), os.path.join(work, "d.journal"))
+        data = make_data(notes)
+        store.write_snapshot(data)
+        # Типичное сохранение: изменилась одна заметка, GUI-поток только считает разницу
+        prepare = 0.0
+        writer = main.StoreWriter()
+        for i in range(ROUNDS):
+            data["notes"][i]["text"] += "!"
+            start = time.perf_counter()
+            records = store.prepare(data)
+            writer.submit(lambda records=records: store.write_pending(records))
+            prepare += time.perf_counter() - start
+        writer.close()
+        print(f"{'журнал, 1 заметка':<22}{'':12}  prepare + submit в GUI-потоке: {ms(prepare / ROUNDS)}")
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,75 @@
+"""
+Плейлист на 20 тыс. треков: добавление, повторное добавление дублей,
+переключение треков, удаление вразброс и перенос блока через контроллер
+с открытым виджетом плеера.
+
+    python tests/bench_playlist.py [число треков]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import main
+from PyQt6.QtCore import Qt
+from PyQt6.QtWidgets import QApplication
+
+
+def timed(label, action):
+    start = time.perf_counter()
+    result = action()
+    print(f"{label:<28} {(time.perf_counter() - start) * 1000:10.1f} ms")
+    return result
+
+
+def main_bench():
+    app = QApplication.instance() or QApplication([])
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+
+    with tempfile.TemporaryDirectory() as work:
+        library = os.path.join(work, "lib")
+        os.makedirs(library)
+        files = []
+        for i in range(count):
+            path = os.path.join(library, f"{i:05d}.mp3")
+            open(path, "w").close()
+            files.append(path)
+
+        # Файлы плеера — во временном каталоге, а не рядом с программой
+        controller = main.GlobalAudioController(base_dir=work)
+        controller.add_playlist("Bench")
+        controller.set_current_playlist("Bench")
+        widget = main.GlobalAudioWidget(controller, main.LocalizationManager(base_path=work))
+        widget.resize(300, 500)
+        widget.show()
+        app.processEvents()
+
+        timed(f"добавление {count}", lambda: controller.add_files(files))
+        timed("повтор 1000 дублей", lambda: controller.add_files(files[:1000]))
+        controller.play_index(count // 2)
+        timed("200 x next()", lambda: [controller.next() for _ in range(200)])
+        timed("удаление вразброс", lambda: controller.remove_indexes(list(range(0, count, 1000))))
+        timed("перенос 10 треков", lambda: controller.move_tracks(0, 10, len(controller.tracks()) * 3 // 4))
+
+        tracks = controller.tracks()
+        assert widget.model._tracks.paths() == tracks.paths()
+        assert widget.model.index(controller.index).data(Qt.ItemDataRole.UserRole) == tracks[controller.index]
+
+        # Теги читаются в фоне: дождаться их, пока временный каталог еще существует
+        def wait_metadata():
+            deadline = time.time() + 60
+            while len(controller.metadata._entries) < len(tracks) and time.time() < deadline:
+                app.processEvents()
+        timed("дочитывание тегов", wait_metadata)
+
+        controller.stop()
+        controller._persist_timer.stop()
+        controller.metadata._save_timer.stop()
+        app.processEvents()
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,65 @@
+"""
+Набор текста в документ на 200 тыс. слов: сколько стоит одно нажатие клавиши
+с инкрементальным WordCounter и с полным пересчетом len(toPlainText().split()).
+
+    python tests/bench_word_counter.py [число слов]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import main
+from PyQt6.QtGui import QTextCursor
+from PyQt6.QtWidgets import QApplication, QTextEdit
+
+TYPED = "быстрый набор текста в середине длинной заметки\n" * 4
+WORDS_PER_LINE = 12
+
+
+def make_editor(words):
+    line = " ".join(["слово"] * WORDS_PER_LINE)
+    editor = QTextEdit()
+    editor.setPlainText("\n".join([line] * (words // WORDS_PER_LINE)))
+    return editor
+
+
+def type_text(editor, on_key):
+    cursor = QTextCursor(editor.document())
+    cursor.setPosition(editor.document().characterCount() // 2)
+    worst = 0.0
+    start_all = time.perf_counter()
+    for ch in TYPED:
+        start = time.perf_counter()
+        cursor.insertText(ch)
+        on_key()
+        worst = max(worst, time.perf_counter() - start)
+    return (time.perf_counter() - start_all) / len(TYPED), worst
+
+
+def report(label, result):
+    mean, worst = result
+    print(f"{label:<28} среднее {mean * 1000:8.3f} ms   худшее {worst * 1000:8.3f} ms")
+
+
+def main_bench():
+    app = QApplication.instance() or QApplication([])
+    words = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+
+    editor = make_editor(words)
+    report("только вставка", type_text(editor, lambda: None))
+
+    editor = make_editor(words)
+    counter = main.WordCounter(editor.document())
+    report("WordCounter", type_text(editor, lambda: None))
+    assert counter.total == len(editor.document().toPlainText().split())
+
+    editor = make_editor(words)
+    report("полный пересчет", type_text(editor, lambda: len(editor.document().toPlainText().split())))
+    app.processEvents()
+
+
+if __name__ == "__main__":
+    main_bench()
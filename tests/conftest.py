@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+# Виджеты создаются без дисплея; main.py лежит в корне репозитория
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def qapp():
+    from PyQt6.QtWidgets import QApplication
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def loc(qapp, tmp_path):
+    # Файлы локализации создаются во временном каталоге, а не рядом с main.py
+    main = pytest.importorskip("main", exc_type=ImportError)
+    return main.LocalizationManager(base_path=str(tmp_path))
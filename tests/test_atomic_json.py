@@ -0,0 +1,68 @@
+import json
+import os
+
+import pytest
+
+# QtMultimedia без системных аудиобиблиотек не импортируется — тогда тесты пропускаются
+main = pytest.importorskip("main", exc_type=ImportError)
+
+OLD = {"version": 1, "notes": ["первая"]}
+NEW = {"version": 2, "notes": ["первая", "вторая"]}
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / "data.json")
+    main.write_json_atomic(path, OLD)
+    main.write_json_atomic(path, NEW)
+    return path
+
+
+def test_write_keeps_previous_generation_and_footer(path):
+    assert main.read_json_file(path) == NEW
+    assert main.read_json_file(path + main.PREVIOUS_SUFFIX) == OLD
+    with open(path, encoding="utf-8") as f:
+        assert f.read().rstrip("\n").rsplit("\n", 1)[1].startswith(main.CHECKSUM_FOOTER)
+    assert [name for name in os.listdir(os.path.dirname(path)) if name.endswith(".tmp")] == []
+
+
+def test_corrupted_body_falls_back_to_previous(path):
+    with open(path, "r+b") as f:
+        raw = f.read()
+        f.seek(0)
+        f.write(raw.replace("вторая".encode(), "ВТОРАЯ".encode()))  # JSON цел, сумма — нет
+    with pytest.raises(json.JSONDecodeError):
+        main.read_json_file(path)
+    assert main.read_json_recovering(path) == OLD
+    # Поврежденный файл отложен, на его месте — восстановленное поколение
+    directory = os.path.dirname(path)
+    assert [name for name in os.listdir(directory) if ".corrupt-" in name]
+    assert main.read_json_file(path) == OLD
+
+
+def test_missing_file_after_interrupted_rename_recovers_previous(path):
+    # Сбой между os.replace(path, .prev) и os.replace(tmp, path)
+    os.remove(path)
+    assert main.read_json_recovering(path) == OLD
+    assert main.read_json_file(path) == OLD
+
+
+def test_missing_file_without_previous_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        main.read_json_recovering(str(tmp_path / "absent.json"))
+
+
+def test_file_without_footer_still_loads(tmp_path):
+    path = str(tmp_path / "old.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(OLD, f, ensure_ascii=False, indent=4)
+    assert main.read_json_file(path) == OLD
+    assert main.read_json_recovering(path) == OLD
+
+
+def test_footer_survives_windows_line_endings(path):
+    with open(path, "rb") as f:
+        raw = f.read()
+    with open(path, "wb") as f:
+        f.write(raw.replace(b"\n", b"\r\n"))
+    assert main.read_json_file(path) == NEW
@@ -0,0 +1,160 @@
+import os
+import struct
+import wave
+
+import pytest
+
+# QtMultimedia без системных аудиобиблиотек не импортируется — тогда тесты пропускаются
+main = pytest.importorskip("main", exc_type=ImportError)
+
+MP3_FRAME = b"\xff\xfb\x90\x00"  # MPEG-1 Layer III, 128 kbps, 44100 Hz, стерео
+MP3_FRAME_LEN = 417
+
+
+def le32(n):
+    return struct.pack("<I", n)
+
+
+def syncsafe(n):
+    return bytes([(n >> 21) & 0x7F, (n >> 14) & 0x7F, (n >> 7) & 0x7F, n & 0x7F])
+
+
+def id3v2(frames, major=3):
+    body = b""
+    for frame_id, text, encoding in frames:
+        codec = {0: "latin-1", 1: "utf-16", 3: "utf-8"}[encoding]
+        payload = bytes([encoding]) + text.encode(codec)
+        size = syncsafe(len(payload)) if major == 4 else struct.pack(">I", len(payload))
+        body += frame_id + size + b"\0\0" + payload
+    body += b"\0" * 32  # заполнение
+    return b"ID3" + bytes([major, 0, 0]) + syncsafe(len(body)) + body
+
+
+def id3v1(title, artist):
+    return b"TAG" + title.encode().ljust(30, b"\0") + artist.encode().ljust(30, b"\0") + b"\0" * 65
+
+
+def vorbis_comment(pairs):
+    data = le32(3) + b"abc" + le32(len(pairs))
+    for pair in pairs:
+        data += le32(len(pair)) + pair
+    return data
+
+
+def atom(kind, body):
+    return struct.pack(">I", 8 + len(body)) + kind + body
+
+
+def probe(path):
+    return main.probe_audio_file(str(path), os.path.getsize(path))
+
+
+def test_mp3_id3v23_cbr(tmp_path):
+    path = tmp_path / "a.mp3"
+    tag = id3v2([(b"TIT2", "Песня", 1), (b"TPE1", "Band", 0)])
+    path.write_bytes(tag + (MP3_FRAME + b"\0" * (MP3_FRAME_LEN - 4)) * 100)
+    info = probe(path)
+    assert info["title"] == "Песня" and info["artist"] == "Band"
+    assert info["duration_ms"] == 100 * MP3_FRAME_LEN * 8 * 1000 // 128000
+
+
+def test_mp3_id3v24_xing(tmp_path):
+    path = tmp_path / "b.mp3"
+    xing = b"Xing" + struct.pack(">II", 1, 1000)
+    frame = MP3_FRAME + b"\0" * 32 + xing
+    path.write_bytes(id3v2([(b"TIT2", "Длинное название", 3)], major=4) + frame.ljust(MP3_FRAME_LEN, b"\0") * 3)
+    info = probe(path)
+    assert info["title"] == "Длинное название"
+    assert info["duration_ms"] == 1000 * 1152 * 1000 // 44100
+
+
+def test_mp3_id3v1_and_tlen(tmp_path):
+    path = tmp_path / "c.mp3"
+    path.write_bytes(MP3_FRAME + b"\0" * (MP3_FRAME_LEN * 10 - 4) + id3v1("Old Title", "Old Artist"))
+    info = probe(path)
+    assert info["title"] == "Old Title" and info["artist"] == "Old Artist"
+    assert info["duration_ms"] == MP3_FRAME_LEN * 10 * 8 * 1000 // 128000
+
+    tlen = tmp_path / "d.mp3"
+    tlen.write_bytes(id3v2([(b"TLEN", "183000", 0)]))  # кадров нет — длительность из тега
+    assert probe(tlen) == {"duration_ms": 183000}
+
+
+def test_flac(tmp_path):
+    rate, total = 44100, 441000
+    info = bytearray(34)
+    info[10], info[11], info[12] = (rate >> 12) & 0xFF, (rate >> 4) & 0xFF, ((rate & 0xF) << 4) | 2
+    info[13] = (15 << 4) | ((total >> 32) & 0xF)
+    info[14:18] = (total & 0xFFFFFFFF).to_bytes(4, "big")
+    comment = vorbis_comment([b"TITLE=Flac Song", b"ARTIST=Flac Band"])
+    path = tmp_path / "a.flac"
+    path.write_bytes(b"fLaC" + b"\0" + (34).to_bytes(3, "big") + bytes(info)
+                     + b"\x84" + len(comment).to_bytes(3, "big") + comment + b"\0" * 100)
+    assert probe(path) == {"title": "Flac Song", "artist": "Flac Band", "duration_ms": 10000}
+
+
+def test_ogg_vorbis(tmp_path):
+    def page(granule, payload):
+        return b"OggS\0\0" + struct.pack("<Q", granule) + b"\0" * 12 + bytes([1, len(payload)]) + payload
+    ident = b"\x01vorbis" + le32(0) + bytes([2]) + le32(44100) + b"\0" * 13
+    comment = b"\x03vorbis" + vorbis_comment([b"title=Ogg Song", b"ARTIST=Ogg Band"])
+    path = tmp_path / "a.ogg"
+    path.write_bytes(page(0, ident) + page(0, comment) + b"x" * 5000 + page(44100 * 3, b"zz"))
+    assert probe(path) == {"title": "Ogg Song", "artist": "Ogg Band", "duration_ms": 3000}
+
+
+def test_wav_with_list_info(tmp_path):
+    path = tmp_path / "a.wav"
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(8000)
+        w.writeframes(b"\0\0" * 16000)
+    data = path.read_bytes()
+    info = b"INFO" + b"INAM" + le32(5) + b"Song\0" + b"\0" + b"IART" + le32(4) + b"Band"
+    path.write_bytes(data[:4] + le32(len(data) + len(info)) + data[8:] + b"LIST" + le32(len(info)) + info)
+    assert probe(path) == {"title": "Song", "artist": "Band", "duration_ms": 2000}
+
+
+def test_m4a(tmp_path):
+    mvhd = atom(b"mvhd", b"\0" * 12 + struct.pack(">II", 1000, 4500) + b"\0" * 80)
+    def item(kind, value):
+        return atom(kind, atom(b"data", b"\0\0\0\x01" + b"\0" * 4 + value.encode()))
+    ilst = atom(b"ilst", item(b"\xa9nam", "M4a Song") + item(b"\xa9ART", "M4a Band"))
+    moov = atom(b"moov", mvhd + atom(b"udta", atom(b"meta", b"\0" * 4 + ilst)))
+    path = tmp_path / "a.m4a"
+    path.write_bytes(atom(b"ftyp", b"M4A \0\0\0\0") + atom(b"mdat", b"\0" * 10000) + moov)
+    assert probe(path) == {"title": "M4a Song", "artist": "M4a Band", "duration_ms": 4500}
+
+
+@pytest.mark.parametrize("name, data", [
+    ("cut.flac", b"fLaC\0\0\0\x22\0\0"),
+    ("cut.wav", b"RIFF\0\0\0\0WAVEfmt \x10\0\0\0"),
+    ("cut.m4a", atom(b"moov", b"\0\0\0\x30mvhd")),
+    ("junk.mp3", b"\xff" * 3000),
+    ("empty.ogg", b""),
+])
+def test_truncated_files_do_not_raise(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    assert isinstance(probe(path), dict)
+
+
+def test_unknown_extension(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("not audio")
+    assert probe(path) == {}
+
+
+def test_format_duration():
+    assert main.format_duration(0) == "0:00"
+    assert main.format_duration(61_500) == "1:01"
+    assert main.format_duration(3_725_000) == "1:02:05"
+
+
+def test_fingerprint_tracks_content(tmp_path):
+    path = tmp_path / "a.mp3"
+    path.write_bytes(b"a" * 300_000)
+    first = main.audio_fingerprint(str(path), 300_000)
+    path.write_bytes(b"a" * 299_999 + b"b")
+    assert main.audio_fingerprint(str(path), 300_000) != first
@@ -0,0 +1,104 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+# QtMultimedia без системных аудиобиблиотек не импортируется — тогда тесты пропускаются
+main = pytest.importorskip("main", exc_type=ImportError)
+
+T0 = datetime(2024, 5, 1, 10, 5, 0)
+
+
+def make_data(tag=""):
+    return {
+        "task_lists": {"Default": [{"text": "задача", "completed": False}]},
+        "active_task_list": "Default",
+        "notes": [{"timestamp": f"2024-01-0{i} 10:00:00", "text": f"Заметка {i}{tag}", "pinned": False}
+                  for i in range(1, 4)],
+        "note_tree": [],
+    }
+
+
+def objects(store):
+    return {os.path.join(d, f) for d, _, files in os.walk(store.objects_dir) for f in files}
+
+
+def manifests(store):
+    return sorted(name for name in os.listdir(store.root) if name.startswith(store.MANIFEST_PREFIX))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return main.BackupStore(str(tmp_path / "backups"))
+
+
+def test_unchanged_snapshot_writes_nothing_new(store):
+    data = make_data()
+    first = store.create(data, now=T0)
+    before = objects(store)
+    assert len(before) == 5  # три заметки, задачи, дерево
+    assert store.create(make_data(), now=T0 + timedelta(hours=2)) == first
+    assert store.create(make_data(), now=T0 + timedelta(hours=3), only_if_changed=True) is None
+    assert objects(store) == before
+    assert manifests(store) == [os.path.basename(first)]
+    # Правка одной заметки добавляет один фрагмент, остальные переиспользуются
+    data["notes"][1]["text"] += "!"
+    second = store.create(data, now=T0 + timedelta(hours=4))
+    assert second != first
+    assert len(objects(store)) == len(before) + 1
+    assert store.load(second) == data
+    assert store.load(first) == make_data()
+
+
+def test_prune_keeps_newest_and_collects_unreferenced_objects(store):
+    older = store.create(make_data(" a"), now=T0)
+    same_hour = store.create(make_data(" b"), now=T0 + timedelta(minutes=20))
+    # В пределах часа остается только более свежий снимок
+    assert store.list_backups() == [same_hour, older]
+    newest = store.create(make_data(" c"), now=T0 + timedelta(hours=2))
+    assert store.list_backups() == [newest, same_hour]
+    assert not os.path.exists(older)
+    # Через год старше любой корзины хранения: остается только последний снимок
+    removed = store.prune(T0 + timedelta(days=400))
+    assert removed == 1
+    assert store.list_backups() == [newest]
+    assert len(objects(store)) == 5
+    assert store.load(newest) == make_data(" c")
+    assert list(main.read_json_file(store.index_path)) == [os.path.basename(newest)]
+
+
+def test_deleted_index_is_rebuilt_from_manifests(store):
+    first = store.create(make_data(" a"), now=T0)
+    second = store.create(make_data(" b"), now=T0 + timedelta(hours=3))
+    os.remove(store.index_path)
+    reopened = main.BackupStore(store.root)
+    entries = reopened.entries()
+    assert [path for path, _ in entries] == [second, first]
+    assert [entry["notes"] for _, entry in entries] == [3, 3]
+    assert entries[0][1]["time"] == T0 + timedelta(hours=3)
+    assert os.path.exists(store.index_path)
+    assert reopened.load(first) == make_data(" a")
+
+
+def test_legacy_bak_files_are_listed_and_restorable(store):
+    os.makedirs(store.root)
+    legacy = os.path.join(store.root, "data_20240101_120000.bak")
+    with open(legacy, "w", encoding="utf-8") as f:
+        json.dump(make_data(" old"), f, ensure_ascii=False)
+    reopened = main.BackupStore(store.root)
+    assert reopened.list_backups() == [legacy]
+    assert reopened.load(legacy) == make_data(" old")
+    snapshot = reopened.create(make_data(), now=T0 + timedelta(days=400))
+    assert reopened.list_backups() == [snapshot, legacy]
+    assert reopened.prune(T0 + timedelta(days=800)) == 0
+    assert os.path.exists(legacy)
+
+
+def test_delete_forgets_snapshot_and_its_objects(store):
+    first = store.create(make_data(" a"), now=T0)
+    second = store.create(make_data(" b"), now=T0 + timedelta(hours=3))
+    store.delete(first)
+    assert store.list_backups() == [second]
+    assert not os.path.exists(first)
+    assert len(objects(store)) == 5
@@ -0,0 +1,120 @@
+import copy
+
+import pytest
+
+# QtMultimedia без системных аудиобиблиотек не импортируется — тогда тесты пропускаются
+main = pytest.importorskip("main", exc_type=ImportError)
+
+
+def make_data():
+    return {
+        "task_lists": {"Default": [{"text": "купить хлеб", "completed": False}], "Работа": []},
+        "active_task_list": "Default",
+        "notes": [{"timestamp": f"2024-01-0{i} 10:00:00", "text": f"Заметка {i}\n#тег{i}", "pinned": i == 1}
+                  for i in range(1, 5)],
+        "note_tree": [{"type": "note", "id": "2024-01-01 10:00:00"}],
+    }
+
+
+def open_store(tmp_path):
+    return main.DataJournal(str(tmp_path / "data.json"), str(tmp_path / "data.journal"))
+
+
+def notes_by_ts(data):
+    return {n["timestamp"]: dict(n) for n in data["notes"]}
+
+
+def assert_same_state(loaded, data):
+    assert notes_by_ts(loaded) == notes_by_ts(data)
+    assert loaded["task_lists"] == data["task_lists"]
+    assert loaded["active_task_list"] == data["active_task_list"]
+    assert loaded["note_tree"] == data["note_tree"]
+
+
+def edit(data):
+    data["notes"][0]["text"] += "\nдописано"
+    del data["notes"][2]
+    data["notes"].append({"timestamp": "2024-02-01 09:00:00", "text": "новая", "pinned": False})
+    data["task_lists"]["Default"][0]["completed"] = True
+    data["active_task_list"] = "Работа"
+    data["note_tree"] = [{"type": "folder", "name": "Папка", "children": data["note_tree"]}]
+
+
+@pytest.fixture
+def journal(tmp_path):
+    store = open_store(tmp_path)
+    data = make_data()
+    store.write_snapshot(data)
+    return store, data
+
+
+def test_changes_survive_reload(tmp_path, journal):
+    store, data = journal
+    edit(data)
+    records = store.prepare(data)
+    assert sorted(r["op"] for r in records) == ["note", "note", "note_del", "tasks", "tree"]
+    store.write_pending(records)
+    assert store.prepare(data) == []  # состояние в памяти уже совпадает с data
+    assert_same_state(open_store(tmp_path).load(), data)
+
+
+def test_unchanged_save_writes_nothing(tmp_path, journal):
+    store, data = journal
+    assert store.commit(copy.deepcopy(data)) == 0
+    assert not (tmp_path / "data.journal").exists()
+
+
+def test_torn_last_record_keeps_earlier_ones(tmp_path, journal):
+    store, data = journal
+    data["notes"][0]["text"] = "первая правка"
+    store.commit(data)
+    saved = copy.deepcopy(data)
+    data["notes"][1]["text"] = "вторая правка"
+    store.commit(data)
+    # Сбой посреди дозаписи: от последней строки журнала остался обрывок
+    path = tmp_path / "data.journal"
+    raw = path.read_bytes()
+    last = raw.rstrip(b"\n").rfind(b"\n") + 1
+    path.write_bytes(raw[:last + (len(raw) - last) // 2])
+    assert_same_state(open_store(tmp_path).load(), saved)
+
+
+def test_write_failure_keeps_records_for_retry(tmp_path, journal, monkeypatch):
+    store, data = journal
+    data["notes"][0]["text"] = "не записалось с первого раза"
+    records = store.prepare(data)
+    def failing_write(batch):
+        raise OSError("диск переполнен")
+    monkeypatch.setattr(store, "write_records", failing_write)
+    with pytest.raises(OSError):
+        store.write_pending(records)
+    assert store.has_unwritten()
+    monkeypatch.undo()
+    store.write_pending([])
+    assert not store.has_unwritten()
+    assert_same_state(open_store(tmp_path).load(), data)
+
+
+def test_compaction_with_queued_records_replays_idempotently(tmp_path, journal):
+    store, data = journal
+    data["notes"][0]["text"] = "записано"
+    store.commit(data)
+    # Запись подготовлена, но еще стоит в очереди StoreWriter, а журнал уже сворачивается
+    edit(data)
+    queued = store.prepare(data)
+    store.compact()
+    assert not (tmp_path / "data.journal").exists()
+    # Снимок уже содержит queued; их дозапись поверх снимка ничего не меняет
+    store.write_pending(queued)
+    assert (tmp_path / "data.journal").exists()
+    assert_same_state(open_store(tmp_path).load(), data)
+
+
+def test_journal_compacts_after_record_limit(tmp_path, journal, monkeypatch):
+    store, data = journal
+    monkeypatch.setattr(main, "JOURNAL_COMPACT_RECORDS", 5)
+    for i in range(12):
+        data["notes"][i % 4]["text"] = f"правка {i}"
+        store.commit(data)
+    assert store._records < 5
+    assert_same_state(open_store(tmp_path).load(), data)
@@ -0,0 +1,88 @@
+import pytest
+
+# QtMultimedia без системных аудиобиблиотек не импортируется — тогда тесты пропускаются
+main = pytest.importorskip("main", exc_type=ImportError)
+
+from PyQt6.QtGui import QTextCursor
+
+SAVED = "Заметка\nс текстом"
+
+
+class FakeDataManager:
+    """Минимум TriggerButton, который нужен панели заметок."""
+    def __init__(self, loc):
+        self.loc_manager = loc
+        self.settings = dict(main.DEFAULT_SETTINGS)
+
+    def get_settings(self):
+        return self.settings
+
+    def main_popup_on_data_changed(self):
+        pass
+
+    def switch_to_window_mode(self):
+        pass
+
+    def save_app_data(self):
+        pass
+
+
+@pytest.fixture
+def panel(loc, monkeypatch):
+    panel = main.NotesPanel(FakeDataManager(loc))
+    panel.notes_editor.setPlainText(SAVED)
+    panel._mark_saved(SAVED)
+    panel.on_editor_text_changed()
+    panel.saves = []
+    monkeypatch.setattr(panel, "save_current_note", lambda: panel.saves.append(panel.notes_editor.toPlainText()))
+    yield panel
+    panel.deleteLater()
+
+
+def type_text(panel, text):
+    cursor = panel.notes_editor.textCursor()
+    cursor.movePosition(QTextCursor.MoveOperation.End)
+    for ch in text:
+        cursor.insertText(ch)  # по символу, как при наборе: каждый шаг — своя правка в стеке отмены
+
+
+def erase(panel, count):
+    cursor = panel.notes_editor.textCursor()
+    cursor.movePosition(QTextCursor.MoveOperation.End)
+    for _ in range(count):
+        cursor.deletePreviousChar()
+
+
+def test_saved_note_is_clean(panel):
+    assert not panel.is_dirty
+    panel.save_if_dirty()
+    assert panel.saves == []
+
+
+def test_undo_back_to_saved_text_clears_dirty(panel):
+    type_text(panel, " и еще")
+    assert panel.is_dirty
+    document = panel.notes_editor.document()
+    while document.isUndoAvailable() and panel.notes_editor.toPlainText() != SAVED:
+        document.undo()
+    assert panel.notes_editor.toPlainText() == SAVED
+    assert not panel.is_dirty
+    panel.save_if_dirty()
+    assert panel.saves == []
+
+
+def test_retyping_identical_text_does_not_save(panel):
+    erase(panel, len("текстом"))
+    type_text(panel, "текстом")
+    assert panel.notes_editor.toPlainText() == SAVED
+    assert panel.is_dirty  # документ не знает, что текст тот же
+    panel.save_if_dirty()
+    assert panel.saves == []
+    assert not panel.is_dirty
+    assert not panel.notes_editor.document().isModified()
+
+
+def test_real_change_is_saved(panel):
+    type_text(panel, "!")
+    panel.save_if_dirty()
+    assert panel.saves == [SAVED + "!"]
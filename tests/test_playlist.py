@@ -0,0 +1,189 @@
+import itertools
+import json
+import os
+import random
+
+import pytest
+
+# QtMultimedia без системных аудиобиблиотек не импортируется — тогда тесты пропускаются
+main = pytest.importorskip("main", exc_type=ImportError)
+
+
+def moved(items, row, count, dest):
+    """Эталон beginMoveRows: блок встает перед элементом, который был на позиции dest."""
+    block = items[row:row + count]
+    before = items[:dest]
+    after = items[dest:]
+    before = [x for x in before if x not in block]
+    after = [x for x in after if x not in block]
+    return before + block + after
+
+
+@pytest.mark.parametrize("row, count, dest", [
+    (row, count, dest)
+    for row, count, dest in itertools.product(range(6), range(1, 4), range(7))
+    if row + count <= 6 and not row <= dest <= row + count
+])
+def test_move_list_block_matches_move_rows(row, count, dest):
+    items = list("abcdef")
+    expected = moved(items, row, count, dest)
+    start = main.move_list_block(items, row, count, dest)
+    assert items == expected
+    assert items[start:start + count] == list("abcdef")[row:row + count]
+
+
+@pytest.fixture
+def controller(qapp, tmp_path):
+    # Файлы плеера — во временном каталоге: контроллер не читает и не пишет ничего рядом с main.py
+    ctrl = main.GlobalAudioController(base_dir=str(tmp_path))
+    ctrl.add_playlist("Test")
+    ctrl.set_current_playlist("Test")
+    paths = [tmp_path / f"t{i}.mp3" for i in range(6)]
+    for path in paths:
+        path.write_bytes(b"")
+    ctrl.add_files([str(path) for path in paths])
+    yield ctrl
+    ctrl._persist_timer.stop()
+    ctrl.metadata._save_timer.stop()
+    ctrl.deleteLater()
+
+
+def test_controller_keeps_its_files_in_base_dir(qapp, tmp_path):
+    track = str(tmp_path / "song.mp3")
+    main.write_json_atomic(str(tmp_path / "audio_playlists.json"),
+                           {"playlists": {"Мой": [track]}, "order": ["Мой"], "current": "Мой"})
+    ctrl = main.GlobalAudioController(base_dir=str(tmp_path))
+    try:
+        assert ctrl.playlist_order == ["Мой"]  # zen_audio в base_dir нет — плейлист Zen не создается
+        assert ctrl.current_playlist == "Мой" and ctrl.get_tracks() == [track]
+        assert os.path.dirname(ctrl._playback_file) == str(tmp_path)
+        assert os.path.dirname(ctrl.metadata.path) == str(tmp_path)
+    finally:
+        ctrl._persist_timer.stop()
+        ctrl.metadata._save_timer.stop()
+        ctrl.deleteLater()
+
+
+def test_move_tracks_keeps_current_track(controller):
+    original = controller.get_tracks()
+    assert len(original) == 6
+    for row, count, dest in itertools.product(range(6), range(1, 4), range(7)):
+        if row + count > 6 or row <= dest <= row + count:
+            continue
+        for current in range(6):
+            controller.set_order(original)
+            controller.index = current
+            playing = original[current]
+            moves = []
+            controller.tracks_moved.connect(lambda *args: moves.append(args))
+            assert controller.move_tracks(row, count, dest)
+            controller.tracks_moved.disconnect()
+            assert controller.get_tracks() == moved(original, row, count, dest)
+            assert controller.tracks()[controller.index] == playing
+            assert moves == [(row, count, dest)]
+
+
+def test_move_tracks_rejects_invalid_ranges(controller):
+    before = controller.get_tracks()
+    assert not controller.move_tracks(0, 0, 3)
+    assert not controller.move_tracks(-1, 1, 3)
+    assert not controller.move_tracks(4, 3, 0)
+    assert not controller.move_tracks(0, 1, 7)
+    assert not controller.move_tracks(2, 2, 3)  # перенос внутрь самого блока
+    assert controller.get_tracks() == before
+
+
+def test_playlist_ignores_duplicates_and_empty_paths():
+    playlist = main.Playlist(["a", "b", "", "a", "c"])
+    assert playlist.paths() == ["a", "b", "c"]
+    assert len(playlist) == 3 and "b" in playlist and "z" not in playlist
+    assert playlist.index_of("c") == 2 and playlist.index_of("z") == -1
+    assert playlist.extend(["c", "d", "d", "e"]) == (3, ["d", "e"])
+    assert playlist.paths() == ["a", "b", "c", "d", "e"]
+
+
+def test_playlist_remove_rows_returns_descending_valid_rows():
+    playlist = main.Playlist("abcdef")
+    assert playlist.remove_rows([4, 0, 4, 99, -1]) == [4, 0]
+    assert playlist.paths() == list("bcdf")
+    assert [playlist.index_of(p) for p in "bcdf"] == [0, 1, 2, 3]
+    assert "a" not in playlist and "e" not in playlist
+    assert playlist.remove_rows([]) == []
+
+
+def test_playlist_move_and_replace():
+    playlist = main.Playlist("abcdef")
+    assert playlist.move(0, 2, 5) == 3
+    assert playlist.paths() == list("cdeabf")
+    assert all(playlist.index_of(p) == i for i, p in enumerate(playlist))
+    playlist.replace(["x", "y", "x"])
+    assert playlist.paths() == ["x", "y"] and "a" not in playlist
+
+
+def test_playlist_random_operations_match_list():
+    rng = random.Random(24)
+    reference = [f"p{i}" for i in range(50)]
+    playlist = main.Playlist(reference)
+    for _ in range(3000):
+        op = rng.random()
+        if op < 0.3 and reference:
+            rows = rng.sample(range(len(reference)), min(len(reference), rng.randint(1, 5)))
+            playlist.remove_rows(rows)
+            reference = [p for i, p in enumerate(reference) if i not in set(rows)]
+        elif op < 0.6 and reference:
+            row = rng.randrange(len(reference))
+            count = rng.randint(1, len(reference) - row)
+            targets = [d for d in range(len(reference) + 1) if not row <= d <= row + count]
+            if not targets:
+                continue
+            dest = rng.choice(targets)
+            reference = moved(reference, row, count, dest)
+            playlist.move(row, count, dest)
+        else:
+            new = [f"q{rng.randint(0, 500)}" for _ in range(3)]
+            playlist.extend(new)
+            for path in new:
+                if path not in reference:
+                    reference.append(path)
+        assert playlist.paths() == reference
+        assert all(playlist.index_of(p) == i for i, p in enumerate(reference))
+
+
+def test_pack_playlists_stores_each_folder_once():
+    music, other = os.path.join("music", "album"), os.path.join("other")
+    playlists = {
+        "A": main.Playlist([os.path.join(music, "1.mp3"), os.path.join(other, "x.ogg"), os.path.join(music, "2.mp3")]),
+        "B": main.Playlist([os.path.join(other, "y.flac")]),
+        "Empty": main.Playlist(),
+    }
+    packed = main.pack_playlists(playlists)
+    assert packed["version"] == 2
+    assert packed["dirs"] == [music, other]
+    assert packed["playlists"]["A"] == [[0, "1.mp3"], [1, "x.ogg"], [0, "2.mp3"]]
+    assert packed["playlists"]["B"] == [[1, "y.flac"]]
+    assert packed["playlists"]["Empty"] == []
+    # Формат переживает JSON без потерь
+    unpacked = main.unpack_playlists(json.loads(json.dumps(packed)))
+    assert list(unpacked) == ["A", "B", "Empty"]
+    assert all(unpacked[name].paths() == playlists[name].paths() for name in playlists)
+    assert all(isinstance(playlist, main.Playlist) for playlist in unpacked.values())
+
+
+def test_unpack_playlists_reads_old_format():
+    data = {"playlists": {"Old": ["/a/1.mp3", "/b/2.mp3", "/a/1.mp3"], "None": []}, "order": ["Old"]}
+    unpacked = main.unpack_playlists(data)
+    assert unpacked["Old"].paths() == ["/a/1.mp3", "/b/2.mp3"]
+    assert unpacked["None"].paths() == []
+    assert main.unpack_playlists({}) == {}
+
+
+def test_controller_flush_writes_packed_playlists(controller):
+    controller.writer = None  # запись сразу, без потока TriggerButton
+    controller.play_index(2)
+    controller.flush()
+    data = main.read_json_file(controller._playlists_file)
+    assert data["version"] == 2 and "Test" in data["order"]
+    assert main.unpack_playlists(data)["Test"].paths() == controller.get_tracks()
+    state = main.read_json_file(controller._playback_file)
+    assert state["playlist"] == "Test" and state["track"] == controller.get_tracks()[2]
+    controller.stop()
@@ -0,0 +1,61 @@
+import random
+
+import pytest
+
+# QtMultimedia без системных аудиобиблиотек не импортируется — тогда тесты пропускаются
+main = pytest.importorskip("main", exc_type=ImportError)
+
+from PyQt6.QtGui import QTextCursor, QTextDocument
+
+WORDS = ["слово", "word", "a", "бб", "x1", "—", "test-case", "ёж"]
+GAPS = [" ", "  ", "\n", "\n\n", "\t", " ", " ", ""]
+
+
+def random_text(rng, pieces):
+    return "".join(rng.choice(WORDS) + rng.choice(GAPS) for _ in range(pieces))
+
+
+def expected(doc):
+    return len(doc.toPlainText().split())
+
+
+def test_counts_initial_document(qapp):
+    doc = QTextDocument()
+    doc.setPlainText("один два\n\nтри  четыре\tпять\n")
+    counter = main.WordCounter(doc)
+    assert counter.total == expected(doc) == 5
+
+
+def test_random_edits_match_full_recount(qapp):
+    rng = random.Random(1234)
+    doc = QTextDocument()
+    doc.setPlainText(random_text(rng, 300))
+    counter = main.WordCounter(doc)
+    cursor = QTextCursor(doc)
+    for step in range(1500):
+        length = doc.characterCount() - 1
+        action = rng.random()
+        pos = rng.randint(0, length)
+        cursor.setPosition(pos)
+        if action < 0.45:
+            cursor.insertText(random_text(rng, rng.randint(0, 3)) or rng.choice(GAPS[:4]))
+        elif action < 0.75:
+            cursor.setPosition(min(length, pos + rng.randint(1, 40)), QTextCursor.MoveMode.KeepAnchor)
+            cursor.removeSelectedText()
+        elif action < 0.9:
+            cursor.setPosition(min(length, pos + rng.randint(1, 80)), QTextCursor.MoveMode.KeepAnchor)
+            cursor.insertText(random_text(rng, rng.randint(1, 5)))
+        elif action < 0.97:
+            doc.undo() if rng.random() < 0.5 else doc.redo()
+        else:
+            doc.setPlainText(random_text(rng, rng.randint(0, 200)))
+        assert counter.total == expected(doc), f"шаг {step}"
+
+
+def test_changed_signal_reports_total(qapp):
+    doc = QTextDocument()
+    counter = main.WordCounter(doc)
+    seen = []
+    counter.changed.connect(seen.append)
+    QTextCursor(doc).insertText("раз два три")
+    assert seen[-1] == counter.total == 3
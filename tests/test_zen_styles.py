@@ -0,0 +1,62 @@
+import pytest
+
+# QtMultimedia без системных аудиобиблиотек не импортируется — тогда тесты пропускаются
+main = pytest.importorskip("main", exc_type=ImportError)
+
+from PyQt6.QtCore import QObject
+
+
+class FakeDataManager(QObject):
+    """Минимум TriggerButton, который нужен окну дзен-режима."""
+    def __init__(self, settings):
+        super().__init__()
+        self.settings = settings
+
+    def get_settings(self):
+        return self.settings
+
+    def update_settings(self, settings):
+        self.settings.update(settings)
+
+
+@pytest.fixture
+def zen(loc):
+    settings = dict(main.DEFAULT_SETTINGS)
+    window = main.ZenModeWindow("текст", settings, loc, FakeDataManager(settings))
+    window.resize(800, 600)
+    yield window
+    window.close()
+    window.deleteLater()
+
+
+VARIANTS = [
+    {"theme": "light", "zen_font_family": "Candara", "zen_font_size": 16, "zen_editor_opacity": 85},
+    {"theme": "dark", "zen_font_family": "Candara", "zen_font_size": 16, "zen_editor_opacity": 85},
+    {"theme": "dark", "zen_font_family": "Georgia", "zen_font_size": 22, "zen_editor_opacity": 100},
+    {"theme": "light", "zen_font_family": "DejaVu Sans Mono", "zen_font_size": 9, "zen_editor_opacity": 40},
+]
+
+
+def test_stylesheet_length_is_stable_across_settings_changes(zen):
+    lengths = {}
+    for _ in range(5):
+        for n, variant in enumerate(VARIANTS):
+            zen.settings.update(variant)
+            zen.update_background_and_styles()
+            zen.show()  # showEvent снова применяет фон и стили
+            zen.hide()
+            css = zen.styleSheet()
+            assert css.count("QWidget#ZenModeWindow") == 1
+            # Те же настройки — та же длина таблицы, сколько бы раз их ни применяли
+            assert len(css) == lengths.setdefault(n, len(css))
+    assert len(set(lengths.values())) > 1  # варианты действительно меняют таблицу
+
+
+def test_settings_panel_changes_do_not_grow_stylesheet(zen):
+    base = dict(zen.settings)
+    zen.update_zen_settings(dict(base))
+    length = len(zen.styleSheet())
+    for size in (12, 18, 24, base["zen_font_size"]):
+        zen.update_zen_settings({**base, "zen_font_size": size})
+        zen.show()
+    assert len(zen.styleSheet()) == length